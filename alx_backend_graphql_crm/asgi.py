@@ -2,6 +2,8 @@
 ASGI config for alx_backend_graphql_crm project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+GraphQL clients of an ASGI server use /graphql/async, which executes
+operations on the event loop (crm.views.AsyncCRMGraphQLView).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -85,6 +86,24 @@ DATABASES = {
 }
 
 
+# Cache
+# Local memory per process unless REDIS_CACHE_URL points at a shared Redis
+
+if os.environ.get('REDIS_CACHE_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_CACHE_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -125,6 +144,38 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 # GraphQL Configuration
 GRAPHENE = {
     'SCHEMA': 'alx_backend_graphql_crm.schema.schema',
+    # Parsed and validated documents kept per process (crm.documents)
+    'DOCUMENT_CACHE_SIZE': 256,
+    # Seconds a registered persisted query is kept (crm.documents)
+    'PERSISTED_QUERY_TIMEOUT': 86400,
+    # Root query fields whose results are cached (crm.cache), e.g.
+    # ['allProducts', 'allCustomers']; none until opted in
+    'RESULT_CACHE_FIELDS': [],
+    'RESULT_CACHE_TIMEOUT': 300,
+    'RESULT_CACHE_ALIAS': 'default',
+    # Largest page a connection returns, first/last above it are rejected
+    'RELAY_CONNECTION_MAX_LIMIT': 100,
+    # Rows counted at most by totalCount(approximate: true) (crm.connections)
+    'APPROXIMATE_COUNT_CAP': 10000,
+    # Operations nesting deeper or estimated to cost more are rejected
+    # before execution (crm.complexity)
+    'MAX_QUERY_DEPTH': 6,
+    'MAX_QUERY_COST': 10000,
+    # Rows a nested connection without first/last is priced at
+    'NESTED_CONNECTION_SIZE': 10,
+    # Per-field cost overrides, keyed "Type.field" or by field name
+    'QUERY_FIELD_COSTS': {},
+    # Resolver timings and SQL counts for /metrics (crm.metrics)
+    'MIDDLEWARE': ['crm.metrics.ResolverMetricsMiddleware'],
+    # Fraction of requests measured, and label values kept per histogram
+    'METRICS_SAMPLE_RATE': 1.0,
+    'METRICS_MAX_SERIES': 1000,
+    # Bearer token Prometheus scrapes /metrics with; staff only when unset
+    'METRICS_TOKEN': os.environ.get('METRICS_TOKEN'),
+    # Operations accepted in one batched request (crm.views)
+    'MAX_BATCH_SIZE': 10,
+    # Threads running the ORM work of /graphql/async (crm.concurrency)
+    'ASYNC_THREAD_POOL_SIZE': 8,
 }
 
 # Cron Jobs Configuration
@@ -148,4 +199,8 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'crm.tasks.generate_crm_report',
         'schedule': crontab(day_of_week='mon', hour=6, minute=0),
     },
+    'refresh-order-rollups': {
+        'task': 'crm.tasks.refresh_order_rollups',
+        'schedule': crontab(minute='*/15'),
+    },
 }
@@ -16,10 +16,20 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from graphene_django.views import GraphQLView
 from django.views.decorators.csrf import csrf_exempt
+from crm.views import (
+    AsyncCRMGraphQLView,
+    CRMGraphQLView,
+    document_cache_info,
+    export,
+    prometheus_metrics,
+)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('graphql', csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    path('graphql', csrf_exempt(CRMGraphQLView.as_view(graphiql=True))),
+    path('graphql/async', csrf_exempt(AsyncCRMGraphQLView.as_view(graphiql=True))),
+    path('graphql/cache', document_cache_info),
+    path('export/<str:resource>', export),
+    path('metrics', prometheus_metrics),
 ]
@@ -0,0 +1,66 @@
+from decimal import Decimal
+
+from django.db.models import Count, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Customer, Order
+
+# Denormalized columns derived from a customer's orders
+ACTIVITY_FIELDS = ['order_count', 'lifetime_value', 'last_order_at']
+
+
+def record_order(customer, order):
+    """Fold a new order into the customer's activity columns.
+
+    The caller must hold the customer row lock (select_for_update) so
+    concurrent orders do not overwrite each other's counts.
+    """
+    customer.order_count += 1
+    customer.lifetime_value += order.total_amount
+    if customer.last_order_at is None or order.order_date > customer.last_order_at:
+        customer.last_order_at = order.order_date
+    customer.save(update_fields=ACTIVITY_FIELDS)
+
+
+def forget_order(order):
+    """Take a deleted order out of its customer's activity columns"""
+    customer = Customer.objects.select_for_update().filter(
+        pk=order.customer_id
+    ).first()
+    if customer is None:
+        return
+
+    customer.order_count = max(customer.order_count - 1, 0)
+    customer.lifetime_value -= order.total_amount
+    if order.order_date == customer.last_order_at:
+        customer.last_order_at = Order.objects.filter(
+            customer_id=customer.pk
+        ).aggregate(last=Max('order_date'))['last']
+    customer.save(update_fields=ACTIVITY_FIELDS)
+
+
+def activity_subqueries():
+    """Return column -> expression recomputing the activity from orders"""
+    orders = Order.objects.filter(
+        customer=OuterRef('pk')
+    ).order_by().values('customer')
+    return {
+        'order_count': Coalesce(
+            Subquery(orders.annotate(value=Count('pk')).values('value')),
+            Value(0),
+        ),
+        'lifetime_value': Coalesce(
+            Subquery(orders.annotate(value=Sum('total_amount')).values('value')),
+            Value(Decimal('0.00')),
+        ),
+        'last_order_at': Subquery(
+            orders.annotate(value=Max('order_date')).values('value')
+        ),
+    }
+
+
+def rebuild_customer_activity(start, end):
+    """Recompute the activity columns of customers with start <= pk < end"""
+    return Customer.objects.filter(pk__gte=start, pk__lt=end).update(
+        **activity_subqueries()
+    )
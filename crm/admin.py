@@ -1,27 +1,131 @@
+import re
+
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+from .connections import approximate_count
 from .models import Customer, Product, Order
+from .rollups import deferred_rollups
+from .search import search_customers, search_products, search_orders
+
+# Search terms of digits and separators are matched against phone prefixes
+PHONE_PATTERN = re.compile(r'^\+?[\d\s().-]+$')
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator counting querysets with approximate_count.
+
+    The unfiltered changelist reads its row count from the table
+    statistics instead of running COUNT(*) over the table, and a
+    filtered one counts at most GRAPHENE['APPROXIMATE_COUNT_CAP'] rows.
+    """
+
+    @cached_property
+    def count(self):
+        if isinstance(self.object_list, QuerySet):
+            return approximate_count(self.object_list)
+        return super().count
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """ModelAdmin whose changelist costs the same at any row count.
+
+    Search goes through search_function, which uses the full-text
+    index, instead of icontains over every field of search_fields.
+    search_fields only describes what is searched and enables the
+    search box and autocomplete.
+    """
+    paginator = EstimatedCountPaginator
+    # The "N total" link would count the whole table again
+    show_full_result_count = False
+    search_function = None
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        # The changelist keeps sorting by its columns: ranking by relevance
+        # would score every match before the first page could be read
+        results = self.search_function(queryset, search_term)
+        return results.order_by(*queryset.query.order_by), False
 
 
 @admin.register(Customer)
-class CustomerAdmin(admin.ModelAdmin):
+class CustomerAdmin(ScalableAdmin):
     list_display = ['id', 'name', 'email', 'phone', 'created_at']
     list_filter = ['created_at']
     search_fields = ['name', 'email', 'phone']
-    ordering = ['-created_at']
+    # Matches crm_customer_created_idx, ties included
+    ordering = ['-created_at', '-id']
+
+    @staticmethod
+    def search_function(queryset, value):
+        value = value.strip()
+        if PHONE_PATTERN.match(value):
+            # Prefix match on the phone index of 0003
+            return queryset.filter(phone__startswith=value)
+        return search_customers(queryset, value)
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(ScalableAdmin):
     list_display = ['id', 'name', 'price', 'stock', 'created_at']
     list_filter = ['created_at']
     search_fields = ['name']
-    ordering = ['name']
+    # Matches crm_product_name_idx, ties included
+    ordering = ['name', 'id']
+    search_function = staticmethod(search_products)
+
+
+class OrderTotalFilter(admin.SimpleListFilter):
+    """Ranges of total_amount, served by crm_order_total_idx.
+
+    A plain list_filter on total_amount lists every distinct total,
+    which reads the whole table on each changelist page.
+    """
+    title = 'total amount'
+    parameter_name = 'total'
+    ranges = {
+        'under-50': (None, 50),
+        '50-200': (50, 200),
+        '200-1000': (200, 1000),
+        '1000-plus': (1000, None),
+    }
+
+    def lookups(self, request, model_admin):
+        return [
+            ('under-50', 'Under $50'),
+            ('50-200', '$50 to $200'),
+            ('200-1000', '$200 to $1,000'),
+            ('1000-plus', '$1,000 and over'),
+        ]
+
+    def queryset(self, request, queryset):
+        if self.value() not in self.ranges:
+            return queryset
+        low, high = self.ranges[self.value()]
+        if low is not None:
+            queryset = queryset.filter(total_amount__gte=low)
+        if high is not None:
+            queryset = queryset.filter(total_amount__lt=high)
+        return queryset
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(ScalableAdmin):
     list_display = ['id', 'customer', 'total_amount', 'order_date']
-    list_filter = ['order_date', 'total_amount']
-    search_fields = ['customer__name', 'customer__email']
-    ordering = ['-order_date']
-    filter_horizontal = ['products']
+    # Order.__str__ and the customer column read the customer of each row
+    list_select_related = ['customer']
+    list_filter = ['order_date', OrderTotalFilter]
+    search_fields = ['customer__name', 'customer__email', 'products__name']
+    # Matches crm_order_date_idx, ties included
+    ordering = ['-order_date', '-id']
+    # Search widgets instead of every customer and product in the form
+    autocomplete_fields = ['customer', 'products']
+    search_function = staticmethod(search_orders)
+
+    def delete_queryset(self, request, queryset):
+        # One rollup rebuild per day instead of per selected order
+        with deferred_rollups():
+            super().delete_queryset(request, queryset)
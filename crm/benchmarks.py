@@ -0,0 +1,351 @@
+import asyncio
+import json
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from types import SimpleNamespace
+
+from django.db import connection, transaction
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client
+from django.utils import timezone
+
+from .loaders import DeferredExecutionContext
+from .models import Customer, Product
+
+# Relative slowdown of a percentile, or growth in SQL queries or peak
+# memory, reported as a regression by compare_results
+REGRESSION_THRESHOLD = 0.2
+
+# Latencies below this are too noisy to flag, in milliseconds
+MIN_REGRESSION_MS = 1.0
+
+ORDER_FIELDS = '''
+    edges { node {
+        id totalAmount orderDate
+        customer { name email }
+        products(first: 5) { edges { node { name price } } }
+    } }
+'''
+
+
+def sample_ids():
+    """Ids and dates the operations take their arguments from"""
+    now = timezone.now()
+    return SimpleNamespace(
+        customer=Customer.objects.order_by('pk').values_list('pk', flat=True).first(),
+        products=list(
+            Product.objects.order_by('pk').values_list('pk', flat=True)[:3]
+        ),
+        since=(now - timedelta(days=30)).isoformat(),
+        until=now.isoformat(),
+    )
+
+
+# name -> (GraphQL document, function building the variables from sample_ids)
+OPERATIONS = {
+    'hello': ('{ hello }', None),
+    'allCustomers': (
+        '{ allCustomers(first: 50) { edges { node { name email orderCount } } } }',
+        None,
+    ),
+    'allCustomers.name': (
+        '{ allCustomers(first: 50, name: "smith") { edges { node { name email } } } }',
+        None,
+    ),
+    'allCustomers.search': (
+        '{ allCustomers(first: 50, search: "ada") { edges { node { name email } } } }',
+        None,
+    ),
+    'allCustomers.orders': (
+        '{ allCustomers(first: 20) { edges { node { name '
+        'orders(first: 5) { edges { node { totalAmount } } } } } } }',
+        None,
+    ),
+    'allProducts': (
+        '{ allProducts(first: 50) { edges { node { name price stock } } } }',
+        None,
+    ),
+    'allProducts.lowStock': (
+        '{ allProducts(first: 50, lowStock: 10) { edges { node { name stock } } } }',
+        None,
+    ),
+    'allProducts.priceRange': (
+        '{ allProducts(first: 50, price_Gte: 100, price_Lte: 500) '
+        '{ edges { node { name price } } } }',
+        None,
+    ),
+    'allOrders': (
+        '{ allOrders(first: 50) { %s } }' % ORDER_FIELDS,
+        None,
+    ),
+    'allOrders.customerName': (
+        '{ allOrders(first: 50, customerName: "smith") { %s } }' % ORDER_FIELDS,
+        None,
+    ),
+    'allOrders.productName': (
+        '{ allOrders(first: 50, productName: "laptop") { %s } }' % ORDER_FIELDS,
+        None,
+    ),
+    'allOrders.dateRange': (
+        'query($since: DateTime, $until: DateTime) { allOrders(first: 50, '
+        'orderDate_Gte: $since, orderDate_Lte: $until) { %s } }' % ORDER_FIELDS,
+        lambda ids: {'since': ids.since, 'until': ids.until},
+    ),
+    'allOrders.orderBy': (
+        '{ allOrders(first: 50, orderBy: "-total_amount") { %s } }' % ORDER_FIELDS,
+        None,
+    ),
+    'allOrders.totalCount': (
+        '{ allOrders(first: 1, totalAmount_Gte: 100) { totalCount edges { node { id } } } }',
+        None,
+    ),
+    'dashboard': (
+        '{ allOrders(first: 20) { %s } '
+        'allCustomers(first: 20) { edges { node { name email orderCount } } } '
+        'allProducts(first: 20, lowStock: 10) { edges { node { name stock } } } }'
+        % ORDER_FIELDS,
+        None,
+    ),
+    'createCustomer': (
+        'mutation { createCustomer(input: {name: "Bench", '
+        'email: "bench@example.com", phone: "+15550000000"}) { customer { id } } }',
+        None,
+    ),
+    'bulkCreateCustomers': (
+        'mutation($input: [CustomerInput]!) { bulkCreateCustomers(input: $input) '
+        '{ customers { id } errors } }',
+        lambda ids: {'input': [
+            {'name': f'Bench {i}', 'email': f'bench{i}@example.com'}
+            for i in range(100)
+        ]},
+    ),
+    'createProduct': (
+        'mutation { createProduct(input: {name: "Bench", price: "9.99", stock: 5}) '
+        '{ product { id } } }',
+        None,
+    ),
+    'bulkCreateProducts': (
+        'mutation($input: [ProductInput]!) { bulkCreateProducts(input: $input) '
+        '{ products { id } errors } }',
+        lambda ids: {'input': [
+            {'name': f'Bench {i}', 'price': '9.99', 'stock': 5} for i in range(100)
+        ]},
+    ),
+    'createOrder': (
+        'mutation($customer: ID!, $products: [ID]!) { createOrder(input: '
+        '{customerId: $customer, productIds: $products}) { order { id totalAmount } } }',
+        lambda ids: {'customer': ids.customer, 'products': ids.products},
+    ),
+    'bulkCreateOrders': (
+        'mutation($input: [OrderInput]!) { bulkCreateOrders(input: $input) '
+        '{ orders { id totalAmount } errors } }',
+        lambda ids: {'input': [
+            {'customerId': ids.customer, 'productIds': ids.products}
+            for _ in range(100)
+        ]},
+    ),
+    'updateLowStockProducts': (
+        'mutation { updateLowStockProducts { success message } }',
+        None,
+    ),
+}
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def run_operation(schema, document, variables):
+    """Execute one operation, rolling back anything it writes.
+
+    Returns (seconds, SQL queries). Errors are raised, a benchmark of a
+    failing operation measures nothing useful.
+    """
+    queries = 0
+
+    def count_queries(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    with transaction.atomic():
+        with connection.execute_wrapper(count_queries):
+            start = time.perf_counter()
+            result = schema.execute(
+                document,
+                variable_values=variables,
+                context_value=SimpleNamespace(),
+                execution_context_class=DeferredExecutionContext,
+            )
+            elapsed = time.perf_counter() - start
+        transaction.set_rollback(True)
+    if result.errors:
+        raise result.errors[0]
+    return elapsed, queries
+
+
+def measure_operation(schema, document, variables, iterations):
+    """Latency percentiles, SQL queries and peak memory of an operation"""
+    run_operation(schema, document, variables)
+    timings = []
+    for _ in range(iterations):
+        elapsed, queries = run_operation(schema, document, variables)
+        timings.append(elapsed * 1000)
+
+    # Traced separately, tracemalloc slows down the timed runs
+    tracemalloc.start()
+    try:
+        run_operation(schema, document, variables)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'p50_ms': round(percentile(timings, 0.50), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'queries': queries,
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def run_benchmarks(schema, iterations, names=None):
+    """Measure every operation, or the ones in names, on the current data"""
+    ids = sample_ids()
+    results = {}
+    for name, (document, variables) in OPERATIONS.items():
+        if names and name not in names:
+            continue
+        results[name] = measure_operation(
+            schema, document, variables(ids) if variables else None, iterations
+        )
+    return results
+
+
+def compare_results(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """List the regressions of current against baseline.
+
+    Both are {scale: {operation: measurements}} as run_benchmarks
+    builds them; operations missing from either side are skipped.
+    Returns (scale, operation, metric, before, after) tuples.
+    """
+    regressions = []
+    for scale, operations in current.items():
+        for name, after in operations.items():
+            before = baseline.get(scale, {}).get(name)
+            if before is None:
+                continue
+            for metric in ('p50_ms', 'p95_ms'):
+                if (
+                    after[metric] > before[metric] * (1 + threshold)
+                    and after[metric] - before[metric] >= MIN_REGRESSION_MS
+                ):
+                    regressions.append((scale, name, metric, before[metric], after[metric]))
+            if after['queries'] > before['queries']:
+                regressions.append(
+                    (scale, name, 'queries', before['queries'], after['queries'])
+                )
+            if after['peak_kb'] > before['peak_kb'] * (1 + threshold):
+                regressions.append(
+                    (scale, name, 'peak_kb', before['peak_kb'], after['peak_kb'])
+                )
+    return regressions
+
+
+def is_query(name):
+    return not OPERATIONS[name][0].lstrip().startswith('mutation')
+
+
+def load_summary(timings, seconds):
+    """Throughput and latency percentiles of a load test"""
+    return {
+        'rps': round(len(timings) / seconds, 1),
+        'p50_ms': round(percentile(timings, 0.50), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+    }
+
+
+def check_response(response):
+    if response.status_code != 200 or 'errors' in response.json():
+        raise AssertionError(f"{response.status_code} {response.content[:200]!r}")
+
+
+@contextmanager
+def sql_latency(milliseconds):
+    """Delay every SQL query by milliseconds, on every connection.
+
+    Stands in for the round trip to a database server, which an
+    in-process SQLite database does not have.
+    """
+    def delay(execute, sql, params, many, context):
+        time.sleep(milliseconds / 1000)
+        return execute(sql, params, many, context)
+
+    def on_connection_created(sender, connection, **kwargs):
+        # First in the list, execute_wrapper() pops the wrappers it adds
+        # from the end, even when a connection is created meanwhile
+        if delay not in connection.execute_wrappers:
+            connection.execute_wrappers.insert(0, delay)
+
+    connection_created.connect(on_connection_created)
+    on_connection_created(None, connection)
+    try:
+        yield
+    finally:
+        connection_created.disconnect(on_connection_created)
+        connection.execute_wrappers.remove(delay)
+
+
+def load_test_wsgi(path, body, requests, concurrency):
+    """Send requests through Django's WSGI handler from concurrency threads,
+    like a threaded WSGI worker serving that many clients at once"""
+    payload = json.dumps(body)
+
+    def send(_):
+        started = time.perf_counter()
+        response = Client().post(path, payload, content_type='application/json')
+        elapsed = time.perf_counter() - started
+        check_response(response)
+        return elapsed * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        timings = list(executor.map(send, range(requests)))
+    return load_summary(timings, time.perf_counter() - started)
+
+
+def load_test_asgi(path, body, requests, concurrency):
+    """Send requests through Django's ASGI handler from concurrency clients
+    sharing one event loop, like one ASGI worker"""
+    payload = json.dumps(body)
+
+    async def client(count, timings):
+        client = AsyncClient()
+        for _ in range(count):
+            started = time.perf_counter()
+            response = await client.post(
+                path, payload, content_type='application/json'
+            )
+            timings.append((time.perf_counter() - started) * 1000)
+            check_response(response)
+
+    async def run():
+        timings = []
+        counts = [
+            requests // concurrency + (i < requests % concurrency)
+            for i in range(concurrency)
+        ]
+        await asyncio.gather(*(client(count, timings) for count in counts))
+        return timings
+
+    started = time.perf_counter()
+    timings = asyncio.run(run())
+    return load_summary(timings, time.perf_counter() - started)
@@ -0,0 +1,203 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import FieldDoesNotExist
+from django.db import transaction
+from graphene.utils.str_converters import to_camel_case, to_snake_case
+from graphql import (
+    FragmentDefinitionNode,
+    GraphQLObjectType,
+    OperationType,
+    get_named_type,
+)
+from graphql.execution.collect_fields import collect_fields
+
+# Prefixes of the cache keys used for results and model versions
+RESULT_PREFIX = 'graphql:result:'
+VERSION_PREFIX = 'graphql:version:'
+
+
+def get_setting(name, default):
+    """Read one of this app's options from the GRAPHENE settings"""
+    return getattr(settings, 'GRAPHENE', {}).get(name, default)
+
+
+def get_cache():
+    """Return the cache holding results and model versions"""
+    return caches[get_setting('RESULT_CACHE_ALIAS', 'default')]
+
+
+def version_key(model):
+    return VERSION_PREFIX + model._meta.label_lower
+
+
+def get_versions(models):
+    """Return the current version counter of each model.
+
+    A missing counter starts at a fresh value rather than 1, so an
+    evicted counter can never bring back results cached before eviction.
+    """
+    cache = get_cache()
+    keys = [version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def _bump(models):
+    cache = get_cache()
+    for model in models:
+        key = version_key(model)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def bump_versions(*models):
+    """Invalidate every cached result that read one of models.
+
+    Counters move immediately, so later reads in this process miss, and
+    again on commit, so results cached from uncommitted data are dropped.
+    """
+    _bump(models)
+    transaction.on_commit(lambda: _bump(models))
+
+
+def get_fragments(document):
+    return {
+        definition.name.value: definition
+        for definition in document.definitions
+        if isinstance(definition, FragmentDefinitionNode)
+    }
+
+
+def lookup_models(model, lookup):
+    """Models a filter lookup such as customer__name__icontains joins"""
+    models = set()
+    for part in lookup.split('__'):
+        try:
+            field = model._meta.get_field(part)
+        except FieldDoesNotExist:
+            break
+        if field.related_model is None:
+            break
+        model = field.related_model
+        models.add(model)
+    return models
+
+
+def argument_models(graphql_type, node):
+    """Collect the models a field's filter arguments read.
+
+    Filters on related columns, such as the customerName of allOrders,
+    read rows the selection set never mentions. Method filters declare
+    theirs in the filterset's filter_models.
+    """
+    graphene_type = getattr(graphql_type, 'graphene_type', None)
+    fields = getattr(getattr(graphene_type, '_meta', None), 'fields', None) or {}
+    name = node.name.value
+    field = next((
+        field for attname, field in fields.items()
+        if (getattr(field, 'name', None) or to_camel_case(attname)) == name
+    ), None)
+    filterset_class = getattr(field, 'filterset_class', None)
+    if filterset_class is None or not node.arguments:
+        return set()
+
+    given = {to_snake_case(argument.name.value) for argument in node.arguments}
+    declared = getattr(filterset_class, 'filter_models', {})
+    models = set()
+    for filter_name, filter in filterset_class.base_filters.items():
+        if filter_name not in given:
+            continue
+        if filter_name in declared:
+            models.update(declared[filter_name])
+        else:
+            models |= lookup_models(filterset_class._meta.model, filter.field_name)
+    return models
+
+
+def selected_models(schema, document, operation, variables):
+    """Collect the Django models an operation's selection and filters read"""
+    fragments = get_fragments(document)
+    models = set()
+
+    def walk(graphql_type, selection_set):
+        fields = collect_fields(
+            schema, fragments, variables, graphql_type, selection_set
+        )
+        for nodes in fields.values():
+            field = graphql_type.fields.get(nodes[0].name.value)
+            if field is None:
+                continue
+            for node in nodes:
+                models.update(argument_models(graphql_type, node))
+            field_type = get_named_type(field.type)
+            if not isinstance(field_type, GraphQLObjectType):
+                continue
+            graphene_type = getattr(field_type, 'graphene_type', None)
+            model = getattr(getattr(graphene_type, '_meta', None), 'model', None)
+            if model is not None:
+                models.add(model)
+            for node in nodes:
+                if node.selection_set:
+                    walk(field_type, node.selection_set)
+
+    walk(schema.query_type, operation.selection_set)
+    return models
+
+
+def get_result_key(schema, document, operation, query_hash, variables):
+    """Return the cache key for an operation, or None if it is not cacheable.
+
+    Only queries whose root fields are all listed in
+    GRAPHENE['RESULT_CACHE_FIELDS'] are cached. The key covers the
+    document, operation, variables and the version of every model read.
+    """
+    if operation is None or operation.operation != OperationType.QUERY:
+        return None
+
+    cached_fields = set(get_setting('RESULT_CACHE_FIELDS', ()))
+    root_fields = collect_fields(
+        schema,
+        get_fragments(document),
+        variables or {},
+        schema.query_type,
+        operation.selection_set,
+    )
+    if not root_fields or any(
+        nodes[0].name.value not in cached_fields for nodes in root_fields.values()
+    ):
+        return None
+
+    models = sorted(
+        selected_models(schema, document, operation, variables or {}),
+        key=lambda model: model._meta.label_lower,
+    )
+    raw = json.dumps(
+        [
+            query_hash,
+            operation.name.value if operation.name else None,
+            variables or {},
+            [model._meta.label_lower for model in models],
+            get_versions(models),
+        ],
+        sort_keys=True,
+        default=str,
+    )
+    return RESULT_PREFIX + hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def get_result(key):
+    return get_cache().get(key)
+
+
+def set_result(key, data):
+    get_cache().set(key, data, get_setting('RESULT_CACHE_TIMEOUT', 300))
@@ -0,0 +1,62 @@
+from types import SimpleNamespace
+
+from graphene_django.settings import graphene_settings
+from graphql import DocumentNode, ExecutionResult, execute, print_ast
+from gql.transport.exceptions import TransportQueryError
+
+from .documents import document_cache
+from .loaders import DeferredExecutionContext
+
+
+class LocalClient:
+    """Run GraphQL documents in this process, like gql.Client over HTTP.
+
+    execute() takes a query string, a parsed document or a gql()
+    request, and returns the `data` dict or raises TransportQueryError,
+    as gql.Client.execute does. Nothing is fetched or serialized:
+    documents are parsed once per process through document_cache and
+    executed directly against the project schema.
+    """
+
+    def __init__(self, schema=None):
+        self.schema = schema
+
+    def get_schema(self):
+        if self.schema is None:
+            # Imported late, the project schema imports every app's schema
+            from alx_backend_graphql_crm.schema import schema
+            self.schema = schema
+        return self.schema.graphql_schema
+
+    def execute_result(self, request, variable_values=None, operation_name=None):
+        """Execute request and return the ExecutionResult"""
+        document = getattr(request, 'document', request)
+        variable_values = variable_values or getattr(request, 'variable_values', None)
+        operation_name = operation_name or getattr(request, 'operation_name', None)
+        query = print_ast(document) if isinstance(document, DocumentNode) else document
+
+        schema = self.get_schema()
+        document, errors = document_cache.get_document(
+            schema, query, max_errors=graphene_settings.MAX_VALIDATION_ERRORS
+        )
+        if errors:
+            return ExecutionResult(data=None, errors=errors)
+        return execute(
+            schema,
+            document,
+            variable_values=variable_values,
+            operation_name=operation_name,
+            # Resolvers keep their DataLoaders on the context
+            context_value=SimpleNamespace(),
+            execution_context_class=DeferredExecutionContext,
+        )
+
+    def execute(self, request, variable_values=None, operation_name=None):
+        """Execute request and return its data, raising on GraphQL errors"""
+        result = self.execute_result(request, variable_values, operation_name)
+        if result.errors:
+            errors = [error.formatted for error in result.errors]
+            raise TransportQueryError(
+                str(errors[0]), errors=errors, data=result.data
+            )
+        return result.data
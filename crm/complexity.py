@@ -0,0 +1,229 @@
+from graphene_django.settings import graphene_settings
+from graphql import (
+    FieldNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    GraphQLList,
+    InlineFragmentNode,
+    OperationDefinitionNode,
+    ValidationRule,
+    get_named_type,
+    get_nullable_type,
+    is_leaf_type,
+)
+from graphql.execution.values import get_argument_values, get_variable_values
+from graphql.validation import specified_rules
+
+from .cache import get_fragments, get_setting
+
+# Relations one operation may traverse, connection wrappers not counted
+MAX_QUERY_DEPTH = 6
+
+# Largest estimated number of rows and queries one operation may cost
+MAX_QUERY_COST = 10000
+
+# Rows a nested connection without first/last is priced at: a typical
+# fan-out, such as the products of one order, rather than the page limit
+NESTED_CONNECTION_SIZE = 10
+
+# Fields of connection types that only wrap the rows
+CONNECTION_WRAPPERS = {'edges', 'node', 'pageInfo'}
+
+
+def is_connection(graphql_type):
+    fields = getattr(graphql_type, 'fields', {})
+    return 'edges' in fields and 'pageInfo' in fields
+
+
+def is_edge(graphql_type):
+    fields = getattr(graphql_type, 'fields', {})
+    return 'node' in fields and 'cursor' in fields
+
+
+def field_weight(parent_type, field_name, field_type):
+    """Cost of resolving a field once.
+
+    GRAPHENE['QUERY_FIELD_COSTS'] overrides the default by "Type.field"
+    or by field name. Object fields cost 1 (a row or a query), scalars
+    and connection wrappers are free.
+    """
+    costs = get_setting('QUERY_FIELD_COSTS', {})
+    for key in (f'{parent_type.name}.{field_name}', field_name):
+        if key in costs:
+            return costs[key]
+    if field_name in CONNECTION_WRAPPERS and (
+        is_connection(parent_type) or is_edge(parent_type)
+    ):
+        return 1 if field_name == 'node' else 0
+    return 0 if is_leaf_type(get_named_type(field_type)) else 1
+
+
+def page_size(field_def, node, variables, nested=False):
+    """Number of rows a connection or list field can return.
+
+    Without first/last, a root connection returns a full page, while a
+    nested one is priced at GRAPHENE['NESTED_CONNECTION_SIZE'] rows.
+    """
+    max_limit = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+    default = max_limit or 1
+    if nested:
+        default = min(
+            default, get_setting('NESTED_CONNECTION_SIZE', NESTED_CONNECTION_SIZE)
+        )
+    try:
+        args = get_argument_values(field_def, node, variables)
+    except GraphQLError:
+        # Invalid arguments fail before execution anyway
+        return default
+    # Non-integer sizes fail at execution, negative ones return no rows
+    sizes = [
+        max(args[name], 0) for name in ('first', 'last')
+        if isinstance(args.get(name), int) and not isinstance(args[name], bool)
+    ]
+    if sizes:
+        return max(sizes)
+    return default
+
+
+class SelectionWalker:
+    """Walk an operation's fields through fragments, computing depth and cost"""
+
+    def __init__(self, schema, fragments, variables=None):
+        self.schema = schema
+        self.fragments = fragments
+        self.variables = variables or {}
+
+    def fields(self, parent_type, selection_set, visited=()):
+        """Yield (parent type, field node) for a selection set"""
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                yield parent_type, selection
+            elif isinstance(selection, InlineFragmentNode):
+                condition = selection.type_condition
+                fragment_type = (
+                    self.schema.get_type(condition.name.value)
+                    if condition else parent_type
+                )
+                yield from self.fields(
+                    fragment_type or parent_type, selection.selection_set, visited
+                )
+            elif isinstance(selection, FragmentSpreadNode):
+                name = selection.name.value
+                fragment = self.fragments.get(name)
+                if fragment is None or name in visited:
+                    continue
+                fragment_type = self.schema.get_type(
+                    fragment.type_condition.name.value
+                )
+                yield from self.fields(
+                    fragment_type or parent_type,
+                    fragment.selection_set,
+                    (*visited, name),
+                )
+
+    def walk(self, parent_type, selection_set, multiplier=1, visited=(),
+             nested=False):
+        """Return (depth, cost) of a selection set on parent_type"""
+        depth, cost = 0, 0
+        for field_parent, node in self.fields(parent_type, selection_set, visited):
+            name = node.name.value
+            if name.startswith('__'):
+                # Introspection is answered from the schema, not the database
+                continue
+            field_def = getattr(field_parent, 'fields', {}).get(name)
+            if field_def is None:
+                continue
+
+            field_type = get_nullable_type(field_def.type)
+            named_type = get_named_type(field_type)
+            cost += multiplier * field_weight(field_parent, name, field_type)
+            if node.selection_set is None:
+                continue
+
+            child_multiplier = multiplier
+            if is_connection(named_type) or isinstance(field_type, GraphQLList):
+                if not is_connection(field_parent):
+                    child_multiplier *= page_size(
+                        field_def, node, self.variables, nested
+                    )
+            child_depth, child_cost = self.walk(
+                named_type, node.selection_set, child_multiplier, visited,
+                nested=True,
+            )
+            # Relay wrappers do not add a level of nesting
+            wrapper = name in CONNECTION_WRAPPERS and (
+                is_connection(field_parent) or is_edge(field_parent)
+            )
+            level = 0 if wrapper else 1
+            depth = max(depth, child_depth + level)
+            cost += child_cost
+        return depth, cost
+
+
+def root_type(schema, operation):
+    return schema.get_root_type(operation.operation)
+
+
+def operation_depth(schema, document, operation):
+    walker = SelectionWalker(schema, get_fragments(document))
+    depth, _ = walker.walk(root_type(schema, operation), operation.selection_set)
+    return depth
+
+
+def operation_cost(schema, document, operation, variables=None):
+    """Estimate the rows and queries an operation can touch.
+
+    Each object field costs its weight times the number of parents it is
+    resolved for; a connection multiplies its children by `first`/`last`,
+    or when neither is given by RELAY_CONNECTION_MAX_LIMIT at the root
+    and NESTED_CONNECTION_SIZE below it.
+    """
+    walker = SelectionWalker(schema, get_fragments(document), variables)
+    _, cost = walker.walk(root_type(schema, operation), operation.selection_set)
+    return cost
+
+
+def check_cost(schema, document, operation, variables=None):
+    """Return ({'estimated', 'maximum'}, errors), errors set over the budget.
+
+    Sizes are read from the variables as execution would coerce them, so
+    variables that fail coercion are returned as the errors, unpriced.
+    """
+    coerced = get_variable_values(
+        schema, operation.variable_definitions or (), variables or {}
+    )
+    if isinstance(coerced, list):
+        return None, coerced
+    cost = operation_cost(schema, document, operation, coerced)
+    max_cost = get_setting('MAX_QUERY_COST', MAX_QUERY_COST)
+    summary = {'estimated': cost, 'maximum': max_cost}
+    if cost <= max_cost:
+        return summary, []
+    return summary, [GraphQLError(
+        f"Operation cost {cost} exceeds the maximum cost of {max_cost}.",
+        extensions={'code': 'QUERY_TOO_COMPLEX', 'cost': cost, 'maxCost': max_cost},
+    )]
+
+
+class DepthLimitRule(ValidationRule):
+    """Reject operations nesting relations deeper than MAX_QUERY_DEPTH"""
+
+    def enter_operation_definition(self, node: OperationDefinitionNode, *_args):
+        schema = self.context.schema
+        if root_type(schema, node) is None:
+            return
+        depth = operation_depth(schema, self.context.document, node)
+        max_depth = get_setting('MAX_QUERY_DEPTH', MAX_QUERY_DEPTH)
+        if depth > max_depth:
+            name = f"'{node.name.value}' " if node.name else ''
+            self.report_error(GraphQLError(
+                f"Operation {name}has depth {depth}, "
+                f"which exceeds the maximum depth of {max_depth}.",
+                node,
+                extensions={'code': 'QUERY_TOO_DEEP'},
+            ))
+
+
+# graphql-core's rules plus the depth limit; the cost needs variables and
+# is checked per request by the view
+validation_rules = (*specified_rules, DepthLimitRule)
@@ -0,0 +1,73 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.db import close_old_connections, connection
+
+from .cache import get_setting
+
+# Threads running the ORM work of asynchronous GraphQL executions
+ASYNC_THREAD_POOL_SIZE = 8
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """The process-wide pool of GRAPHENE['ASYNC_THREAD_POOL_SIZE'] threads"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=get_setting(
+                    'ASYNC_THREAD_POOL_SIZE', ASYNC_THREAD_POOL_SIZE
+                ),
+                thread_name_prefix='crm-orm',
+            )
+    return _executor
+
+
+def call_with_connection(func, args, kwargs, metrics):
+    # Pool threads keep their own database connection, which no request
+    # signal closes, so it is recycled here according to CONN_MAX_AGE
+    close_old_connections()
+    try:
+        if metrics is None:
+            return func(*args, **kwargs)
+        with connection.execute_wrapper(metrics):
+            return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_in_thread(context, func, *args, **kwargs):
+    """Await func(*args, **kwargs) run in the ORM thread pool.
+
+    Unlike sync_to_async, which runs every call of a request on one
+    thread, calls made concurrently here run concurrently, up to the
+    size of the pool. SQL run by func counts towards the metrics of the
+    operation in context, if it is measured.
+    """
+    metrics = getattr(context, 'graphql_metrics', None)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(), partial(call_with_connection, func, args, kwargs, metrics)
+    )
+
+
+def is_async(info):
+    """Whether the operation of info is executed asynchronously"""
+    return getattr(info.context, 'async_execution', False)
+
+
+def in_thread(info, func, *args, **kwargs):
+    """Call func now, or in the ORM thread pool in asynchronous executions.
+
+    Resolvers doing ORM work return this, so the same resolver serves
+    both the synchronous view and AsyncCRMGraphQLView, where the ORM
+    may not be used from the event loop.
+    """
+    if is_async(info):
+        return run_in_thread(info.context, func, *args, **kwargs)
+    return func(*args, **kwargs)
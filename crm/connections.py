@@ -0,0 +1,85 @@
+import graphene
+from django.conf import settings
+from django.db import connections
+from django.db.models.query import QuerySet
+
+from .concurrency import in_thread
+
+# Rows counted at most by an approximate totalCount on a filtered queryset
+APPROXIMATE_COUNT_CAP = 10000
+
+
+def table_estimate(queryset):
+    """Row count of queryset's table from the planner statistics, or None"""
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                [connection.ops.quote_name(table)],
+            )
+        elif connection.vendor == 'sqlite':
+            # Present once ANALYZE has run; the first number is the row count
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+            )
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute(
+                'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1',
+                [table],
+            )
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    estimate = int(float(str(row[0]).split()[0]))
+    # PostgreSQL reports -1 for a table that was never analyzed
+    return estimate if estimate >= 0 else None
+
+
+def approximate_count(queryset):
+    """Cheap stand-in for queryset.count().
+
+    An unfiltered queryset is answered from the table statistics. A
+    filtered one is counted up to GRAPHENE['APPROXIMATE_COUNT_CAP'] rows,
+    so a broad filter costs at most that many rows read.
+    """
+    if not queryset.query.where and not queryset.query.distinct:
+        estimate = table_estimate(queryset)
+        if estimate is not None:
+            return estimate
+    cap = getattr(settings, 'GRAPHENE', {}).get(
+        'APPROXIMATE_COUNT_CAP', APPROXIMATE_COUNT_CAP
+    )
+    return queryset.order_by()[:cap].count()
+
+
+class CountableConnection(graphene.relay.Connection):
+    """Connection exposing totalCount, counted only when it is selected"""
+
+    class Meta:
+        abstract = True
+
+    total_count = graphene.Int(
+        approximate=graphene.Boolean(
+            default_value=False,
+            description=(
+                "Estimate from table statistics, or count at most "
+                "APPROXIMATE_COUNT_CAP matching rows"
+            ),
+        ),
+    )
+
+    def resolve_total_count(self, info, approximate=False):
+        length = getattr(self, 'length', None)
+        if length is not None:
+            return length
+        iterable = self.iterable
+        if not isinstance(iterable, QuerySet):
+            return len(iterable)
+        if approximate:
+            return in_thread(info, approximate_count, iterable)
+        return in_thread(info, iterable.count)
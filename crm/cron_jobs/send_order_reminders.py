@@ -1,19 +1,21 @@
-import requests
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+import os
+import sys
 from datetime import datetime, timedelta
 
-# Setup the GraphQL client
-transport = RequestsHTTPTransport(url='http://localhost:8000/graphql', verify=True, retries=3)
-client = Client(transport=transport, fetch_schema_from_transport=True)
+# Project root, two levels above this file
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# Calculate date 7 days ago
-seven_days_ago = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%dT%H:%M:%S')
+# Orders fetched per request
+PAGE_SIZE = 100
 
-# Query for orders within the last 7 days
-query = gql("""
-    query($orderDateGte: DateTime) {
-        allOrders(filter: { orderDateGte: $orderDateGte }) {
+# Query for orders within the last 7 days, one page at a time
+QUERY = """
+    query($orderDateGte: DateTime, $first: Int, $after: String) {
+        allOrders(orderDate_Gte: $orderDateGte, first: $first, after: $after) {
+            pageInfo {
+                hasNextPage
+                endCursor
+            }
             edges {
                 node {
                     id
@@ -25,22 +27,74 @@ query = gql("""
             }
         }
     }
-""")
+"""
+
+
+def setup_django():
+    """Set up Django when run as a script, returning whether it worked"""
+    sys.path.insert(0, BASE_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql_crm.settings')
+    try:
+        import django
+        django.setup()
+    except Exception:
+        # Not deployed with the project, get_client falls back to HTTP
+        return False
+    return True
+
+
+def get_client():
+    """Run in process inside Django, over HTTP to the web server otherwise"""
+    try:
+        from django.apps import apps
+        in_django = apps.ready
+    except ImportError:
+        in_django = False
+    if in_django:
+        from crm.client import LocalClient
+        return LocalClient()
+
+    from gql import Client
+    from gql.transport.requests import RequestsHTTPTransport
+    transport = RequestsHTTPTransport(url='http://localhost:8000/graphql', verify=True, retries=3)
+    return Client(transport=transport, fetch_schema_from_transport=False)
+
+
+def fetch_orders(client, since):
+    """Yield every order placed since `since`, following the cursors"""
+    from gql import gql
+    query = gql(QUERY)
+    after = None
+    while True:
+        query.variable_values = {
+            "orderDateGte": since,
+            "first": PAGE_SIZE,
+            "after": after,
+        }
+        connection = client.execute(query)['allOrders']
+        for edge in connection['edges']:
+            yield edge['node']
+        if not connection['pageInfo']['hasNextPage']:
+            return
+        after = connection['pageInfo']['endCursor']
+
 
 def run():
+    # Calculate date 7 days ago
+    seven_days_ago = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%dT%H:%M:%S')
+
     try:
-        result = client.execute(query, variable_values={"orderDateGte": seven_days_ago})
-        
+        client = get_client()
         with open('/tmp/order_reminders_log.txt', 'a') as f:
             timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            orders = result.get('allOrders', {}).get('edges', [])
-            for edge in orders:
-                order = edge['node']
+            for order in fetch_orders(client, seven_days_ago):
                 f.write(f"{timestamp} - ID: {order['id']}, Email: {order['customer']['email']}\n")
-        
+
         print("Order reminders processed!")
     except Exception as e:
         print(f"Error: {e}")
 
+
 if __name__ == "__main__":
+    setup_django()
     run()
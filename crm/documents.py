@@ -0,0 +1,136 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from graphql import GraphQLError, parse
+from graphql.validation import validate
+
+from .cache import get_setting
+
+# Parsed documents kept per process
+DOCUMENT_CACHE_SIZE = 256
+
+# Prefix of the cache keys holding persisted query text
+PERSISTED_QUERY_PREFIX = 'graphql:persisted:'
+
+# Seconds a registered persisted query is kept, clients re-register after
+PERSISTED_QUERY_TIMEOUT = 24 * 60 * 60
+
+
+def document_hash(query):
+    """Return the sha256 hex digest clients use to identify a document"""
+    return hashlib.sha256(query.encode('utf-8')).hexdigest()
+
+
+class DocumentCache:
+    """Bounded LRU cache of parsed and validated GraphQL documents.
+
+    Entries map a document hash to the parsed AST and its validation
+    errors, so repeated documents skip both parse() and validate().
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_document(self, schema, query, rules=None, max_errors=None):
+        """Return (document, errors) for query, parsing it on a miss"""
+        key = (document_hash(query), tuple(rules or ()))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        try:
+            document = parse(query)
+        except GraphQLError as e:
+            entry = (None, [e])
+        else:
+            entry = (document, validate(schema, document, rules, max_errors))
+
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return entry
+
+    def cache_info(self):
+        """Return hit/miss counters and current size"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'max_size': self.max_size,
+                'size': len(self._entries),
+            }
+
+    def clear(self):
+        """Drop every entry and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+document_cache = DocumentCache(
+    getattr(settings, 'GRAPHENE', {}).get(
+        'DOCUMENT_CACHE_SIZE', DOCUMENT_CACHE_SIZE
+    )
+)
+
+
+def get_persisted_query(request, data, query):
+    """Resolve an Apollo-style persisted query to its document text.
+
+    A request carrying only extensions.persistedQuery.sha256Hash is looked
+    up in the cache. Returns (query, register), register being True when
+    the request also carries the query to register: the caller stores it
+    with persist_query once the document passed validation.
+    """
+    extensions = request.GET.get('extensions') or data.get('extensions')
+    if isinstance(extensions, str):
+        try:
+            extensions = json.loads(extensions)
+        except ValueError:
+            raise GraphQLError("Extensions are invalid JSON.")
+    persisted = (extensions or {}).get('persistedQuery')
+    if not persisted:
+        return query, False
+
+    sha256 = persisted.get('sha256Hash')
+    if persisted.get('version') != 1 or not sha256:
+        raise GraphQLError(
+            "Unsupported persisted query version.",
+            extensions={'code': 'PERSISTED_QUERY_NOT_SUPPORTED'},
+        )
+
+    if query:
+        if document_hash(query) != sha256:
+            raise GraphQLError("Provided sha256Hash does not match query.")
+        return query, True
+
+    query = cache.get(PERSISTED_QUERY_PREFIX + sha256)
+    if query is None:
+        raise GraphQLError(
+            "PersistedQueryNotFound",
+            extensions={'code': 'PERSISTED_QUERY_NOT_FOUND'},
+        )
+    return query, False
+
+
+def persist_query(query):
+    """Register query under its hash for GRAPHENE['PERSISTED_QUERY_TIMEOUT']"""
+    cache.set(
+        PERSISTED_QUERY_PREFIX + document_hash(query),
+        query,
+        get_setting('PERSISTED_QUERY_TIMEOUT', PERSISTED_QUERY_TIMEOUT),
+    )
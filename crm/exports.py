@@ -0,0 +1,96 @@
+import csv
+import json
+
+from .pagination import encode_value
+
+from .filters import CustomerFilter, ProductFilter, OrderFilter
+
+# Rows fetched from the database per round trip
+EXPORT_CHUNK_SIZE = 2000
+
+# Exported resources: filterset and (column, field path) pairs
+EXPORTS = {
+    'customers': (CustomerFilter, [
+        ('id', 'id'),
+        ('name', 'name'),
+        ('email', 'email'),
+        ('phone', 'phone'),
+        ('order_count', 'order_count'),
+        ('lifetime_value', 'lifetime_value'),
+        ('last_order_at', 'last_order_at'),
+        ('created_at', 'created_at'),
+    ]),
+    'products': (ProductFilter, [
+        ('id', 'id'),
+        ('name', 'name'),
+        ('price', 'price'),
+        ('stock', 'stock'),
+        ('created_at', 'created_at'),
+    ]),
+    'orders': (OrderFilter, [
+        ('id', 'id'),
+        ('customer_id', 'customer_id'),
+        ('customer_email', 'customer__email'),
+        ('total_amount', 'total_amount'),
+        ('order_date', 'order_date'),
+    ]),
+}
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+class Echo:
+    """File-like object whose write() returns the text, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset, columns, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield the rows of queryset as tuples, chunk_size rows per fetch"""
+    paths = [path for _, path in columns]
+    return queryset.values_list(*paths).iterator(chunk_size=chunk_size)
+
+
+def ndjson_lines(rows, columns):
+    names = [name for name, _ in columns]
+    # encode_value keeps microseconds, which DjangoJSONEncoder truncates
+    encoder = json.JSONEncoder(separators=(',', ':'), default=encode_value)
+    for row in rows:
+        yield encoder.encode(dict(zip(names, row))) + '\n'
+
+
+def csv_lines(rows, columns):
+    writer = csv.writer(Echo())
+    yield writer.writerow([name for name, _ in columns])
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def batched(lines, size=EXPORT_CHUNK_SIZE):
+    """Join lines into one response chunk per database fetch.
+
+    The first line is sent on its own so the client sees a response as
+    soon as the query starts returning rows.
+    """
+    lines = iter(lines)
+    for line in lines:
+        yield line
+        break
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def export_stream(queryset, columns, format):
+    rows = export_rows(queryset, columns)
+    lines = csv_lines(rows, columns) if format == 'csv' else ndjson_lines(rows, columns)
+    return batched(lines)
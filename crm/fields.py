@@ -0,0 +1,224 @@
+from django.db.models.query import QuerySet
+from graphene.relay import PageInfo
+from graphene_django import DjangoConnectionField
+from graphene_django.filter import DjangoFilterConnectionField
+from graphene_django.utils import maybe_queryset
+from graphql_relay import get_offset_with_default, offset_to_cursor
+
+from .concurrency import in_thread
+from .loaders import then
+from .pagination import (
+    after_key,
+    annotate_key,
+    cursor_to_key,
+    get_sort_key,
+    is_offset_cursor,
+    key_to_cursor,
+    order_by_key,
+    row_key,
+)
+
+
+class BatchedConnectionField(DjangoConnectionField):
+    """Connection field whose resolver may return a DataLoader future.
+
+    graphene-django only understands querysets, lists and promises, so the
+    connection is built once the loader has delivered the related rows.
+    """
+
+    @classmethod
+    def connection_resolver(
+        cls,
+        resolver,
+        connection,
+        default_manager,
+        queryset_resolver,
+        max_limit,
+        enforce_first_or_last,
+        root,
+        info,
+        **args,
+    ):
+        def on_resolve(iterable):
+            return super(BatchedConnectionField, cls).connection_resolver(
+                lambda *_, **__: iterable,
+                connection,
+                default_manager,
+                queryset_resolver,
+                max_limit,
+                enforce_first_or_last,
+                root,
+                info,
+                **args,
+            )
+
+        return then(resolver(root, info, **args), on_resolve)
+
+
+def make_connection(
+    connection, rows, cursors, has_previous_page, has_next_page, iterable,
+    length=None,
+):
+    """Build a connection page; CountableConnection counts iterable lazily"""
+    edges = [
+        connection.Edge(node=row, cursor=cursor)
+        for row, cursor in zip(rows, cursors)
+    ]
+    result = connection(
+        edges=edges,
+        page_info=PageInfo(
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None,
+            has_previous_page=has_previous_page,
+            has_next_page=has_next_page,
+        ),
+    )
+    result.iterable = iterable
+    result.length = length
+    return result
+
+
+class KeysetConnectionField(DjangoFilterConnectionField):
+    """Filtered connection paginated by sort key instead of by offset.
+
+    Cursors encode the sort key of their row, e.g. (order_date, id) for
+    orders, so `after` becomes a range condition the database serves
+    from an index and a deep page costs the same as the first one.
+    Orderings that have no usable key (search relevance, nullable or
+    multi-valued columns) and offset cursors from older clients fall
+    back to offset pagination. Neither mode runs a COUNT unless the
+    client selects totalCount or pages backwards from the end by offset.
+    In asynchronous executions the page is fetched in the ORM thread
+    pool, so sibling root fields are fetched concurrently.
+    """
+
+    @classmethod
+    def connection_resolver(
+        cls,
+        resolver,
+        connection,
+        default_manager,
+        queryset_resolver,
+        max_limit,
+        enforce_first_or_last,
+        root,
+        info,
+        **args,
+    ):
+        return in_thread(
+            info,
+            super().connection_resolver,
+            resolver,
+            connection,
+            default_manager,
+            queryset_resolver,
+            max_limit,
+            enforce_first_or_last,
+            root,
+            info,
+            **args,
+        )
+
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable, max_limit=None):
+        iterable = maybe_queryset(iterable)
+        if not isinstance(iterable, QuerySet):
+            return super().resolve_connection(
+                connection, args, iterable, max_limit=max_limit
+            )
+
+        first, last = args.get('first'), args.get('last')
+        if max_limit is not None and first is None and last is None:
+            first = max_limit
+
+        key = get_sort_key(iterable)
+        if (
+            key is None
+            or args.get('offset')
+            or is_offset_cursor(args.get('after'))
+            or is_offset_cursor(args.get('before'))
+        ):
+            return cls.resolve_offset_connection(
+                connection, args, iterable, first, last
+            )
+        return cls.resolve_keyset_connection(
+            connection, args, iterable, key, first, last
+        )
+
+    @classmethod
+    def resolve_keyset_connection(cls, connection, args, iterable, key, first, last):
+        model = iterable.model
+        after, before = args.get('after'), args.get('before')
+
+        queryset = annotate_key(iterable, key)
+        if after:
+            queryset = queryset.filter(
+                after_key(model, key, cursor_to_key(model, key, after))
+            )
+        if before:
+            queryset = queryset.filter(
+                after_key(
+                    model, key, cursor_to_key(model, key, before), reverse=True
+                )
+            )
+
+        # Fetch one row more than requested to learn whether more follow
+        if first is None and last is not None:
+            rows = list(order_by_key(queryset, key, reverse=True)[:last + 1])
+            has_previous_page = len(rows) > last
+            rows = rows[:last][::-1]
+            has_next_page = bool(before)
+        else:
+            queryset = order_by_key(queryset, key)
+            rows = list(queryset if first is None else queryset[:first + 1])
+            has_next_page = first is not None and len(rows) > first
+            rows = rows[:first]
+            if last is not None:
+                has_previous_page = len(rows) > last
+                if has_previous_page:
+                    rows = rows[len(rows) - last:]
+            else:
+                has_previous_page = bool(after)
+
+        cursors = [key_to_cursor(key, row_key(row, key)) for row in rows]
+        return make_connection(
+            connection, rows, cursors, has_previous_page, has_next_page, iterable
+        )
+
+    @classmethod
+    def resolve_offset_connection(cls, connection, args, iterable, first, last):
+        # Same cursors and offset argument as graphene-django, but the
+        # page is sliced without counting the whole queryset first
+        start = max(get_offset_with_default(args.get('after'), -1) + 1, 0)
+        if args.get('offset'):
+            start += args['offset']
+        end = get_offset_with_default(args.get('before'), None)
+        if end is not None:
+            end = max(end, start)
+        length = None
+
+        if first is None and last is not None:
+            if end is None:
+                # The last rows of an open-ended window need its length
+                length = iterable.count()
+                end = max(length, start)
+            offset = max(start, end - last)
+            rows = list(iterable[offset:end])
+            has_previous_page = offset > start
+            has_next_page = False
+        else:
+            window = iterable[start:end] if end is not None else iterable[start:]
+            rows = list(window if first is None else window[:first + 1])
+            has_next_page = first is not None and len(rows) > first
+            rows = rows[:first]
+            offset = start
+            has_previous_page = last is not None and len(rows) > last
+            if has_previous_page:
+                offset += len(rows) - last
+                rows = rows[len(rows) - last:]
+
+        cursors = [offset_to_cursor(offset + i) for i in range(len(rows))]
+        return make_connection(
+            connection, rows, cursors, has_previous_page, has_next_page,
+            iterable, length,
+        )
@@ -1,6 +1,61 @@
 import django_filters
 from django.db import models
+from django.db.models import BooleanField, F, Func
+from django.db.models.lookups import LessThan
+from django_filters.constants import EMPTY_VALUES
 from .models import Customer, Product, Order
+from .search import (
+    SubstringMatch,
+    search_customers,
+    search_products,
+    search_orders,
+)
+
+# Fraction of rows SQLite is told an indexed range filter matches
+RANGE_SELECTIVITY = 0.05
+
+
+class Selective(Func):
+    """Condition the query planner should expect to match few rows.
+
+    Without STAT4 statistics SQLite assumes a range matches a quarter of
+    the table, and so prefers walking the index of the ordering over
+    seeking the index of the filtered column; likelihood() corrects the
+    estimate. Other databases estimate from their own statistics.
+    """
+    output_field = BooleanField()
+    conditional = True
+
+    def __init__(self, condition, probability=RANGE_SELECTIVITY):
+        super().__init__(condition)
+        self.probability = probability
+
+    def as_sqlite(self, compiler, connection):
+        sql, params = compiler.compile(self.source_expressions[0])
+        # The probability must be a literal, not a bound parameter
+        return f'likelihood({sql}, {float(self.probability)!r})', params
+
+    def as_sql(self, compiler, connection):
+        return compiler.compile(self.source_expressions[0])
+
+
+class IndexedRangeMixin:
+    """Range filter on an indexed column that differs from the ordering"""
+
+    def filter(self, qs, value):
+        if value in EMPTY_VALUES:
+            return qs
+        field = qs.model._meta.get_field(self.field_name)
+        lookup = field.get_lookup(self.lookup_expr)
+        return qs.filter(Selective(lookup(F(self.field_name), value)))
+
+
+class IndexedNumberFilter(IndexedRangeMixin, django_filters.NumberFilter):
+    pass
+
+
+class IndexedDateTimeFilter(IndexedRangeMixin, django_filters.DateTimeFilter):
+    pass
 
 
 class CustomerFilter(django_filters.FilterSet):
@@ -12,6 +67,13 @@ class CustomerFilter(django_filters.FilterSet):
     created_at__gte = django_filters.DateTimeFilter(field_name='created_at', lookup_expr='gte')
     created_at__lte = django_filters.DateTimeFilter(field_name='created_at', lookup_expr='lte')
     phone_pattern = django_filters.CharFilter(method='filter_phone_pattern')
+    order_count__gte = django_filters.NumberFilter(field_name='order_count', lookup_expr='gte')
+    order_count__lte = django_filters.NumberFilter(field_name='order_count', lookup_expr='lte')
+    lifetime_value__gte = IndexedNumberFilter(field_name='lifetime_value', lookup_expr='gte')
+    lifetime_value__lte = IndexedNumberFilter(field_name='lifetime_value', lookup_expr='lte')
+    last_order_at__gte = IndexedDateTimeFilter(field_name='last_order_at', lookup_expr='gte')
+    last_order_at__lte = IndexedDateTimeFilter(field_name='last_order_at', lookup_expr='lte')
+    search = django_filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Customer
@@ -23,17 +85,22 @@ class CustomerFilter(django_filters.FilterSet):
             return queryset.filter(phone__startswith=value)
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        """Full-text search on name and email, best matches first"""
+        return search_customers(queryset, value)
+
 
 class ProductFilter(django_filters.FilterSet):
     """Filter class for Product model"""
     name = django_filters.CharFilter(field_name='name', lookup_expr='icontains')
     name_icontains = django_filters.CharFilter(field_name='name', lookup_expr='icontains')
-    price__gte = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
-    price__lte = django_filters.NumberFilter(field_name='price', lookup_expr='lte')
+    price__gte = IndexedNumberFilter(field_name='price', lookup_expr='gte')
+    price__lte = IndexedNumberFilter(field_name='price', lookup_expr='lte')
     stock = django_filters.NumberFilter(field_name='stock', lookup_expr='exact')
-    stock__gte = django_filters.NumberFilter(field_name='stock', lookup_expr='gte')
-    stock__lte = django_filters.NumberFilter(field_name='stock', lookup_expr='lte')
+    stock__gte = IndexedNumberFilter(field_name='stock', lookup_expr='gte')
+    stock__lte = IndexedNumberFilter(field_name='stock', lookup_expr='lte')
     low_stock = django_filters.NumberFilter(method='filter_low_stock')
+    search = django_filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Product
@@ -42,16 +109,20 @@ class ProductFilter(django_filters.FilterSet):
     def filter_low_stock(self, queryset, name, value):
         """Custom filter to find products with stock below threshold"""
         threshold = value if value is not None else 10
-        return queryset.filter(stock__lt=threshold)
+        return queryset.filter(Selective(LessThan(F('stock'), threshold)))
+
+    def filter_search(self, queryset, name, value):
+        """Full-text search on name, best matches first"""
+        return search_products(queryset, value)
 
 
 class OrderFilter(django_filters.FilterSet):
     """Filter class for Order model"""
-    total_amount__gte = django_filters.NumberFilter(
+    total_amount__gte = IndexedNumberFilter(
         field_name='total_amount',
         lookup_expr='gte'
     )
-    total_amount__lte = django_filters.NumberFilter(
+    total_amount__lte = IndexedNumberFilter(
         field_name='total_amount',
         lookup_expr='lte'
     )
@@ -64,8 +135,7 @@ class OrderFilter(django_filters.FilterSet):
         lookup_expr='lte'
     )
     customer_name = django_filters.CharFilter(
-        field_name='customer__name',
-        lookup_expr='icontains'
+        method='filter_customer_name'
     )
     product_name = django_filters.CharFilter(
         method='filter_product_name'
@@ -73,16 +143,38 @@ class OrderFilter(django_filters.FilterSet):
     product_id = django_filters.NumberFilter(
         method='filter_product_id'
     )
+    search = django_filters.CharFilter(
+        method='filter_search'
+    )
+
+    # Models read by the method filters, for the result cache key
+    filter_models = {
+        'customer_name': [Customer],
+        'product_name': [Product],
+        'product_id': [Product],
+        'search': [Customer, Product],
+    }
 
     class Meta:
         model = Order
         fields = ['total_amount', 'order_date']
 
+    def filter_customer_name(self, queryset, name, value):
+        """Orders whose customer's name contains value"""
+        if not value:
+            return queryset
+        return queryset.filter(SubstringMatch(
+            Customer, value, key='customer_id', prefix='customer__',
+        ))
+
     def filter_product_name(self, queryset, name, value):
-        """Filter orders by product name"""
-        if value:
-            return queryset.filter(products__name__icontains=value).distinct()
-        return queryset
+        """Orders containing a product whose name contains value"""
+        if not value:
+            return queryset
+        OrderProduct = Order.products.through
+        return queryset.filter(pk__in=OrderProduct.objects.filter(
+            SubstringMatch(Product, value, key='product_id', prefix='product__')
+        ).values('order_id'))
 
     def filter_product_id(self, queryset, name, value):
         """Filter orders that include a specific product ID"""
@@ -90,3 +182,7 @@ class OrderFilter(django_filters.FilterSet):
             return queryset.filter(products__id=value).distinct()
         return queryset
 
+
+    def filter_search(self, queryset, name, value):
+        """Full-text search on customer name/email and product names"""
+        return search_orders(queryset, value)
@@ -0,0 +1,86 @@
+from django.db import connection, transaction
+from django.db.models import F, Max, Min
+from django.utils import timezone
+
+from .cache import bump_versions
+from .models import Product
+
+# Default low-stock threshold and restock amount
+LOW_STOCK_THRESHOLD = 10
+RESTOCK_INCREMENT = 10
+
+# Width of the primary-key range updated by one statement
+RESTOCK_CHUNK_SIZE = 10000
+
+
+def restock_low_stock(threshold=LOW_STOCK_THRESHOLD,
+                      increment=RESTOCK_INCREMENT,
+                      chunk_size=RESTOCK_CHUNK_SIZE):
+    """Add increment to every product whose stock is below threshold.
+
+    Each primary-key range is restocked by a single UPDATE computing
+    stock + increment in the database, so concurrent runs cannot lose an
+    increment and a product that was just restocked is not restocked again.
+    Returns (name, new stock) pairs for the restocked products.
+    """
+    low_stock = Product.objects.filter(stock__lt=threshold)
+    bounds = low_stock.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return []
+
+    restocked = []
+    for start in range(bounds['low'], bounds['high'] + 1, chunk_size):
+        restocked.extend(_restock_range(
+            threshold, increment, start, start + chunk_size
+        ))
+    if restocked:
+        bump_versions(Product)
+    return restocked
+
+
+def supports_update_returning():
+    """Check whether the database accepts UPDATE ... RETURNING"""
+    # MariaDB returns columns from INSERT but not from UPDATE
+    return (
+        connection.vendor in ('postgresql', 'sqlite')
+        and connection.features.can_return_columns_from_insert
+    )
+
+
+def _restock_range(threshold, increment, start, end):
+    """Restock the low-stock products with start <= pk < end"""
+    now = timezone.now()
+
+    if supports_update_returning():
+        # Update and read the new values back in one statement
+        quote = connection.ops.quote_name
+        updated_at = Product._meta.get_field('updated_at')
+        table = quote(Product._meta.db_table)
+        pk = quote(Product._meta.pk.column)
+        sql = (
+            f"UPDATE {table} SET stock = stock + %s, updated_at = %s "
+            f"WHERE stock < %s AND {pk} >= %s AND {pk} < %s "
+            f"RETURNING name, stock"
+        )
+        params = [
+            increment,
+            updated_at.get_db_prep_save(now, connection),
+            threshold,
+            start,
+            end,
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    with transaction.atomic():
+        products = Product.objects.select_for_update().filter(
+            stock__lt=threshold, pk__gte=start, pk__lt=end
+        )
+        ids = list(products.values_list('pk', flat=True))
+        Product.objects.filter(pk__in=ids).update(
+            stock=F('stock') + increment, updated_at=now
+        )
+        return list(
+            Product.objects.filter(pk__in=ids).values_list('name', 'stock')
+        )
@@ -0,0 +1,159 @@
+from collections import defaultdict
+from functools import partial
+from inspect import isawaitable
+
+from django.db.models import Count, F, Window
+from django.db.models.functions import RowNumber
+from graphene.utils.dataloader import DataLoader
+from graphql_sync_dataloaders import (
+    DeferredExecutionContext as BaseDeferredExecutionContext,
+    SyncDataLoader,
+    SyncFuture,
+)
+
+from .concurrency import is_async, run_in_thread
+from .models import Customer, Product, Order
+from .pagination import LeadingRows
+
+
+# Batch load functions
+def load_customers(keys):
+    """Load customers by primary key, one query per batch"""
+    customers = Customer.objects.in_bulk(keys)
+    return [customers.get(key) for key in keys]
+
+
+def load_related(queryset, parent, keys):
+    """Group the rows of queryset by their parent column, for (pk, limit) keys.
+
+    Keys with a limit read only the first `limit` rows of each parent in
+    the model's ordering, numbered with ROW_NUMBER() OVER (PARTITION BY
+    parent), and get them as LeadingRows that still count every row.
+    """
+    pks_by_limit = defaultdict(list)
+    for pk, limit in keys:
+        pks_by_limit[limit].append(pk)
+
+    rows, totals = defaultdict(list), {}
+    for limit, pks in pks_by_limit.items():
+        batch = queryset.filter(**{f'{parent}__in': pks}).annotate(
+            loader_key=F(parent)
+        )
+        if limit is not None:
+            # pk breaks ties so the numbering and the ordering agree
+            ordering = [*queryset.model._meta.ordering, 'pk']
+            batch = batch.annotate(
+                loader_row=Window(
+                    RowNumber(), partition_by=F(parent), order_by=ordering
+                ),
+                loader_total=Window(Count('pk'), partition_by=F(parent)),
+            ).filter(loader_row__lte=limit).order_by(*ordering)
+        for row in batch:
+            rows[row.loader_key, limit].append(row)
+            if limit is not None:
+                totals[row.loader_key, limit] = row.loader_total
+    return [
+        rows[key] if key[1] is None else LeadingRows(rows[key], totals.get(key, 0))
+        for key in keys
+    ]
+
+
+def load_products_by_order(keys):
+    """Load the products of each order through the M2M table"""
+    return load_related(Product.objects.all(), 'orders__id', keys)
+
+
+def load_orders_by_customer(keys):
+    """Load the orders of each customer"""
+    return load_related(Order.objects.all(), 'customer_id', keys)
+
+
+def load_orders_by_product(keys):
+    """Load the orders containing each product through the M2M table"""
+    return load_related(Order.objects.all(), 'products__id', keys)
+
+
+class DeferredExecutionContext(BaseDeferredExecutionContext):
+    """Execution context that dispatches DataLoader batches.
+
+    graphql-core 3.2.4 added a path argument to handle_field_error that
+    graphql-sync-dataloaders does not pass yet.
+    """
+
+    def handle_field_error(self, error, return_type, path=None):
+        return super().handle_field_error(error, return_type, path)
+
+
+class Loaders:
+    """DataLoaders shared by every resolver of one GraphQL request.
+
+    The related-row loaders take (pk, limit) keys, see load_related.
+    """
+
+    def __init__(self):
+        self.customer = SyncDataLoader(load_customers)
+        self.order_products = SyncDataLoader(load_products_by_order)
+        self.customer_orders = SyncDataLoader(load_orders_by_customer)
+        self.product_orders = SyncDataLoader(load_orders_by_product)
+
+
+async def load_in_thread(context, load, keys):
+    return await run_in_thread(context, load, keys)
+
+
+class AsyncLoaders:
+    """Loaders of an asynchronous execution, batching in the ORM thread pool.
+
+    Batches of different loaders, e.g. the customers and the products of
+    the same orders, are loaded concurrently.
+    """
+
+    def __init__(self, context):
+        def loader(load):
+            return DataLoader(partial(load_in_thread, context, load))
+
+        self.customer = loader(load_customers)
+        self.order_products = loader(load_products_by_order)
+        self.customer_orders = loader(load_orders_by_customer)
+        self.product_orders = loader(load_orders_by_product)
+
+
+def get_loaders(info):
+    """Return the loaders stored on the request context, creating them once"""
+    context = info.context
+    loaders = getattr(context, 'loaders', None)
+    if loaders is None:
+        loaders = AsyncLoaders(context) if is_async(info) else Loaders()
+        if context is not None:
+            context.loaders = loaders
+    return loaders
+
+
+def forget_loaders(context):
+    """Drop the loaders of a request context, and the rows they cached"""
+    if getattr(context, 'loaders', None) is not None:
+        context.loaders = None
+
+
+def then(value, callback):
+    """Apply callback to value once it is resolved, keeping futures lazy"""
+    if isawaitable(value):
+        async def await_then():
+            return callback(await value)
+        return await_then()
+    if not isinstance(value, SyncFuture):
+        return callback(value)
+    if value.done():
+        return callback(value.result())
+
+    result = SyncFuture()
+    result.deferred_callback = value.deferred_callback
+
+    def on_done():
+        try:
+            result.set_result(callback(value.result()))
+        except Exception as e:
+            result.set_exception(e)
+
+    value.add_done_callback(on_done)
+    return result
@@ -0,0 +1,57 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from crm.rollups import (
+    ROLLUP_CHUNK_DAYS,
+    ROLLUP_REFRESH_LAG,
+    order_day_range,
+    rebuild_rollup_range,
+    set_watermark,
+)
+
+
+class Command(BaseCommand):
+    help = "Rebuild DailyOrderRollup from orders, a range of days at a time"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start',
+            type=date.fromisoformat,
+            help='First day to rebuild (YYYY-MM-DD), default the first order',
+        )
+        parser.add_argument(
+            '--end',
+            type=date.fromisoformat,
+            help='Last day to rebuild (YYYY-MM-DD), default the last order',
+        )
+        parser.add_argument(
+            '--chunk-days',
+            type=int,
+            default=ROLLUP_CHUNK_DAYS,
+            help='Days rebuilt per transaction',
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_days'] < 1:
+            raise CommandError("--chunk-days must be at least 1")
+
+        started = timezone.now()
+        first_order_day, last_order_day = order_day_range()
+        first_day = options['start'] or first_order_day
+        last_day = options['end'] or last_order_day
+        if first_day is None or last_day is None:
+            self.stdout.write("No orders to roll up")
+            return
+
+        written = rebuild_rollup_range(
+            first_day, last_day, options['chunk_days']
+        )
+        if not options['start'] and not options['end']:
+            # Everything up to now is rolled up, the refresh task can
+            # continue from here
+            set_watermark(started - ROLLUP_REFRESH_LAG)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {written} daily rollups from {first_day} to {last_day}"
+        ))
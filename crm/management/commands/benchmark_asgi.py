@@ -0,0 +1,125 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from crm.benchmarks import (
+    OPERATIONS,
+    is_query,
+    load_test_asgi,
+    load_test_wsgi,
+    sample_ids,
+    sql_latency,
+)
+from crm.seeding import seed_dataset
+
+QUERIES = sorted(name for name in OPERATIONS if is_query(name))
+
+# Endpoint and load test of each server interface
+PATHS = {
+    'wsgi': ('/graphql', load_test_wsgi),
+    'asgi': ('/graphql/async', load_test_asgi),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare throughput and latency of /graphql through WSGI with "
+        "/graphql/async through ASGI under concurrent load"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--orders',
+            type=int,
+            default=10000,
+            help='Orders in the seeded dataset',
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=200,
+            help='Requests sent per operation and concurrency level',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            nargs='+',
+            default=[1, 8, 32],
+            help='Clients sending requests at the same time',
+        )
+        parser.add_argument(
+            '--operations',
+            nargs='+',
+            choices=QUERIES,
+            default=['dashboard', 'allOrders', 'allCustomers.orders'],
+            metavar='OPERATION',
+            help='Queries to send',
+        )
+        parser.add_argument(
+            '--sql-latency',
+            type=float,
+            default=0.0,
+            help='Milliseconds added to every SQL query, like a database server',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Random seed of the dataset',
+        )
+        parser.add_argument(
+            '--output',
+            help='Write the results to this JSON file',
+        )
+
+    def handle(self, *args, **options):
+        if min(options['concurrency']) < 1:
+            raise CommandError("--concurrency must be at least 1")
+
+        # Seeded into a throwaway database, like benchmark_graphql
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            seed_dataset(options['orders'], seed=options['seed'])
+            with sql_latency(options['sql_latency']):
+                results = self.run(options)
+        except AssertionError as e:
+            raise CommandError(f"Request failed: {e}")
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def run(self, options):
+        ids = sample_ids()
+        results = {}
+        self.stdout.write(
+            f"{'operation':<22} {'clients':>7} {'server':<6} {'req/s':>8} "
+            f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+        )
+        for name in options['operations']:
+            document, variables = OPERATIONS[name]
+            body = {
+                'query': document,
+                'variables': variables(ids) if variables else None,
+            }
+            for concurrency in options['concurrency']:
+                for server, (path, load_test) in PATHS.items():
+                    # One request first, so documents are parsed and cached
+                    load_test(path, body, 1, 1)
+                    m = load_test(path, body, options['requests'], concurrency)
+                    self.stdout.write(
+                        f"{name:<22} {concurrency:>7} {server:<6} "
+                        f"{m['rps']:>8.1f} {m['p50_ms']:>9.2f} "
+                        f"{m['p95_ms']:>9.2f} {m['p99_ms']:>9.2f}"
+                    )
+                    results.setdefault(name, {}).setdefault(
+                        str(concurrency), {}
+                    )[server] = m
+        return results
@@ -0,0 +1,117 @@
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from crm.models import Customer
+from crm.schema import BulkCreateCustomers, CreateCustomer
+
+
+def legacy_bulk_create_customers(rows):
+    """Row-by-row import as BulkCreateCustomers did it before the rewrite"""
+    customers = []
+    errors = []
+
+    with transaction.atomic():
+        for idx, customer_data in enumerate(rows):
+            try:
+                if Customer.objects.filter(email=customer_data.email).exists():
+                    errors.append(
+                        f"Row {idx + 1}: Email '{customer_data.email}' already exists"
+                    )
+                    continue
+
+                if customer_data.phone and not CreateCustomer.validate_phone(
+                    customer_data.phone
+                ):
+                    errors.append(
+                        f"Row {idx + 1}: Invalid phone format for '{customer_data.phone}'"
+                    )
+                    continue
+
+                customer = Customer.objects.create(
+                    name=customer_data.name,
+                    email=customer_data.email,
+                    phone=customer_data.phone or None
+                )
+                customers.append(customer)
+            except Exception as e:
+                errors.append(f"Row {idx + 1}: {str(e)}")
+
+    return customers, errors
+
+
+def bulk_create_customers(rows):
+    """Import through the BulkCreateCustomers mutation"""
+    payload = BulkCreateCustomers.mutate(None, None, rows)
+    return payload.customers, payload.errors
+
+
+def make_rows(size):
+    """Build an import batch with a few duplicate and invalid rows"""
+    rows = []
+    for i in range(size):
+        rows.append(SimpleNamespace(
+            name=f"Benchmark Customer {i}",
+            # Every 100th row repeats the previous email
+            email=f"bench{i - 1 if i % 100 == 99 else i}@example.com",
+            # Every 50th row has a malformed phone
+            phone="12345" if i % 50 == 0 else f"+1{i:010d}",
+        ))
+    return rows
+
+
+class Command(BaseCommand):
+    help = "Compare BulkCreateCustomers against the row-by-row import"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[1000, 10000, 100000],
+            help='Batch sizes to import',
+        )
+        parser.add_argument(
+            '--skip-legacy',
+            action='store_true',
+            help='Only time the current implementation',
+        )
+
+    def handle(self, *args, **options):
+        implementations = [('bulk', bulk_create_customers)]
+        if not options['skip_legacy']:
+            implementations.insert(0, ('legacy', legacy_bulk_create_customers))
+
+        self.stdout.write(
+            f"{'rows':>8} {'impl':>8} {'seconds':>10} {'queries':>9} "
+            f"{'created':>8} {'errors':>7}"
+        )
+        for size in options['sizes']:
+            rows = make_rows(size)
+            for label, implementation in implementations:
+                elapsed, queries, created, errors = self.measure(
+                    implementation, rows
+                )
+                self.stdout.write(
+                    f"{size:>8} {label:>8} {elapsed:>10.3f} {queries:>9} "
+                    f"{created:>8} {errors:>7}"
+                )
+
+    def measure(self, implementation, rows):
+        """Run one import and roll it back so every run starts empty"""
+        queries = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with transaction.atomic():
+            with connection.execute_wrapper(count_queries):
+                start = time.perf_counter()
+                customers, errors = implementation(rows)
+                elapsed = time.perf_counter() - start
+            transaction.set_rollback(True)
+        return elapsed, queries, len(customers), len(errors)
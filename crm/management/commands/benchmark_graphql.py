@@ -0,0 +1,141 @@
+import json
+import platform
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from alx_backend_graphql_crm.schema import schema
+from crm.benchmarks import (
+    OPERATIONS,
+    REGRESSION_THRESHOLD,
+    compare_results,
+    run_benchmarks,
+)
+from crm.seeding import clear_dataset, seed_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every GraphQL query and mutation on seeded datasets, "
+        "optionally comparing against an earlier run"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scales',
+            type=int,
+            nargs='+',
+            default=[1000, 10000, 100000],
+            help='Orders in each seeded dataset',
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=30,
+            help='Timed runs of each operation',
+        )
+        parser.add_argument(
+            '--operations',
+            nargs='+',
+            choices=sorted(OPERATIONS),
+            metavar='OPERATION',
+            help='Only run these operations',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Random seed of the datasets',
+        )
+        parser.add_argument(
+            '--output',
+            help='Write the results to this JSON file',
+        )
+        parser.add_argument(
+            '--compare',
+            metavar='BASELINE',
+            help='JSON file of an earlier run to flag regressions against',
+        )
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=REGRESSION_THRESHOLD,
+            help='Relative slowdown reported as a regression (default 0.2)',
+        )
+        parser.add_argument(
+            '--keepdb',
+            action='store_true',
+            help='Keep the benchmark database between runs',
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        # Datasets are seeded into a throwaway database, like the tests
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False,
+            keepdb=options['keepdb'],
+        )
+        try:
+            results = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options['keepdb']
+            )
+
+        report = {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'seed': options['seed'],
+                'iterations': options['iterations'],
+                'database': connection.vendor,
+                'django': django.get_version(),
+                'python': platform.python_version(),
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if baseline is not None:
+            self.compare(baseline['results'], results, options['threshold'])
+
+    def run(self, options):
+        results = {}
+        self.stdout.write(
+            f"{'scale':>8} {'operation':<26} {'p50 ms':>9} {'p95 ms':>9} "
+            f"{'p99 ms':>9} {'queries':>8} {'peak KB':>9}"
+        )
+        for scale in options['scales']:
+            clear_dataset()
+            seed_dataset(scale, seed=options['seed'])
+            measurements = run_benchmarks(
+                schema, options['iterations'], options['operations']
+            )
+            for name, m in measurements.items():
+                self.stdout.write(
+                    f"{scale:>8} {name:<26} {m['p50_ms']:>9.2f} "
+                    f"{m['p95_ms']:>9.2f} {m['p99_ms']:>9.2f} "
+                    f"{m['queries']:>8} {m['peak_kb']:>9.1f}"
+                )
+            results[str(scale)] = measurements
+        return results
+
+    def compare(self, baseline, results, threshold):
+        regressions = compare_results(baseline, results, threshold)
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS("No regressions"))
+            return
+        for scale, name, metric, before, after in regressions:
+            self.stdout.write(self.style.ERROR(
+                f"{scale:>8} {name:<26} {metric:<8} {before} -> {after}"
+            ))
+        raise CommandError(f"{len(regressions)} regressions beyond {threshold:.0%}")
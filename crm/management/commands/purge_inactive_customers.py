@@ -0,0 +1,101 @@
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from crm.models import Order
+from crm.retention import (
+    PURGE_BATCH_SIZE,
+    next_inactive_batch,
+    purge_inactive_batch,
+)
+
+
+def parse_cutoff(value):
+    cutoff = datetime.fromisoformat(value)
+    if timezone.is_naive(cutoff):
+        cutoff = timezone.make_aware(cutoff)
+    return cutoff
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete customers without recent orders, and their orders, "
+        "in small batches"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=365,
+            help='Customers inactive for this many days are deleted',
+        )
+        parser.add_argument(
+            '--cutoff',
+            type=parse_cutoff,
+            help='Inactive since this ISO datetime, overrides --days',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=PURGE_BATCH_SIZE,
+            help='Customers deleted per transaction',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.0,
+            help='Seconds to pause between batches',
+        )
+        parser.add_argument(
+            '--after',
+            type=int,
+            default=0,
+            help='Resume after this customer id',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count the customers and orders that would be deleted',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1")
+        cutoff = options['cutoff'] or timezone.now() - timedelta(days=options['days'])
+        batch_size = options['batch_size']
+        after = options['after']
+        customers = orders = 0
+        self.stdout.write(f"Purging customers inactive since {cutoff.isoformat()}")
+
+        try:
+            while True:
+                if options['dry_run']:
+                    pks = next_inactive_batch(cutoff, after, batch_size)
+                    deleted = Order.objects.filter(customer_id__in=pks).count()
+                else:
+                    pks, deleted = purge_inactive_batch(cutoff, after, batch_size)
+                if not pks:
+                    break
+                customers += len(pks)
+                orders += deleted
+                after = pks[-1]
+                self.stdout.write(
+                    f"{len(pks)} customers, {deleted} orders, up to id {after}"
+                )
+                if options['sleep']:
+                    # Leaves room for the site's own writes between batches
+                    time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING(
+                f"Interrupted, resume with --after {after} "
+                f"--cutoff {cutoff.isoformat()}"
+            ))
+            raise CommandError(f"Stopped after {customers} customers")
+
+        verb = "Would delete" if options['dry_run'] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {customers} inactive customers and {orders} orders"
+        ))
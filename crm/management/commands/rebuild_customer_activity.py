@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Min
+
+from crm.activity import rebuild_customer_activity
+from crm.cache import bump_versions
+from crm.models import Customer
+
+
+class Command(BaseCommand):
+    help = "Recompute order_count, lifetime_value and last_order_at from orders"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=10000,
+            help='Customers updated per statement',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        bounds = Customer.objects.aggregate(low=Min('pk'), high=Max('pk'))
+        if bounds['low'] is None:
+            self.stdout.write("No customers to rebuild")
+            return
+
+        updated = 0
+        for start in range(bounds['low'], bounds['high'] + 1, chunk_size):
+            with transaction.atomic():
+                updated += rebuild_customer_activity(start, start + chunk_size)
+
+        bump_versions(Customer)
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt activity for {updated} customers")
+        )
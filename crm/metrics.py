@@ -0,0 +1,293 @@
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from inspect import isawaitable
+
+from django.conf import settings
+from django.db import connection
+from graphql import get_named_type, is_leaf_type
+
+from .cache import get_setting
+from .complexity import is_connection, is_edge
+
+# Upper bounds of the histogram buckets, in seconds and in SQL queries
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# Fraction of GraphQL requests measured
+METRICS_SAMPLE_RATE = 1.0
+
+# Label values kept per histogram, the rest are counted under OTHER_LABEL
+METRICS_MAX_SERIES = 1000
+OTHER_LABEL = '__other__'
+
+# Requests sending this header get their timings back in `extensions`
+DEBUG_HEADER = 'X-GraphQL-Debug'
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def escape_label(value):
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+class Histogram:
+    """Prometheus histogram with a single label, shared by all threads"""
+
+    def __init__(self, name, documentation, label, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_value)
+            if series is None:
+                if len(self.series) >= get_setting(
+                    'METRICS_MAX_SERIES', METRICS_MAX_SERIES
+                ):
+                    # Operation names come from clients, keep them bounded
+                    label_value = OTHER_LABEL
+                series = self.series.setdefault(
+                    label_value, [[0] * (len(self.buckets) + 1), 0]
+                )
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} histogram',
+        ]
+        with self.lock:
+            series = [
+                (label_value, list(counts), total)
+                for label_value, (counts, total) in sorted(self.series.items())
+            ]
+        for label_value, counts, total in series:
+            label = f'{self.label}="{escape_label(label_value)}"'
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}'
+                )
+            lines.append(f'{self.name}_sum{{{label}}} {total}')
+            lines.append(f'{self.name}_count{{{label}}} {cumulative}')
+        return lines
+
+
+OPERATION_SECONDS = Histogram(
+    'crm_graphql_operation_seconds',
+    'Wall time of GraphQL operations.',
+    'operation', SECONDS_BUCKETS,
+)
+OPERATION_QUERIES = Histogram(
+    'crm_graphql_operation_sql_queries',
+    'SQL queries run by GraphQL operations.',
+    'operation', QUERY_BUCKETS,
+)
+OPERATION_SQL_SECONDS = Histogram(
+    'crm_graphql_operation_sql_seconds',
+    'Time GraphQL operations spent in SQL queries.',
+    'operation', SECONDS_BUCKETS,
+)
+RESOLVER_SECONDS = Histogram(
+    'crm_graphql_resolver_seconds',
+    'Wall time spent per operation in the resolvers of a field path.',
+    'path', SECONDS_BUCKETS,
+)
+RESOLVER_QUERIES = Histogram(
+    'crm_graphql_resolver_sql_queries',
+    'SQL queries run per operation by the resolvers of a field path.',
+    'path', QUERY_BUCKETS,
+)
+RESOLVER_SQL_SECONDS = Histogram(
+    'crm_graphql_resolver_sql_seconds',
+    'Time spent per operation in SQL by the resolvers of a field path.',
+    'path', SECONDS_BUCKETS,
+)
+
+HISTOGRAMS = [
+    OPERATION_SECONDS,
+    OPERATION_QUERIES,
+    OPERATION_SQL_SECONDS,
+    RESOLVER_SECONDS,
+    RESOLVER_QUERIES,
+    RESOLVER_SQL_SECONDS,
+]
+
+
+def render_metrics():
+    """Return every histogram in the Prometheus text format"""
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines += histogram.render()
+    return '\n'.join(lines) + '\n'
+
+
+class OperationMetrics:
+    """Wall time and SQL of one GraphQL operation and of its resolvers.
+
+    Also a Django execute wrapper, counting the queries run while it is
+    installed on the connection, from any number of threads.
+    """
+
+    def __init__(self, debug=False):
+        self.debug = debug
+        self.operation = 'anonymous'
+        self.seconds = 0.0
+        self.queries = 0
+        self.sql_seconds = 0.0
+        # Field path -> [seconds, queries, SQL seconds, calls]
+        self.resolvers = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            with self.lock:
+                self.queries += 1
+                self.sql_seconds += time.perf_counter() - started
+
+    def add_resolver(self, path, seconds, queries, sql_seconds):
+        totals = self.resolvers.setdefault(path, [0.0, 0, 0.0, 0])
+        totals[0] += seconds
+        totals[1] += queries
+        totals[2] += sql_seconds
+        totals[3] += 1
+
+    def observe(self):
+        OPERATION_SECONDS.observe(self.operation, self.seconds)
+        OPERATION_QUERIES.observe(self.operation, self.queries)
+        OPERATION_SQL_SECONDS.observe(self.operation, self.sql_seconds)
+        for path, (seconds, queries, sql_seconds, _) in self.resolvers.items():
+            RESOLVER_SECONDS.observe(path, seconds)
+            RESOLVER_QUERIES.observe(path, queries)
+            RESOLVER_SQL_SECONDS.observe(path, sql_seconds)
+
+    def summary(self):
+        """Timings for the response's extensions, in milliseconds"""
+        return {
+            'operation': self.operation,
+            'duration': round(self.seconds * 1000, 3),
+            'sqlQueries': self.queries,
+            'sqlDuration': round(self.sql_seconds * 1000, 3),
+            'resolvers': [
+                {
+                    'path': path,
+                    'calls': calls,
+                    'duration': round(seconds * 1000, 3),
+                    'sqlQueries': queries,
+                    'sqlDuration': round(sql_seconds * 1000, 3),
+                }
+                for path, (seconds, queries, sql_seconds, calls)
+                in self.resolvers.items()
+            ],
+        }
+
+
+def wants_debug(request):
+    """Debug timings are returned to staff, or to anyone when DEBUG is on"""
+    if not request.headers.get(DEBUG_HEADER):
+        return False
+    user = getattr(request, 'user', None)
+    return settings.DEBUG or bool(user and user.is_staff)
+
+
+@contextmanager
+def measure_operation(request):
+    """Measure a GraphQL request if it is sampled, yielding its metrics.
+
+    Yields None for requests left out of the sample. Requests asking for
+    debug timings are always measured.
+    """
+    debug = wants_debug(request)
+    sample_rate = get_setting('METRICS_SAMPLE_RATE', METRICS_SAMPLE_RATE)
+    if not debug and random.random() >= sample_rate:
+        yield None
+        return
+
+    metrics = OperationMetrics(debug)
+    request.graphql_metrics = metrics
+    started = time.perf_counter()
+    try:
+        with connection.execute_wrapper(metrics):
+            yield metrics
+    finally:
+        metrics.seconds = time.perf_counter() - started
+        request.graphql_metrics = None
+        metrics.observe()
+
+
+def set_operation_name(request, operation_ast):
+    metrics = getattr(request, 'graphql_metrics', None)
+    if metrics is not None and operation_ast is not None and operation_ast.name:
+        metrics.operation = operation_ast.name.value
+
+
+def field_path(path):
+    """Response path without list indexes, e.g. allOrders.edges.node.customer"""
+    keys = []
+    while path is not None:
+        if isinstance(path.key, str):
+            keys.append(path.key)
+        path = path.prev
+    return '.'.join(reversed(keys))
+
+
+async def finally_call(awaitable, callback):
+    try:
+        return await awaitable
+    finally:
+        callback()
+
+
+class ResolverMetricsMiddleware:
+    """Graphene middleware timing the resolvers of measured operations.
+
+    Scalars and the edges/node wrappers of connections only read objects
+    already loaded, so they are not timed. Batches of the DataLoaders run
+    after their resolvers return and count towards the operation only.
+    In asynchronous executions a resolver is timed until its result is
+    awaited, and its SQL includes that of the resolvers run meanwhile.
+    """
+
+    def resolve(self, next, root, info, **args):
+        metrics = getattr(info.context, 'graphql_metrics', None)
+        if (
+            metrics is None
+            or is_leaf_type(get_named_type(info.return_type))
+            or is_connection(info.parent_type)
+            or is_edge(info.parent_type)
+        ):
+            return next(root, info, **args)
+
+        queries, sql_seconds = metrics.queries, metrics.sql_seconds
+        started = time.perf_counter()
+
+        def record():
+            metrics.add_resolver(
+                field_path(info.path),
+                time.perf_counter() - started,
+                metrics.queries - queries,
+                metrics.sql_seconds - sql_seconds,
+            )
+
+        try:
+            result = next(root, info, **args)
+        except Exception:
+            record()
+            raise
+        if isawaitable(result):
+            return finally_call(result, record)
+        record()
+        return result
@@ -0,0 +1,52 @@
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def rebuild_activity(apps, schema_editor):
+    Customer = apps.get_model('crm', 'Customer')
+    Order = apps.get_model('crm', 'Order')
+    orders = Order.objects.filter(
+        customer=OuterRef('pk')
+    ).order_by().values('customer')
+    Customer.objects.update(
+        order_count=Coalesce(
+            Subquery(orders.annotate(value=Count('pk')).values('value')),
+            Value(0),
+        ),
+        lifetime_value=Coalesce(
+            Subquery(orders.annotate(value=Sum('total_amount')).values('value')),
+            Value(Decimal('0.00')),
+        ),
+        last_order_at=Subquery(
+            orders.annotate(value=Max('order_date')).values('value')
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='order_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='lifetime_value',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=Decimal('0.00'), max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='last_order_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(rebuild_activity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+from django.db import migrations, models
+
+PHONE_INDEX = 'crm_customer_phone_idx'
+
+
+def create_phone_index(apps, schema_editor):
+    # phone_pattern runs LIKE 'prefix%': SQLite's LIKE is case-insensitive and
+    # needs a NOCASE index, PostgreSQL needs a pattern_ops index
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        column = 'phone COLLATE NOCASE'
+    elif vendor == 'postgresql':
+        column = 'phone varchar_pattern_ops'
+    else:
+        column = 'phone'
+    schema_editor.execute(
+        f'CREATE INDEX {PHONE_INDEX} ON crm_customer ({column})'
+    )
+
+
+def drop_phone_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute(f'DROP INDEX {PHONE_INDEX} ON crm_customer')
+    else:
+        schema_editor.execute(f'DROP INDEX {PHONE_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0002_customer_activity'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['-created_at'], name='crm_customer_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name'], name='crm_product_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['stock', 'name'], name='crm_product_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price', 'name'], name='crm_product_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['-order_date'], name='crm_order_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['total_amount', '-order_date'], name='crm_order_total_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer', '-order_date'], name='crm_order_customer_date_idx'),
+        ),
+        migrations.RunPython(create_phone_index, drop_phone_index),
+    ]
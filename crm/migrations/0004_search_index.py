@@ -0,0 +1,96 @@
+from django.db import migrations
+
+# Columns covered by the full-text index of each table
+SEARCH_COLUMNS = {
+    'crm_customer': ['name', 'email'],
+    'crm_product': ['name'],
+}
+
+
+def sqlite_search_index(table, columns):
+    # External-content FTS5 table: the index is stored once, the text is
+    # read from the model table, and triggers keep both in sync
+    fts = f'{table}_fts'
+    names = ', '.join(columns)
+    new = ', '.join(f'new.{column}' for column in columns)
+    old = ', '.join(f'old.{column}' for column in columns)
+    delete = (
+        f"INSERT INTO {fts}({fts}, rowid, {names}) "
+        f"VALUES ('delete', old.id, {old});"
+    )
+    insert = f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new});"
+    return [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({names}, "
+        f"content='{table}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER {fts}_insert AFTER INSERT ON {table} "
+        f"BEGIN {insert} END",
+        f"CREATE TRIGGER {fts}_delete AFTER DELETE ON {table} "
+        f"BEGIN {delete} END",
+        f"CREATE TRIGGER {fts}_update AFTER UPDATE OF {names} ON {table} "
+        f"BEGIN {delete} {insert} END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def postgresql_search_index(table, columns):
+    # Same expression as crm.search.SearchExpression.postgresql_vector
+    document = " || ' ' || ".join(
+        f"coalesce({column}, '')" for column in columns
+    )
+    statements = [
+        f"CREATE INDEX {table}_search_idx ON {table} "
+        f"USING gin (to_tsvector('simple', {document}))",
+    ]
+    # Trigram indexes serve the existing icontains filters, which
+    # compile to UPPER(column::text) LIKE UPPER(%s)
+    statements += [
+        f"CREATE INDEX {table}_{column}_trgm_idx ON {table} "
+        f"USING gin ((UPPER({column}::text)) gin_trgm_ops)"
+        for column in columns
+    ]
+    return statements
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        statements = []
+        for table, columns in SEARCH_COLUMNS.items():
+            statements += sqlite_search_index(table, columns)
+    elif vendor == 'postgresql':
+        statements = ['CREATE EXTENSION IF NOT EXISTS pg_trgm']
+        for table, columns in SEARCH_COLUMNS.items():
+            statements += postgresql_search_index(table, columns)
+    else:
+        # Other backends fall back to substring matching
+        statements = []
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table, columns in SEARCH_COLUMNS.items():
+        if vendor == 'sqlite':
+            fts = f'{table}_fts'
+            for trigger in ('insert', 'delete', 'update'):
+                schema_editor.execute(f'DROP TRIGGER IF EXISTS {fts}_{trigger}')
+            schema_editor.execute(f'DROP TABLE IF EXISTS {fts}')
+        elif vendor == 'postgresql':
+            schema_editor.execute(f'DROP INDEX IF EXISTS {table}_search_idx')
+            for column in columns:
+                schema_editor.execute(
+                    f'DROP INDEX IF EXISTS {table}_{column}_trgm_idx'
+                )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0003_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
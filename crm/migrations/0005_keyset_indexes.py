@@ -0,0 +1,37 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Keyset pagination orders by the default ordering plus the primary
+    # key, so the default-ordering indexes carry the key as well
+
+    dependencies = [
+        ('crm', '0004_search_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='customer',
+            name='crm_customer_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['-created_at', '-id'], name='crm_customer_created_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='crm_product_name_idx',
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name', 'id'], name='crm_product_name_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='order',
+            name='crm_order_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['-order_date', '-id'], name='crm_order_date_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+from django.db import migrations
+
+# Columns matched as substrings by the customer_name and product_name
+# filters of OrderFilter
+SUBSTRING_COLUMNS = {
+    'crm_customer': 'name',
+    'crm_product': 'name',
+}
+
+
+def sqlite_substring_index(table, column):
+    # Trigram FTS5 table: a quoted phrase matches any substring of three
+    # characters or more, in any case, like the icontains it replaces
+    trgm = f'{table}_trgm'
+    delete = (
+        f"INSERT INTO {trgm}({trgm}, rowid, {column}) "
+        f"VALUES ('delete', old.id, old.{column});"
+    )
+    insert = f"INSERT INTO {trgm}(rowid, {column}) VALUES (new.id, new.{column});"
+    return [
+        f"CREATE VIRTUAL TABLE {trgm} USING fts5({column}, "
+        f"content='{table}', content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER {trgm}_insert AFTER INSERT ON {table} "
+        f"BEGIN {insert} END",
+        f"CREATE TRIGGER {trgm}_delete AFTER DELETE ON {table} "
+        f"BEGIN {delete} END",
+        f"CREATE TRIGGER {trgm}_update AFTER UPDATE OF {column} ON {table} "
+        f"BEGIN {delete} {insert} END",
+        f"INSERT INTO {trgm}({trgm}) VALUES ('rebuild')",
+    ]
+
+
+def create_substring_index(apps, schema_editor):
+    # PostgreSQL serves icontains from the trigram indexes of 0004; other
+    # backends match substrings without an index
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, column in SUBSTRING_COLUMNS.items():
+        for statement in sqlite_substring_index(table, column):
+            schema_editor.execute(statement)
+
+
+def drop_substring_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table in SUBSTRING_COLUMNS:
+        trgm = f'{table}_trgm'
+        for trigger in ('insert', 'delete', 'update'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {trgm}_{trigger}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {trgm}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0007_order_date_default'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_substring_index, drop_substring_index),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 from decimal import Decimal
 
 
@@ -8,11 +9,24 @@ class Customer(models.Model):
     name = models.CharField(max_length=255)
     email = models.EmailField(unique=True)
     phone = models.CharField(max_length=20, blank=True, null=True)
+    # Order activity, maintained by CreateOrder and order deletes
+    order_count = models.PositiveIntegerField(default=0)
+    lifetime_value = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        db_index=True
+    )
+    last_order_at = models.DateTimeField(blank=True, null=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        # Phone prefix search uses a backend-specific index, see 0003
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='crm_customer_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.email})"
@@ -32,6 +46,11 @@ class Product(models.Model):
 
     class Meta:
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['name', 'id'], name='crm_product_name_idx'),
+            models.Index(fields=['stock', 'name'], name='crm_product_stock_idx'),
+            models.Index(fields=['price', 'name'], name='crm_product_price_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} - ${self.price}"
@@ -46,12 +65,26 @@ class Order(models.Model):
     )
     products = models.ManyToManyField(Product, related_name='orders')
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
-    order_date = models.DateTimeField(auto_now_add=True)
+    # Set by CreateOrder to the time of creation, by imports to their own
+    order_date = models.DateTimeField(default=timezone.now)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-order_date']
+        indexes = [
+            models.Index(fields=['-order_date', '-id'], name='crm_order_date_idx'),
+            models.Index(
+                fields=['total_amount', '-order_date'],
+                name='crm_order_total_idx'
+            ),
+            models.Index(
+                fields=['customer', '-order_date'],
+                name='crm_order_customer_date_idx'
+            ),
+            # Lets the rollup refresh find orders changed since its watermark
+            models.Index(fields=['updated_at'], name='crm_order_updated_idx'),
+        ]
 
     def __str__(self):
         return f"Order #{self.id} - {self.customer.name} - ${self.total_amount}"
@@ -59,3 +92,31 @@ class Order(models.Model):
     def calculate_total(self):
         """Calculate total amount from associated products"""
         return sum(product.price for product in self.products.all())
+
+
+class DailyOrderRollup(models.Model):
+    """Orders, revenue and distinct customers per day (see crm.rollups)"""
+    date = models.DateField(unique=True)
+    order_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=Decimal('0.00')
+    )
+    customer_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"{self.date}: {self.order_count} orders, ${self.revenue}"
+
+
+class RollupWatermark(models.Model):
+    """Time up to which a rollup has folded in changed rows"""
+    name = models.CharField(max_length=100, unique=True)
+    value = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} @ {self.value}"
@@ -0,0 +1,161 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from graphene.utils.str_converters import to_snake_case
+from graphene_django.settings import graphene_settings
+from graphql import GraphQLError, get_named_type
+from graphql.execution.collect_fields import collect_sub_fields
+from graphql.execution.values import get_argument_values
+
+from .pagination import rows_needed
+
+
+def page_attr(name):
+    """Attribute a relation's leading rows are prefetched to, see build_plan"""
+    return f'{name}_page'
+
+
+def prefetched_rows(instance, name):
+    """Return the rows of a relation loaded by prefetch_related, or None"""
+    rows = getattr(instance, page_attr(name), None)
+    if rows is not None:
+        return rows
+    if name in getattr(instance, '_prefetched_objects_cache', {}):
+        return list(getattr(instance, name).all())
+    return None
+
+
+def selected_fields(info, graphql_type, field_nodes):
+    """Group the fields selected on graphql_type by field name.
+
+    Fragments, aliases and @skip/@include are resolved the same way the
+    executor resolves them.
+    """
+    fields = collect_sub_fields(
+        info.schema,
+        info.fragments,
+        info.variable_values,
+        graphql_type,
+        field_nodes,
+    )
+    selected = {}
+    for nodes in fields.values():
+        selected.setdefault(nodes[0].name.value, []).extend(nodes)
+    return selected
+
+
+def node_fields(info, connection_type, field_nodes):
+    """Return the node type of a connection and the nodes under edges.node"""
+    edge_type = get_named_type(connection_type.fields['edges'].type)
+    node_type = get_named_type(edge_type.fields['node'].type)
+
+    edges = selected_fields(info, connection_type, field_nodes).get('edges')
+    if not edges:
+        return node_type, []
+    return node_type, selected_fields(info, edge_type, edges).get('node', [])
+
+
+def prefetch_limit(info, field_def, connection_type, field_nodes):
+    """Rows to prefetch per parent for a nested connection, or None for all.
+
+    The page of each node is read from the prefetched list, plus one row
+    telling whether a next page follows. totalCount counts that list, so
+    selecting it prefetches every row.
+    """
+    if 'totalCount' in selected_fields(info, connection_type, field_nodes):
+        return None
+    limits = []
+    for node in field_nodes:
+        try:
+            args = get_argument_values(field_def, node, info.variable_values)
+        except GraphQLError:
+            return None
+        limits.append(
+            rows_needed(args, graphene_settings.RELAY_CONNECTION_MAX_LIMIT)
+        )
+    if not limits or None in limits:
+        return None
+    return max(limits) + 1
+
+
+def build_plan(info, model, graphql_type, field_nodes, prefix=''):
+    """Work out only(), select_related and prefetch_related for a selection.
+
+    Forward foreign keys are joined and walked recursively, reverse and
+    many-to-many connections become Prefetch objects with their own plan,
+    limited per parent to the rows their page needs.
+    """
+    only = [prefix + model._meta.pk.name]
+    select_related = []
+    prefetch = []
+
+    for name, nodes in selected_fields(info, graphql_type, field_nodes).items():
+        try:
+            field = model._meta.get_field(to_snake_case(name))
+        except FieldDoesNotExist:
+            continue
+        field_type = get_named_type(graphql_type.fields[name].type)
+
+        if field.many_to_one:
+            path = prefix + field.name
+            only.append(path)
+            select_related.append(path)
+            sub_only, sub_select, sub_prefetch = build_plan(
+                info, field.related_model, field_type, nodes, path + '__'
+            )
+            only.extend(sub_only)
+            select_related.extend(sub_select)
+            prefetch.extend(sub_prefetch)
+        elif field.one_to_many or field.many_to_many:
+            node_type, nested = node_fields(info, field_type, nodes)
+            sub_only, sub_select, sub_prefetch = build_plan(
+                info, field.related_model, node_type, nested
+            )
+            if field.one_to_many:
+                # Prefetching a reverse FK matches rows on the FK column
+                sub_only.append(field.field.name)
+            queryset = apply_plan(
+                field.related_model._default_manager.all(),
+                sub_only,
+                sub_select,
+                sub_prefetch,
+            )
+            limit = prefetch_limit(
+                info, graphql_type.fields[name], field_type, nodes
+            )
+            if limit is None:
+                prefetch.append(Prefetch(prefix + field.name, queryset=queryset))
+            else:
+                # Django numbers the rows of each parent with ROW_NUMBER(),
+                # and only keeps a sliced prefetch in a to_attr list; pk
+                # breaks ties so the numbering and the ordering agree
+                ordering = [*field.related_model._meta.ordering, 'pk']
+                prefetch.append(Prefetch(
+                    prefix + field.name,
+                    queryset=queryset.order_by(*ordering)[:limit],
+                    to_attr=page_attr(field.name),
+                ))
+        elif field.concrete:
+            only.append(prefix + field.name)
+
+    return only, select_related, prefetch
+
+
+def apply_plan(queryset, only, select_related, prefetch):
+    """Apply a plan built by build_plan to a queryset"""
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset.only(*dict.fromkeys(only))
+
+
+def optimize(queryset, info):
+    """Shape a connection resolver's queryset after the client's selection.
+
+    Must be called before the queryset is evaluated; filtering, ordering
+    and slicing applied afterwards keep the optimization.
+    """
+    connection_type = get_named_type(info.return_type)
+    node_type, nodes = node_fields(info, connection_type, info.field_nodes)
+    plan = build_plan(info, queryset.model, node_type, nodes)
+    return apply_plan(queryset, *plan)
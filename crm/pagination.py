@@ -0,0 +1,220 @@
+import datetime
+import decimal
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import BooleanField, Expression, F, Q, Value
+from django.db.models.constants import LOOKUP_SEP
+from graphql import GraphQLError
+from graphql_relay import get_offset_with_default
+from graphql_relay.utils import base64, unbase64
+
+# Prefix of cursors carrying a sort key, offset cursors use "arrayconnection:"
+KEYSET_PREFIX = 'keyset:'
+OFFSET_PREFIX = 'arrayconnection:'
+
+
+def get_path_field(model, path):
+    """Return the field a single-valued ordering path ends at, or None"""
+    field = None
+    for name in path.split(LOOKUP_SEP):
+        if field is not None:
+            # Nullable relations would add rows with a NULL key
+            if not (field.many_to_one or field.one_to_one) or field.null:
+                return None
+            model = field.related_model
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+    return field
+
+
+def get_sort_key(queryset):
+    """Return [(path, descending)] ordering queryset by a unique key.
+
+    The primary key is appended as a tie-breaker. Returns None when the
+    ordering cannot be paginated by key: random or expression ordering,
+    orderings through multi-valued or nullable columns, or a related
+    model's default ordering.
+    """
+    model = queryset.model
+    ordering = queryset.query.order_by or model._meta.ordering
+    key = []
+    for item in ordering:
+        if not isinstance(item, str) or item == '?':
+            return None
+        descending = item.startswith('-')
+        path = item.lstrip('-')
+        if path == 'pk':
+            path = model._meta.pk.name
+        field = get_path_field(model, path)
+        if field is None or not field.concrete or field.is_relation:
+            return None
+        if field.null:
+            # NULLs sort differently per database and compare to nothing
+            return None
+        key.append((path, descending))
+        if LOOKUP_SEP not in path and (field.primary_key or field.unique):
+            return key
+    key.append((model._meta.pk.name, key[-1][1] if key else False))
+    return key
+
+
+def order_by_key(queryset, key, reverse=False):
+    """Order queryset by key, optionally in the opposite direction"""
+    return queryset.order_by(*[
+        path if descending == reverse else f'-{path}'
+        for path, descending in key
+    ])
+
+
+class RowComparison(Expression):
+    """(a, b, ...) < (x, y, ...) comparison of columns against values"""
+    output_field = BooleanField()
+    conditional = True
+
+    def __init__(self, model, paths, operator, values):
+        super().__init__()
+        self.operator = operator
+        self.columns = [F(path) for path in paths]
+        self.values = [
+            Value(value, output_field=get_path_field(model, path))
+            for path, value in zip(paths, values)
+        ]
+
+    def get_source_expressions(self):
+        return [*self.columns, *self.values]
+
+    def set_source_expressions(self, exprs):
+        self.columns = exprs[:len(self.columns)]
+        self.values = exprs[len(self.columns):]
+
+    def as_sql(self, compiler, connection):
+        sql, params = {'columns': [], 'values': []}, []
+        for name in ('columns', 'values'):
+            for expression in getattr(self, name):
+                expression_sql, expression_params = compiler.compile(expression)
+                sql[name].append(expression_sql)
+                params.extend(expression_params)
+        columns, values = ', '.join(sql['columns']), ', '.join(sql['values'])
+        return f'({columns}) {self.operator} ({values})', params
+
+
+def after_key(model, key, values, reverse=False):
+    """Condition selecting the rows that sort after values.
+
+    When every column sorts the same way this is a row comparison
+    (a, b) > (x, y), which the database seeks to directly in an index on
+    (a, b). Mixed directions expand to a > x OR (a = x AND b > y), with a
+    leading a >= x conjunct so an index on a still bounds the scan.
+    """
+    directions = {descending for _, descending in key}
+    if len(directions) == 1:
+        operator = '<' if directions.pop() != reverse else '>'
+        return RowComparison(
+            model, [path for path, _ in key], operator, values
+        )
+
+    condition = Q()
+    for i, (path, descending) in enumerate(key):
+        lookup = 'lt' if descending != reverse else 'gt'
+        term = Q(**{f'{path}__{lookup}': values[i]})
+        for j, (earlier, _) in enumerate(key[:i]):
+            term &= Q(**{earlier: values[j]})
+        condition |= term
+    path, descending = key[0]
+    lookup = 'lte' if descending != reverse else 'gte'
+    return Q(**{f'{path}__{lookup}': values[0]}) & condition
+
+
+def annotate_key(queryset, key):
+    """Select the key of every row, even if the optimizer deferred it"""
+    return queryset.annotate(**{
+        f'keyset_{i}': F(path) for i, (path, _) in enumerate(key)
+    })
+
+
+def row_key(row, key):
+    return [getattr(row, f'keyset_{i}') for i in range(len(key))]
+
+
+def encode_value(value):
+    # Keep full precision, DjangoJSONEncoder drops microseconds
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return value
+
+
+def key_to_cursor(key, values):
+    """Encode a row's sort key, together with the ordering it belongs to"""
+    payload = {
+        'order': [f"{'-' if descending else ''}{path}" for path, descending in key],
+        'values': [encode_value(value) for value in values],
+    }
+    return base64(KEYSET_PREFIX + json.dumps(payload, separators=(',', ':')))
+
+
+def is_offset_cursor(cursor):
+    return cursor is not None and unbase64(cursor).startswith(OFFSET_PREFIX)
+
+
+def cursor_to_key(model, key, cursor):
+    """Decode a keyset cursor into values for key, validating it"""
+    raw = unbase64(cursor or '')
+    if not raw.startswith(KEYSET_PREFIX):
+        raise GraphQLError(f"Invalid cursor '{cursor}'.")
+    try:
+        payload = json.loads(raw[len(KEYSET_PREFIX):])
+        order, values = payload['order'], payload['values']
+    except (ValueError, KeyError, TypeError):
+        raise GraphQLError(f"Invalid cursor '{cursor}'.")
+    expected = [f"{'-' if descending else ''}{path}" for path, descending in key]
+    if order != expected or len(values) != len(key):
+        raise GraphQLError(
+            f"Cursor '{cursor}' was issued for a different ordering."
+        )
+    try:
+        return [
+            get_path_field(model, path).to_python(value)
+            for (path, _), value in zip(key, values)
+        ]
+    except ValidationError:
+        raise GraphQLError(f"Invalid cursor '{cursor}'.")
+
+
+def rows_needed(args, max_limit=None):
+    """Leading rows of a list that a nested page of args reads, or None.
+
+    Offset cursors and `offset` move the page down the list, `first`
+    (or max_limit without first/last) sets its length. Pages taken from
+    the end with `last` or `before` need every row.
+    """
+    if args.get('last') is not None or args.get('before'):
+        return None
+    first = args.get('first')
+    if first is None or (max_limit is not None and first > max_limit):
+        # Above max_limit the connection is rejected without reading rows
+        first = max_limit
+    if first is None:
+        return None
+    start = get_offset_with_default(args.get('after'), -1) + 1
+    return max(start, 0) + (args.get('offset') or 0) + max(first, 0)
+
+
+class LeadingRows(list):
+    """The first rows of a list of `total` rows.
+
+    len() is the length of the whole list, so graphene-django pages and
+    counts it like the full list, as long as the page lies within the
+    rows held, as rows_needed ensures.
+    """
+
+    def __init__(self, rows, total):
+        super().__init__(rows)
+        self.total = total
+
+    def __len__(self):
+        return self.total
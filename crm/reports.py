@@ -0,0 +1,150 @@
+from collections import Counter
+from datetime import datetime
+from decimal import Decimal
+
+from django.db.models import Count, Max, Min, Sum
+from django.utils import timezone
+
+from .models import Customer, Order, Product
+
+# Customer ids aggregated by one report subtask
+REPORT_PARTITION_SIZE = 5000
+
+# Breakdowns a report may add to its totals
+REPORT_BREAKDOWNS = ('customers', 'products')
+
+
+def cents(value):
+    """Money as a string, rounded to cents as SQLite sums are floats"""
+    return str((value or Decimal('0')).quantize(Decimal('0.01')))
+
+
+def parse_datetime(value):
+    """Datetime of an ISO string passed through the task queue, or None"""
+    if value is None:
+        return None
+    value = datetime.fromisoformat(value)
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def customer_partitions(partition_size=REPORT_PARTITION_SIZE):
+    """Split the customer ids into [low, high) ranges of partition_size ids.
+
+    Partitions hold every order of their customers, so distinct customer
+    counts and per-customer rows of different partitions never overlap
+    and merge by addition.
+    """
+    bounds = Customer.objects.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        # A chord needs one subtask to call its callback
+        return [(0, 0)]
+    return [
+        (low, min(low + partition_size, bounds['high'] + 1))
+        for low in range(bounds['low'], bounds['high'] + 1, partition_size)
+    ]
+
+
+def partition_orders(low, high, since=None, until=None, prefix=''):
+    """Filter arguments for the orders of customers low <= id < high.
+
+    With a prefix such as 'order__', the arguments filter a model
+    related to Order instead.
+    """
+    filters = {
+        f'{prefix}customer_id__gte': low,
+        f'{prefix}customer_id__lt': high,
+    }
+    if since is not None:
+        filters[f'{prefix}order_date__gte'] = parse_datetime(since)
+    if until is not None:
+        filters[f'{prefix}order_date__lt'] = parse_datetime(until)
+    return filters
+
+
+def aggregate_partition(low, high, since=None, until=None, breakdowns=()):
+    """Aggregate the orders of one customer id range.
+
+    Returns a JSON serializable partial for merge_partials: order count,
+    revenue, distinct customers and the orders containing each product,
+    plus orders and revenue per customer if 'customers' is in breakdowns.
+    Each aggregate is one indexed query over the range.
+    """
+    orders = Order.objects.filter(**partition_orders(low, high, since, until))
+    totals = orders.aggregate(
+        order_count=Count('pk'),
+        revenue=Sum('total_amount'),
+        customer_count=Count('customer_id', distinct=True),
+    )
+    OrderProduct = Order.products.through
+    units = (
+        OrderProduct.objects
+        .filter(**partition_orders(low, high, since, until, prefix='order__'))
+        .values_list('product_id')
+        .annotate(units=Count('pk'))
+        .order_by()
+    )
+    partial = {
+        'order_count': totals['order_count'],
+        'revenue': cents(totals['revenue']),
+        'customer_count': totals['customer_count'],
+        'product_units': [list(row) for row in units],
+    }
+    if 'customers' in breakdowns:
+        partial['customers'] = [
+            [customer_id, count, cents(revenue)]
+            for customer_id, count, revenue in orders
+            .values_list('customer_id')
+            .annotate(count=Count('pk'), revenue=Sum('total_amount'))
+            .order_by()
+        ]
+    return partial
+
+
+def merge_partials(partials, breakdowns=(), top=None):
+    """Merge the partials of every partition into one report.
+
+    Products and customers of the breakdowns are listed by units and
+    revenue, the top ones only if top is given.
+    """
+    product_units = Counter()
+    customers = []
+    for partial in partials:
+        product_units.update(dict(partial['product_units']))
+        customers.extend(partial.get('customers', ()))
+
+    report = {
+        'order_count': sum(partial['order_count'] for partial in partials),
+        'revenue': cents(sum(Decimal(partial['revenue']) for partial in partials)),
+        'customer_count': sum(partial['customer_count'] for partial in partials),
+        'units': sum(product_units.values()),
+    }
+
+    if 'products' in breakdowns:
+        ranked = product_units.most_common(top)
+        names = Product.objects.in_bulk([pk for pk, _ in ranked])
+        report['products'] = [
+            {
+                'id': pk,
+                'name': names[pk].name if pk in names else None,
+                'units': units,
+            }
+            for pk, units in ranked
+        ]
+
+    if 'customers' in breakdowns:
+        customers.sort(key=lambda row: Decimal(row[2]), reverse=True)
+        if top is not None:
+            customers = customers[:top]
+        names = Customer.objects.in_bulk([row[0] for row in customers])
+        report['customers'] = [
+            {
+                'id': pk,
+                'name': names[pk].name if pk in names else None,
+                'orders': count,
+                'revenue': revenue,
+            }
+            for pk, count, revenue in customers
+        ]
+    return report
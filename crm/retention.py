@@ -0,0 +1,71 @@
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.db.models.functions import TruncDate
+
+from .cache import bump_versions
+from .models import Customer, Order, Product
+from .rollups import rebuild_days
+from .signals import bulk_delete
+
+# Customers deleted per transaction by purge_inactive_batch
+PURGE_BATCH_SIZE = 200
+
+
+def inactive_customers(cutoff):
+    """Customers who signed up before cutoff and ordered nothing since.
+
+    The NOT EXISTS anti-join probes the (customer, -order_date) index of
+    each customer instead of aggregating every order.
+    """
+    recent_orders = Order.objects.filter(
+        customer=OuterRef('pk'), order_date__gte=cutoff
+    )
+    return Customer.objects.filter(created_at__lt=cutoff).filter(
+        ~Exists(recent_orders)
+    )
+
+
+def next_inactive_batch(cutoff, after=0, batch_size=PURGE_BATCH_SIZE):
+    """Return the ids of the next batch_size inactive customers after `after`"""
+    return list(
+        inactive_customers(cutoff)
+        .filter(pk__gt=after)
+        .order_by('pk')
+        .values_list('pk', flat=True)[:batch_size]
+    )
+
+
+def purge_inactive_batch(cutoff, after=0, batch_size=PURGE_BATCH_SIZE):
+    """Delete the next batch of inactive customers and their orders.
+
+    Runs in one short transaction. The batch is selected and locked
+    inside it, so a customer ordering meanwhile is skipped. The
+    customers are deleted through QuerySet.delete() with the per-row
+    delete handlers skipped: the days of their orders are read first,
+    then rebuilt once each, and the result cache versions are bumped
+    once, so a batch costs the same number of queries however many
+    orders it deletes. Returns (customer ids, orders deleted).
+    """
+    with transaction.atomic():
+        pks = list(
+            inactive_customers(cutoff)
+            .filter(pk__gt=after)
+            .order_by('pk')
+            .select_for_update()
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not pks:
+            return [], 0
+
+        days = list(
+            Order.objects.filter(customer_id__in=pks)
+            .annotate(day=TruncDate('order_date'))
+            .order_by('day')
+            .values_list('day', flat=True)
+            .distinct()
+        )
+        with bulk_delete():
+            _, deleted = Customer.objects.filter(pk__in=pks).delete()
+        rebuild_days(days)
+        bump_versions(Customer, Order, Product)
+    return pks, deleted.get(Order._meta.label, 0)
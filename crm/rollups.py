@@ -0,0 +1,215 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyOrderRollup, Order, RollupWatermark
+
+# Days recomputed per transaction by rebuild_daily_rollups
+ROLLUP_CHUNK_DAYS = 31
+
+# Orders changed this recently are left to the next refresh, so rows
+# committed late by long transactions are not skipped by the watermark
+ROLLUP_REFRESH_LAG = timedelta(minutes=5)
+
+WATERMARK_NAME = 'daily_order_rollup'
+
+# Days of the orders deleted inside deferred_rollups, None outside it
+_deferred_days = ContextVar('deferred_rollup_days', default=None)
+
+
+def day_bounds(day):
+    """Return the [start, end) datetimes of day in the current time zone"""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, timezone.make_aware(
+        datetime.combine(day + timedelta(days=1), time.min)
+    )
+
+
+def customer_ordered_on(order, day):
+    """Check whether order's customer has another order on day"""
+    start, end = day_bounds(day)
+    return Order.objects.filter(
+        customer_id=order.customer_id,
+        order_date__gte=start,
+        order_date__lt=end,
+    ).exclude(pk=order.pk).exists()
+
+
+def record_daily_order(order):
+    """Fold a new order into its day's rollup.
+
+    The caller must hold the customer row lock, as CreateOrder does, so
+    the distinct customer count sees the customer's other orders.
+    """
+    day = timezone.localdate(order.order_date)
+    new_customer = 0 if customer_ordered_on(order, day) else 1
+    changes = {
+        'order_count': F('order_count') + 1,
+        'revenue': F('revenue') + order.total_amount,
+        'customer_count': F('customer_count') + new_customer,
+        'updated_at': timezone.now(),
+    }
+    if DailyOrderRollup.objects.filter(date=day).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            DailyOrderRollup.objects.create(
+                date=day,
+                order_count=1,
+                revenue=order.total_amount,
+                customer_count=1,
+            )
+    except IntegrityError:
+        # Another order created the day's row first
+        DailyOrderRollup.objects.filter(date=day).update(**changes)
+
+
+def forget_daily_order(order):
+    """Recompute a deleted order's day from the orders left that day.
+
+    post_delete is sent once a queryset delete removed its whole batch,
+    so adjusting the counts per deleted order would take a customer with
+    several orders that day out of customer_count once per order. Inside
+    deferred_rollups the day is only recorded.
+    """
+    day = timezone.localdate(order.order_date)
+    days = _deferred_days.get()
+    if days is not None:
+        days.add(day)
+        return
+    rebuild_daily_rollups(day, day)
+
+
+@contextmanager
+def deferred_rollups():
+    """Rebuild the days of the orders deleted inside once each, on exit.
+
+    Bulk deletes wrap themselves in it, so deleting n orders of a day
+    recomputes that day once instead of n times.
+    """
+    if _deferred_days.get() is not None:
+        # The outer block rebuilds
+        yield
+        return
+    days = set()
+    token = _deferred_days.set(days)
+    try:
+        yield
+    finally:
+        _deferred_days.reset(token)
+    rebuild_days(sorted(days))
+
+
+def rebuild_daily_rollups(first_day, last_day):
+    """Recompute the rollups of first_day..last_day from the orders.
+
+    Reads one indexed range of orders; days without orders lose their
+    row. Returns the number of rollup rows written.
+    """
+    start, _ = day_bounds(first_day)
+    _, end = day_bounds(last_day)
+    days = (
+        Order.objects.filter(order_date__gte=start, order_date__lt=end)
+        .annotate(day=TruncDate('order_date'))
+        .order_by()
+        .values('day')
+        .annotate(
+            order_count=Count('pk'),
+            revenue=Sum('total_amount'),
+            customer_count=Count('customer', distinct=True),
+        )
+    )
+    rollups = [DailyOrderRollup(date=row.pop('day'), **row) for row in days]
+    with transaction.atomic():
+        DailyOrderRollup.objects.filter(
+            date__gte=first_day, date__lte=last_day
+        ).delete()
+        DailyOrderRollup.objects.bulk_create(rollups)
+    return len(rollups)
+
+
+def rebuild_rollup_range(first_day, last_day, chunk_days=ROLLUP_CHUNK_DAYS):
+    """Rebuild first_day..last_day, chunk_days per transaction"""
+    written = 0
+    day = first_day
+    while day <= last_day:
+        chunk_end = min(day + timedelta(days=chunk_days - 1), last_day)
+        written += rebuild_daily_rollups(day, chunk_end)
+        day = chunk_end + timedelta(days=1)
+    return written
+
+
+def rebuild_days(days):
+    """Rebuild the rollups of sorted days, one query per consecutive run"""
+    runs = []
+    for day in days:
+        if runs and day == runs[-1][1] + timedelta(days=1):
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    for first_day, last_day in runs:
+        rebuild_rollup_range(first_day, last_day)
+
+
+def order_day_range():
+    """Return the first and last day with orders, or (None, None)"""
+    bounds = Order.objects.aggregate(low=Min('order_date'), high=Max('order_date'))
+    if bounds['low'] is None:
+        return None, None
+    return timezone.localdate(bounds['low']), timezone.localdate(bounds['high'])
+
+
+def set_watermark(value):
+    RollupWatermark.objects.update_or_create(
+        name=WATERMARK_NAME, defaults={'value': value}
+    )
+
+
+def refresh_daily_rollups(lag=ROLLUP_REFRESH_LAG):
+    """Recompute the days of every order changed since the last refresh.
+
+    Orders created outside CreateOrder (admin, bulk loads, imports) reach
+    the rollups here. Recomputing is idempotent, so days CreateOrder
+    already counted are simply rewritten. Returns the days refreshed.
+    """
+    until = timezone.now() - lag
+    with transaction.atomic():
+        watermark = RollupWatermark.objects.select_for_update().filter(
+            name=WATERMARK_NAME
+        ).first()
+        changed = Order.objects.filter(updated_at__lte=until)
+        if watermark is not None:
+            changed = changed.filter(updated_at__gt=watermark.value)
+        days = sorted(changed.dates('order_date', 'day'))
+        rebuild_days(days)
+        set_watermark(until)
+    return days
+
+
+def rollup_totals(first_day=None, last_day=None):
+    """Sum orders, revenue and customer-days over the rollups of a day range.
+
+    Reads one row per day. Customers are distinct per day only, so
+    customer_days counts a customer once for each day they ordered.
+    """
+    rollups = DailyOrderRollup.objects.all()
+    if first_day is not None:
+        rollups = rollups.filter(date__gte=first_day)
+    if last_day is not None:
+        rollups = rollups.filter(date__lte=last_day)
+    totals = rollups.aggregate(
+        order_count=Sum('order_count'),
+        revenue=Sum('revenue'),
+        customer_days=Sum('customer_count'),
+    )
+    return {
+        'order_count': totals['order_count'] or 0,
+        'revenue': totals['revenue'] or Decimal('0.00'),
+        'customer_days': totals['customer_days'] or 0,
+    }
@@ -1,43 +1,95 @@
 from crm.models import Product
 import graphene
 from graphene_django import DjangoObjectType
-from graphene_django.filter import DjangoFilterConnectionField
-from django.db import transaction
+from graphene_django.settings import graphene_settings
+from django.db import IntegrityError, transaction
 from django.core.exceptions import ValidationError
 import re
 from decimal import Decimal
+from django.utils import timezone
 
 from .models import Customer, Product, Order
 from .filters import CustomerFilter, ProductFilter, OrderFilter
+from .activity import activity_subqueries, record_order
+from .cache import bump_versions
+from .connections import CountableConnection
+from .fields import BatchedConnectionField, KeysetConnectionField
+from .inventory import LOW_STOCK_THRESHOLD, RESTOCK_INCREMENT, restock_low_stock
+from .loaders import get_loaders
+from .optimizer import optimize, prefetched_rows
+from .pagination import rows_needed
+from .rollups import rebuild_days, record_daily_order
+
+# Rows per INSERT statement for bulk mutations
+BULK_CREATE_BATCH_SIZE = 1000
 
 
 # GraphQL Types
 class CustomerType(DjangoObjectType):
     """GraphQL type for Customer model"""
+    orders = BatchedConnectionField(lambda: OrderType, required=True)
+
     class Meta:
         model = Customer
         filter_fields = {}
         interfaces = (graphene.relay.Node,)
+        connection_class = CountableConnection
         fields = '__all__'
 
+    def resolve_orders(self, info, **kwargs):
+        """Resolve orders from the prefetch cache or the request's DataLoader"""
+        rows = prefetched_rows(self, 'orders')
+        if rows is not None:
+            return rows
+        limit = rows_needed(kwargs, graphene_settings.RELAY_CONNECTION_MAX_LIMIT)
+        return get_loaders(info).customer_orders.load((self.pk, limit))
+
 
 class ProductType(DjangoObjectType):
     """GraphQL type for Product model"""
+    orders = BatchedConnectionField(lambda: OrderType, required=True)
+
     class Meta:
         model = Product
         filter_fields = {}
         interfaces = (graphene.relay.Node,)
+        connection_class = CountableConnection
         fields = '__all__'
 
+    def resolve_orders(self, info, **kwargs):
+        """Resolve orders from the prefetch cache or the request's DataLoader"""
+        rows = prefetched_rows(self, 'orders')
+        if rows is not None:
+            return rows
+        limit = rows_needed(kwargs, graphene_settings.RELAY_CONNECTION_MAX_LIMIT)
+        return get_loaders(info).product_orders.load((self.pk, limit))
+
 
 class OrderType(DjangoObjectType):
     """GraphQL type for Order model"""
+    products = BatchedConnectionField(ProductType, required=True)
+
     class Meta:
         model = Order
         filter_fields = {}
         interfaces = (graphene.relay.Node,)
+        connection_class = CountableConnection
         fields = '__all__'
 
+    def resolve_customer(self, info):
+        """Resolve customer from select_related or the request's DataLoader"""
+        if Order.customer.is_cached(self):
+            return self.customer
+        return get_loaders(info).customer.load(self.customer_id)
+
+    def resolve_products(self, info, **kwargs):
+        """Resolve products from the prefetch cache or the request's DataLoader"""
+        rows = prefetched_rows(self, 'products')
+        if rows is not None:
+            return rows
+        limit = rows_needed(kwargs, graphene_settings.RELAY_CONNECTION_MAX_LIMIT)
+        return get_loaders(info).order_products.load((self.pk, limit))
+
 
 # Input Types
 class CustomerInput(graphene.InputObjectType):
@@ -79,11 +131,29 @@ class CreateProductPayload(graphene.ObjectType):
     product = graphene.Field(ProductType)
 
 
+class BulkCreateProductsPayload(graphene.ObjectType):
+    """Return type for BulkCreateProducts mutation"""
+    products = graphene.List(ProductType)
+    errors = graphene.List(graphene.String)
+
+
 class CreateOrderPayload(graphene.ObjectType):
     """Return type for CreateOrder mutation"""
     order = graphene.Field(OrderType)
 
 
+class BulkCreateOrdersPayload(graphene.ObjectType):
+    """Return type for BulkCreateOrders mutation"""
+    orders = graphene.List(OrderType)
+    errors = graphene.List(graphene.String)
+
+
+class RestockedProduct(graphene.ObjectType):
+    """A product restocked by UpdateLowStockProducts, with its new stock"""
+    name = graphene.String()
+    stock = graphene.Int()
+
+
 # Mutations
 class CreateCustomer(graphene.Mutation):
     """Mutation to create a single customer"""
@@ -133,37 +203,92 @@ class BulkCreateCustomers(graphene.Mutation):
     Output = BulkCreateCustomersPayload
 
     @staticmethod
-    @transaction.atomic
+    def existing_emails(emails):
+        """Return which of emails are taken, one query per chunk"""
+        emails = list(emails)
+        taken = set()
+        for start in range(0, len(emails), BULK_CREATE_BATCH_SIZE):
+            taken.update(
+                Customer.objects.filter(
+                    email__in=emails[start:start + BULK_CREATE_BATCH_SIZE]
+                ).order_by().values_list('email', flat=True)
+            )
+        return taken
+
+    @staticmethod
+    def create_each(rows, errors):
+        """Insert rows one by one, reporting the emails taken meanwhile"""
+        created = []
+        for idx, customer in rows:
+            # A failed batch may have assigned ids to rows it rolled back
+            customer.pk = None
+            customer._state.adding = True
+            try:
+                with transaction.atomic():
+                    customer.save()
+            except IntegrityError:
+                errors.append(
+                    f"Row {idx + 1}: Email '{customer.email}' already exists"
+                )
+                continue
+            created.append(customer)
+        return created
+
+    @staticmethod
     def mutate(root, info, input):
-        customers = []
+        rows = []
         errors = []
 
+        taken = BulkCreateCustomers.existing_emails(
+            {customer_data.email for customer_data in input}
+        )
+
         for idx, customer_data in enumerate(input):
+            # Validate email uniqueness against the table and earlier rows
+            if customer_data.email in taken:
+                errors.append(
+                    f"Row {idx + 1}: Email '{customer_data.email}' already exists"
+                )
+                continue
+
+            # Validate phone format
+            if customer_data.phone and not CreateCustomer.validate_phone(
+                customer_data.phone
+            ):
+                errors.append(
+                    f"Row {idx + 1}: Invalid phone format for '{customer_data.phone}'"
+                )
+                continue
+
+            customer = Customer(
+                name=customer_data.name,
+                email=customer_data.email,
+                phone=customer_data.phone or None
+            )
+            # Catch bad rows here, a failing bulk_create would lose the chunk
             try:
-                # Validate email uniqueness
-                if Customer.objects.filter(email=customer_data.email).exists():
-                    errors.append(
-                        f"Row {idx + 1}: Email '{customer_data.email}' already exists"
-                    )
-                    continue
+                customer.clean_fields()
+            except ValidationError as e:
+                errors.append(f"Row {idx + 1}: {str(e)}")
+                continue
 
-                # Validate phone format
-                if customer_data.phone and not CreateCustomer.validate_phone(
-                    customer_data.phone
-                ):
-                    errors.append(
-                        f"Row {idx + 1}: Invalid phone format for '{customer_data.phone}'"
-                    )
-                    continue
+            taken.add(customer_data.email)
+            rows.append((idx, customer))
 
-                customer = Customer.objects.create(
-                    name=customer_data.name,
-                    email=customer_data.email,
-                    phone=customer_data.phone or None
+        customers = [customer for _, customer in rows]
+        try:
+            with transaction.atomic():
+                customers = Customer.objects.bulk_create(
+                    customers,
+                    batch_size=BULK_CREATE_BATCH_SIZE
                 )
-                customers.append(customer)
-            except Exception as e:
-                errors.append(f"Row {idx + 1}: {str(e)}")
+        except IntegrityError:
+            # An email was taken since the lookup, e.g. by a concurrent import
+            customers = BulkCreateCustomers.create_each(rows, errors)
+
+        if customers:
+            # bulk_create sends no post_save signals
+            bump_versions(Customer)
 
         return BulkCreateCustomersPayload(
             customers=customers,
@@ -198,8 +323,61 @@ class CreateProduct(graphene.Mutation):
         return CreateProductPayload(product=product)
 
 
+class BulkCreateProducts(graphene.Mutation):
+    """Mutation to create multiple products"""
+    class Arguments:
+        input = graphene.List(ProductInput, required=True)
+
+    Output = BulkCreateProductsPayload
+
+    @staticmethod
+    def mutate(root, info, input):
+        products = []
+        errors = []
+
+        for idx, product_data in enumerate(input):
+            # Same rules as CreateProduct
+            if product_data.price <= 0:
+                errors.append(f"Row {idx + 1}: Price must be positive")
+                continue
+            stock = product_data.stock if product_data.stock is not None else 0
+            if stock < 0:
+                errors.append(f"Row {idx + 1}: Stock cannot be negative")
+                continue
+
+            product = Product(
+                name=product_data.name,
+                price=product_data.price,
+                stock=stock
+            )
+            # Catch bad rows here, a failing bulk_create would lose the chunk
+            try:
+                product.clean_fields()
+            except ValidationError as e:
+                errors.append(f"Row {idx + 1}: {str(e)}")
+                continue
+            products.append(product)
+
+        with transaction.atomic():
+            products = Product.objects.bulk_create(
+                products,
+                batch_size=BULK_CREATE_BATCH_SIZE
+            )
+            # bulk_create sends no post_save signals
+            bump_versions(Product)
+
+        return BulkCreateProductsPayload(
+            products=products,
+            errors=errors
+        )
+
+
 class CreateOrder(graphene.Mutation):
-    """Mutation to create an order with products"""
+    """Mutation to create an order with products.
+
+    A product listed more than once is linked and charged once, the
+    order-product table holds a single row per pair.
+    """
     class Arguments:
         input = OrderInput(required=True)
 
@@ -210,7 +388,9 @@ class CreateOrder(graphene.Mutation):
     def mutate(root, info, input):
         # Validate customer exists
         try:
-            customer = Customer.objects.get(pk=input.customer_id)
+            customer = Customer.objects.select_for_update().get(
+                pk=input.customer_id
+            )
         except Customer.DoesNotExist:
             raise ValidationError(f"Customer with ID '{input.customer_id}' does not exist")
 
@@ -218,14 +398,21 @@ class CreateOrder(graphene.Mutation):
         if not input.product_ids:
             raise ValidationError("At least one product must be selected")
 
-        # Validate products exist
-        products = []
-        for product_id in input.product_ids:
-            try:
-                product = Product.objects.get(pk=product_id)
-                products.append(product)
-            except Product.DoesNotExist:
-                raise ValidationError(f"Product with ID '{product_id}' does not exist")
+        # Validate products exist, resolving the whole cart in one query
+        product_ids = list(dict.fromkeys(str(pk) for pk in input.product_ids))
+        products = Product.objects.in_bulk(
+            [pk for pk in product_ids if pk.isdigit()]
+        )
+        missing = [
+            pk for pk in product_ids
+            if not pk.isdigit() or int(pk) not in products
+        ]
+        if len(missing) == 1:
+            raise ValidationError(f"Product with ID '{missing[0]}' does not exist")
+        if missing:
+            ids = ", ".join(f"'{pk}'" for pk in missing)
+            raise ValidationError(f"Products with IDs {ids} do not exist")
+        products = [products[int(pk)] for pk in product_ids]
 
         # Calculate total amount
         total_amount = sum(product.price for product in products)
@@ -235,32 +422,139 @@ class CreateOrder(graphene.Mutation):
             customer=customer,
             total_amount=total_amount
         )
-        order.products.set(products)
+        OrderProduct = Order.products.through
+        OrderProduct.objects.bulk_create([
+            OrderProduct(order_id=order.pk, product_id=product.pk)
+            for product in products
+        ])
+        bump_versions(Order, Product)
+        record_order(customer, order)
+        record_daily_order(order)
 
         return CreateOrderPayload(order=order)
 
 
+class BulkCreateOrders(graphene.Mutation):
+    """Mutation to create multiple orders, e.g. to backfill order history.
+
+    Every customer and product referenced by the batch is fetched with
+    one in_bulk each, and orders and their product rows are inserted
+    with bulk_create. Rows that fail validation are reported in errors
+    and skipped; the others are created. Each row follows CreateOrder,
+    and may also set its orderDate.
+    """
+    class Arguments:
+        input = graphene.List(OrderInput, required=True)
+
+    Output = BulkCreateOrdersPayload
+
+    @staticmethod
+    def mutate(root, info, input):
+        errors = []
+        rows = []
+        customer_ids = set()
+        product_ids = set()
+        for idx, order_data in enumerate(input):
+            customer_id = str(order_data.customer_id)
+            pks = list(dict.fromkeys(str(pk) for pk in order_data.product_ids or ()))
+            rows.append((idx, customer_id, pks, order_data.order_date))
+            if customer_id.isdigit():
+                customer_ids.add(int(customer_id))
+            product_ids.update(int(pk) for pk in pks if pk.isdigit())
+
+        orders = []
+        with transaction.atomic():
+            # Locked like CreateOrder locks its customer, for the activity columns
+            customers = Customer.objects.select_for_update().in_bulk(customer_ids)
+            products = Product.objects.in_bulk(product_ids)
+
+            carts = []
+            for idx, customer_id, pks, order_date in rows:
+                if not customer_id.isdigit() or int(customer_id) not in customers:
+                    errors.append(
+                        f"Row {idx + 1}: Customer with ID '{customer_id}' does not exist"
+                    )
+                    continue
+                if not pks:
+                    errors.append(f"Row {idx + 1}: At least one product must be selected")
+                    continue
+                missing = [
+                    pk for pk in pks if not pk.isdigit() or int(pk) not in products
+                ]
+                if missing:
+                    ids = ", ".join(f"'{pk}'" for pk in missing)
+                    errors.append(f"Row {idx + 1}: Products with IDs {ids} do not exist")
+                    continue
+
+                cart = [products[int(pk)] for pk in pks]
+                order = Order(
+                    customer=customers[int(customer_id)],
+                    total_amount=sum(product.price for product in cart),
+                )
+                if order_date is not None:
+                    order.order_date = order_date
+                orders.append(order)
+                carts.append(cart)
+
+            orders = Order.objects.bulk_create(
+                orders,
+                batch_size=BULK_CREATE_BATCH_SIZE
+            )
+            OrderProduct = Order.products.through
+            OrderProduct.objects.bulk_create(
+                [
+                    OrderProduct(order_id=order.pk, product_id=product.pk)
+                    for order, cart in zip(orders, carts)
+                    for product in cart
+                ],
+                batch_size=BULK_CREATE_BATCH_SIZE
+            )
+
+            # One UPDATE per chunk of customers instead of one per order
+            touched = sorted({order.customer_id for order in orders})
+            for start in range(0, len(touched), BULK_CREATE_BATCH_SIZE):
+                Customer.objects.filter(
+                    pk__in=touched[start:start + BULK_CREATE_BATCH_SIZE]
+                ).update(**activity_subqueries())
+            rebuild_days(sorted({
+                timezone.localdate(order.order_date) for order in orders
+            }))
+            # bulk_create sends no post_save or m2m_changed signals
+            bump_versions(Customer, Order, Product)
+
+        return BulkCreateOrdersPayload(
+            orders=orders,
+            errors=errors
+        )
+
+
 class UpdateLowStockProducts(graphene.Mutation):
     """Mutation to update low stock products"""
     class Arguments:
-        pass
+        threshold = graphene.Int(default_value=LOW_STOCK_THRESHOLD)
+        increment = graphene.Int(default_value=RESTOCK_INCREMENT)
 
     success = graphene.Boolean()
     updated_products = graphene.List(graphene.String)
+    restocked_products = graphene.List(RestockedProduct)
     message = graphene.String()
 
     @staticmethod
-    def mutate(root, info):
-        low_stock = Product.objects.filter(stock__lt=10)
-        names = []
-        for product in low_stock:
-            names.append(product.name)
-            product.stock += 10
-            product.save()
-        
+    def mutate(root, info, threshold, increment):
+        # Validate increment is positive
+        if increment <= 0:
+            raise ValidationError("Increment must be positive")
+
+        restocked = restock_low_stock(threshold=threshold, increment=increment)
+        names = [name for name, stock in restocked]
+
         return UpdateLowStockProducts(
             success=True,
             updated_products=names,
+            restocked_products=[
+                RestockedProduct(name=name, stock=stock)
+                for name, stock in restocked
+            ],
             message=f"Updated {len(names)} products"
         )
 
@@ -272,21 +566,21 @@ class Query(graphene.ObjectType):
         description="A simple hello query"
     )
 
-    # Filtered queries using DjangoFilterConnectionField
-    all_customers = DjangoFilterConnectionField(
+    # Filtered queries, paginated by sort key
+    all_customers = KeysetConnectionField(
         CustomerType,
         filterset_class=CustomerFilter,
-        order_by=graphene.String()
+        args={'order_by': graphene.String()}
     )
-    all_products = DjangoFilterConnectionField(
+    all_products = KeysetConnectionField(
         ProductType,
         filterset_class=ProductFilter,
-        order_by=graphene.String()
+        args={'order_by': graphene.String()}
     )
-    all_orders = DjangoFilterConnectionField(
+    all_orders = KeysetConnectionField(
         OrderType,
         filterset_class=OrderFilter,
-        order_by=graphene.String()
+        args={'order_by': graphene.String()}
     )
 
     def resolve_hello(self, info):
@@ -295,7 +589,7 @@ class Query(graphene.ObjectType):
 
     def resolve_all_customers(self, info, filter=None, order_by=None, **kwargs):
         """Resolver for all_customers with order_by support"""
-        qs = Customer.objects.all()
+        qs = optimize(Customer.objects.all(), info)
         
         # Apply filters using filterset if filter is provided
         if filter:
@@ -310,7 +604,7 @@ class Query(graphene.ObjectType):
 
     def resolve_all_products(self, info, filter=None, order_by=None, **kwargs):
         """Resolver for all_products with order_by support"""
-        qs = Product.objects.all()
+        qs = optimize(Product.objects.all(), info)
         
         # Apply filters using filterset if filter is provided
         if filter:
@@ -325,7 +619,7 @@ class Query(graphene.ObjectType):
 
     def resolve_all_orders(self, info, filter=None, order_by=None, **kwargs):
         """Resolver for all_orders with order_by support"""
-        qs = Order.objects.all()
+        qs = optimize(Order.objects.all(), info)
         
         # Apply filters using filterset if filter is provided
         if filter:
@@ -345,6 +639,8 @@ class Mutation(graphene.ObjectType):
     create_customer = CreateCustomer.Field()
     bulk_create_customers = BulkCreateCustomers.Field()
     create_product = CreateProduct.Field()
+    bulk_create_products = BulkCreateProducts.Field()
     create_order = CreateOrder.Field()
+    bulk_create_orders = BulkCreateOrders.Field()
     update_low_stock_products = UpdateLowStockProducts.Field()
 
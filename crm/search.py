@@ -0,0 +1,242 @@
+import re
+
+from django.db.models import (
+    BooleanField,
+    Expression,
+    F,
+    FloatField,
+    Q,
+    Value,
+)
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import IContains
+
+from .models import Customer, Product, Order
+
+# Columns covered by the full-text index of each model, see 0004
+SEARCH_FIELDS = {
+    Customer: ('name', 'email'),
+    Product: ('name',),
+}
+
+
+# Shortest value the trigram index of 0008 can match
+TRIGRAM_LENGTH = 3
+
+
+def search_terms(value):
+    """Split user input into the words the full-text index stores"""
+    return re.findall(r'\w+', value or '')
+
+
+def fts_table(model):
+    return f'{model._meta.db_table}_fts'
+
+
+class SearchExpression(Expression):
+    """Full-text expression over the indexed columns of model.
+
+    key is the expression holding the primary key of model, so a query
+    on another model can rank by a related row. Columns are compiled
+    through the query, so table aliases stay correct in subqueries.
+    fields restricts the match to some of the indexed columns.
+    """
+
+    def __init__(self, model, terms, key='pk', prefix='', fields=None):
+        super().__init__(output_field=self.output_field)
+        self.model = model
+        self.terms = tuple(terms)
+        self.key = F(key) if isinstance(key, str) else key
+        self.fields = tuple(fields or SEARCH_FIELDS[model])
+        self.columns = [F(prefix + name) for name in self.fields]
+
+    @property
+    def all_fields(self):
+        return self.fields == SEARCH_FIELDS[self.model]
+
+    def get_source_expressions(self):
+        return [self.key, *self.columns]
+
+    def set_source_expressions(self, exprs):
+        self.key, *self.columns = exprs
+
+    def compile_sources(self, compiler):
+        key_sql, params = compiler.compile(self.key)
+        columns = []
+        for column in self.columns:
+            sql, column_params = compiler.compile(column)
+            columns.append(sql)
+            params = (*params, *column_params)
+        return key_sql, columns, tuple(params)
+
+    def sqlite_query(self):
+        # Every word must match, each as a prefix of an indexed token
+        columns = '' if self.all_fields else f"{{{' '.join(self.fields)}}} : "
+        return ' '.join(f'{columns}"{term}"*' for term in self.terms)
+
+    def postgresql_query(self):
+        return ' & '.join(f'{term}:*' for term in self.terms)
+
+    @staticmethod
+    def postgresql_vector(columns):
+        # Must match the expression of the GIN index created in 0004
+        document = " || ' ' || ".join(
+            f"coalesce({column}, '')" for column in columns
+        )
+        return f"to_tsvector('simple', {document})"
+
+
+class SearchMatch(SearchExpression):
+    """True for rows whose indexed columns contain every search term"""
+    output_field = BooleanField()
+    conditional = True
+
+    def as_sqlite(self, compiler, connection):
+        key_sql, _, params = self.compile_sources(compiler)
+        table = connection.ops.quote_name(fts_table(self.model))
+        sql = (
+            f'{key_sql} IN (SELECT rowid FROM {table} '
+            f'WHERE {table} MATCH %s)'
+        )
+        return sql, (*params, self.sqlite_query())
+
+    def as_postgresql(self, compiler, connection):
+        if not self.all_fields:
+            # The GIN index covers every column together, while the
+            # trigram indexes of 0004 serve substrings of each column
+            return self.as_sql(compiler, connection)
+        _, columns, params = self.compile_sources(compiler)
+        sql = (
+            f"{self.postgresql_vector(columns)} "
+            f"@@ to_tsquery('simple', %s)"
+        )
+        return sql, (*params, self.postgresql_query())
+
+    def as_sql(self, compiler, connection):
+        # No full-text index on this backend: every term as a substring
+        terms_sql, params = [], []
+        for term in self.terms:
+            columns_sql = []
+            for column in self.columns:
+                sql, lookup_params = compiler.compile(IContains(column, term))
+                columns_sql.append(sql)
+                params.extend(lookup_params)
+            terms_sql.append(f"({' OR '.join(columns_sql)})")
+        return ' AND '.join(terms_sql), tuple(params)
+
+
+class SubstringMatch(Expression):
+    """True for rows whose column of model contains value, in any case.
+
+    The same rows as an icontains lookup. SQLite reads them from the
+    trigram index of 0008 and PostgreSQL from the trigram indexes of
+    0004; values shorter than a trigram, and other backends, fall back
+    to icontains on the column.
+    """
+    output_field = BooleanField()
+    conditional = True
+
+    def __init__(self, model, value, key='pk', prefix='', field='name'):
+        super().__init__(output_field=self.output_field)
+        self.model = model
+        self.value = value
+        self.key = F(key) if isinstance(key, str) else key
+        self.column = F(prefix + field)
+
+    def get_source_expressions(self):
+        return [self.key, self.column]
+
+    def set_source_expressions(self, exprs):
+        self.key, self.column = exprs
+
+    def as_sqlite(self, compiler, connection):
+        if len(self.value) < TRIGRAM_LENGTH:
+            return self.as_sql(compiler, connection)
+        key_sql, params = compiler.compile(self.key)
+        table = connection.ops.quote_name(f'{self.model._meta.db_table}_trgm')
+        # One quoted phrase: its trigrams must follow each other
+        phrase = '"%s"' % self.value.replace('"', '""')
+        sql = (
+            f'{key_sql} IN (SELECT rowid FROM {table} '
+            f'WHERE {table} MATCH %s)'
+        )
+        return sql, (*params, phrase)
+
+    def as_sql(self, compiler, connection):
+        return compiler.compile(IContains(self.column, self.value))
+
+
+class SearchRank(SearchExpression):
+    """Relevance of a matching row, higher is better"""
+    output_field = FloatField()
+
+    def as_sqlite(self, compiler, connection):
+        key_sql, _, params = self.compile_sources(compiler)
+        table = connection.ops.quote_name(fts_table(self.model))
+        # FTS5 rank is bm25(), where more relevant rows score lower
+        sql = (
+            f'(SELECT -rank FROM {table} '
+            f'WHERE {table} MATCH %s AND rowid = {key_sql})'
+        )
+        return sql, (self.sqlite_query(), *params)
+
+    def as_postgresql(self, compiler, connection):
+        _, columns, params = self.compile_sources(compiler)
+        sql = (
+            f"ts_rank({self.postgresql_vector(columns)}, "
+            f"to_tsquery('simple', %s))"
+        )
+        return sql, (*params, self.postgresql_query())
+
+    def as_sql(self, compiler, connection):
+        return compiler.compile(Value(0.0))
+
+
+def rank_by(queryset, rank):
+    """Order queryset by rank, keeping its current ordering for ties"""
+    ordering = queryset.query.order_by or queryset.model._meta.ordering
+    return queryset.alias(search_rank=rank).order_by(
+        '-search_rank', *ordering
+    )
+
+
+def search_customers(queryset, value):
+    """Customers whose name or email contain every word of value"""
+    terms = search_terms(value)
+    if not terms:
+        return queryset.none()
+    queryset = queryset.filter(SearchMatch(Customer, terms))
+    return rank_by(queryset, SearchRank(Customer, terms))
+
+
+def search_products(queryset, value):
+    """Products whose name contains every word of value"""
+    terms = search_terms(value)
+    if not terms:
+        return queryset.none()
+    queryset = queryset.filter(SearchMatch(Product, terms))
+    return rank_by(queryset, SearchRank(Product, terms))
+
+
+def search_orders(queryset, value):
+    """Orders whose customer or one of whose products match value.
+
+    Orders are ranked by how well their customer matches, so orders
+    found only through a product come after customer matches.
+    """
+    terms = search_terms(value)
+    if not terms:
+        return queryset.none()
+    OrderProduct = Order.products.through
+    product_orders = OrderProduct.objects.filter(
+        SearchMatch(Product, terms, key='product_id', prefix='product__')
+    ).values('order_id')
+    queryset = queryset.filter(
+        Q(SearchMatch(Customer, terms, key='customer_id', prefix='customer__'))
+        | Q(pk__in=product_orders)
+    )
+    rank = Coalesce(
+        SearchRank(Customer, terms, key='customer_id', prefix='customer__'),
+        Value(0.0),
+    )
+    return rank_by(queryset, rank)
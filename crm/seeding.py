@@ -0,0 +1,267 @@
+import math
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .activity import rebuild_customer_activity
+from .cache import bump_versions
+from .models import Customer, DailyOrderRollup, Order, Product
+from .rollups import order_day_range, rebuild_rollup_range
+
+# Rows inserted per bulk_create statement
+SEED_CHUNK_SIZE = 5000
+
+# Customers sign up over this many days before now
+SEED_HISTORY_DAYS = 3 * 365
+
+# Zipf exponents: the product or customer of rank r gets a share of the
+# orders proportional to 1 / r ** skew
+PRODUCT_POPULARITY_SKEW = 0.8
+CUSTOMER_ACTIVITY_SKEW = 0.5
+
+# Relative frequency of carts of 1, 2, 3, 4 and 5 products
+CART_SIZE_WEIGHTS = [50, 25, 13, 8, 4]
+
+# Share of products with fewer than 10 units in stock
+LOW_STOCK_SHARE = 0.1
+
+FIRST_NAMES = [
+    'Ada', 'Alan', 'Alice', 'Amara', 'Bob', 'Carol', 'Chen', 'David',
+    'Elena', 'Eva', 'Femi', 'Grace', 'Hiro', 'Ines', 'Jamal', 'Kofi',
+    'Lena', 'Maria', 'Mohamed', 'Nia', 'Omar', 'Priya', 'Ravi', 'Sara',
+    'Tomas', 'Wanjiru', 'Yuki', 'Zara',
+]
+LAST_NAMES = [
+    'Adeyemi', 'Brown', 'Davis', 'Garcia', 'Hopper', 'Ito', 'Johnson',
+    'Kamau', 'Kim', 'Lovelace', 'Mensah', 'Novak', 'Okafor', 'Patel',
+    'Rossi', 'Silva', 'Smith', 'Turing', 'Wang', 'White',
+]
+PRODUCT_NOUNS = [
+    'Cable', 'Charger', 'Dock', 'Headphones', 'Keyboard', 'Lamp',
+    'Laptop', 'Monitor', 'Mouse', 'Router', 'Speaker', 'Tablet', 'Webcam',
+]
+PRODUCT_ADJECTIVES = [
+    'Basic', 'Compact', 'Ergonomic', 'Portable', 'Pro', 'Silent',
+    'Ultra', 'Wireless',
+]
+
+
+def dataset_size(orders, customers=None, products=None):
+    """Return (customers, products, orders), deriving missing counts"""
+    if customers is None:
+        customers = max(orders // 10, 10)
+    if products is None:
+        products = max(orders // 200, 20)
+    return customers, products, orders
+
+
+def zipf_cum_weights(count, skew):
+    """Cumulative weights of ranks 1..count for random.choices"""
+    total, weights = 0.0, []
+    for rank in range(1, count + 1):
+        total += rank ** -skew
+        weights.append(total)
+    return weights
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the auto_now/auto_now_add values it is given"""
+    fields = [
+        field
+        for model in models
+        for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def clear_dataset():
+    """Empty the CRM tables and reset their id sequences.
+
+    Rows are removed without loading them or sending delete signals, so
+    the ids of the next dataset start from 1 again.
+    """
+    models = [Order.products.through, Order, Customer, Product, DailyOrderRollup]
+    statements = connection.ops.sql_flush(
+        no_style(),
+        [model._meta.db_table for model in models],
+        reset_sequences=True,
+    )
+    connection.ops.execute_sql_flush(statements)
+
+
+def seed_customers(rng, count, now, chunk_size):
+    """Insert count customers, returning their (pk, created_at)"""
+    def rows():
+        for i in range(count):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            created = now - timedelta(seconds=rng.uniform(0, SEED_HISTORY_DAYS * 86400))
+            yield Customer(
+                name=f'{first} {last}',
+                email=f'{first}.{last}.{i}@example.com'.lower(),
+                phone=f'+1{rng.randrange(10 ** 10):010d}' if rng.random() < 0.8 else None,
+                created_at=created,
+                updated_at=created,
+            )
+
+    customers = []
+    for chunk in chunked(rows(), chunk_size):
+        customers += [
+            (customer.pk, customer.created_at)
+            for customer in Customer.objects.bulk_create(chunk)
+        ]
+    return customers
+
+
+def seed_products(rng, count, now, chunk_size):
+    """Insert count products, returning their (pk, price)"""
+    def rows():
+        for i in range(count):
+            created = now - timedelta(days=rng.uniform(0, SEED_HISTORY_DAYS))
+            # Prices are log-normal, most items cheap and a few expensive
+            price = min(max(rng.lognormvariate(3.5, 1.0), 1.99), 9999.99)
+            if rng.random() < LOW_STOCK_SHARE:
+                stock = rng.randrange(0, 10)
+            else:
+                stock = rng.randrange(10, 500)
+            yield Product(
+                name=(
+                    f'{rng.choice(PRODUCT_ADJECTIVES)} '
+                    f'{rng.choice(PRODUCT_NOUNS)} {i}'
+                ),
+                price=Decimal(f'{price:.2f}'),
+                stock=stock,
+                created_at=created,
+                updated_at=created,
+            )
+
+    products = []
+    for chunk in chunked(rows(), chunk_size):
+        products += [
+            (product.pk, product.price)
+            for product in Product.objects.bulk_create(chunk)
+        ]
+    return products
+
+
+def insert_order_products(pairs):
+    """Insert (order_id, product_id) rows straight into the M2M table.
+
+    Skips building a model instance per row, the through table holds
+    several times as many rows as the orders.
+    """
+    OrderProduct = Order.products.through
+    table = connection.ops.quote_name(OrderProduct._meta.db_table)
+    columns = ', '.join(
+        connection.ops.quote_name(OrderProduct._meta.get_field(name).column)
+        for name in ('order', 'product')
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {table} ({columns}) VALUES (%s, %s)', pairs
+        )
+
+
+def seed_orders(rng, count, customers, products, now, chunk_size):
+    """Insert count orders of the given customers and products.
+
+    Popular products and active customers are picked far more often than
+    the rest, and every order falls after its customer signed up.
+    """
+    # Shuffle so popularity and activity do not follow the ids
+    customers, products = customers[:], products[:]
+    rng.shuffle(customers)
+    rng.shuffle(products)
+    customer_weights = zipf_cum_weights(len(customers), CUSTOMER_ACTIVITY_SKEW)
+    product_weights = zipf_cum_weights(len(products), PRODUCT_POPULARITY_SKEW)
+    cart_sizes = range(1, len(CART_SIZE_WEIGHTS) + 1)
+
+    for start in range(0, count, chunk_size):
+        size = min(chunk_size, count - start)
+        buyers = rng.choices(customers, cum_weights=customer_weights, k=size)
+        orders, carts = [], []
+        for customer_id, signed_up in buyers:
+            cart_size = rng.choices(cart_sizes, CART_SIZE_WEIGHTS)[0]
+            # A product drawn twice is only in the cart once
+            cart = dict(rng.choices(products, cum_weights=product_weights, k=cart_size))
+            # Orders lean towards the present, so yearly volume grows
+            ordered = now - (now - signed_up) * math.sqrt(rng.random())
+            orders.append(Order(
+                customer_id=customer_id,
+                total_amount=sum(cart.values()),
+                order_date=ordered,
+                created_at=ordered,
+                updated_at=ordered,
+            ))
+            carts.append(cart)
+        Order.objects.bulk_create(orders)
+        insert_order_products([
+            (order.pk, product_id)
+            for order, cart in zip(orders, carts)
+            for product_id in cart
+        ])
+
+
+def rebuild_derived_data(chunk_size=SEED_CHUNK_SIZE):
+    """Recompute customer activity and daily rollups from the orders"""
+    bounds = Customer.objects.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is not None:
+        for start in range(bounds['low'], bounds['high'] + 1, chunk_size):
+            with transaction.atomic():
+                rebuild_customer_activity(start, start + chunk_size)
+    first_day, last_day = order_day_range()
+    if first_day is not None:
+        rebuild_rollup_range(first_day, last_day)
+
+
+def analyze():
+    """Refresh the planner statistics after a bulk load"""
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def seed_dataset(orders, customers=None, products=None, seed=0,
+                 chunk_size=SEED_CHUNK_SIZE):
+    """Fill an empty database with a reproducible dataset.
+
+    The same counts and seed always produce the same rows, dated relative
+    to the current time. Returns the (customers, products, orders) counts
+    inserted.
+    """
+    rng = random.Random(seed)
+    customers, products, orders = dataset_size(orders, customers, products)
+    now = timezone.now()
+    with explicit_timestamps(Customer, Product, Order):
+        with transaction.atomic():
+            customer_rows = seed_customers(rng, customers, now, chunk_size)
+            product_rows = seed_products(rng, products, now, chunk_size)
+            seed_orders(rng, orders, customer_rows, product_rows, now, chunk_size)
+    rebuild_derived_data(chunk_size)
+    analyze()
+    bump_versions(Customer, Product, Order)
+    return customers, products, orders
@@ -0,0 +1,61 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .activity import forget_order
+from .cache import bump_versions
+from .models import Customer, Product, Order
+from .rollups import forget_daily_order
+
+# True inside bulk_delete
+_bulk_deleting = ContextVar('bulk_deleting', default=False)
+
+
+@contextmanager
+def bulk_delete():
+    """Skip the per-row delete handlers for the deletes run inside.
+
+    For bulk paths that bump the result cache versions and rebuild the
+    daily rollups themselves, once per batch, and that leave no customer
+    whose activity columns would need updating.
+    """
+    token = _bulk_deleting.set(True)
+    try:
+        yield
+    finally:
+        _bulk_deleting.reset(token)
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Order)
+def invalidate_model_results(sender, **kwargs):
+    """Invalidate cached query results after a row is written"""
+    if not _bulk_deleting.get():
+        bump_versions(sender)
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def invalidate_order_product_results(sender, action, **kwargs):
+    """Invalidate cached orders and products after their links change"""
+    if action.startswith('post_'):
+        bump_versions(Order, Product)
+
+
+@receiver(post_delete, sender=Order)
+def update_customer_activity(sender, instance, **kwargs):
+    """Keep the customer's activity columns in step with order deletes"""
+    if not _bulk_deleting.get():
+        forget_order(instance)
+
+
+@receiver(post_delete, sender=Order)
+def update_daily_rollup(sender, instance, **kwargs):
+    """Keep the order's daily rollup in step with order deletes"""
+    if not _bulk_deleting.get():
+        forget_daily_order(instance)
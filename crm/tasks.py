@@ -1,21 +1,97 @@
-<<<<<<< HEAD
-=======
 import requests
->>>>>>> 95028cf (crons: scheduling and automating tasks)
-import requests
-from celery import shared_task
-from datetime import datetime
-from django.db.models import Sum
-from crm.models import Customer, Order
+from celery import chord, shared_task
+from datetime import datetime, timedelta
+from django.utils import timezone
+from crm.reports import (
+    REPORT_BREAKDOWNS,
+    REPORT_PARTITION_SIZE,
+    aggregate_partition,
+    customer_partitions,
+    merge_partials,
+)
+from crm.rollups import refresh_daily_rollups, rollup_totals
 
 @shared_task
-def generate_crm_report():
-    total_customers = Customer.objects.count()
-    total_orders = Order.objects.count()
-    total_revenue = Order.objects.aggregate(Sum('total_amount'))['total_amount__sum'] or 0
+def generate_crm_report(days=None):
+    # Every figure comes from one rollup row per day instead of a scan of
+    # the customers and orders. With days, they cover only the last that
+    # many days. Customers are distinct per day only, so they are reported
+    # as customer-days: a customer ordering on several days counts on each.
+    first_day = timezone.localdate() - timedelta(days=days - 1) if days else None
+    totals = rollup_totals(first_day)
+    customer_days = totals['customer_days']
+    total_orders = totals['order_count']
+    total_revenue = totals['revenue']
     
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    report = f"{timestamp} - Report: {total_customers} customers, {total_orders} orders, {total_revenue} revenue\n"
+    period = f" in the last {days} days" if days else ""
+    report = f"{timestamp} - Report: {customer_days} customer-days, {total_orders} orders, {total_revenue} revenue{period}\n"
     
     with open('/tmp/crm_report_log.txt', 'a') as f:
         f.write(report)
+
+
+@shared_task
+def refresh_order_rollups():
+    """Fold orders changed since the last run into DailyOrderRollup"""
+    days = refresh_daily_rollups()
+    return [day.isoformat() for day in days]
+
+
+@shared_task
+def aggregate_order_partition(low, high, since=None, until=None, breakdowns=()):
+    """Aggregate the orders of customers low <= id < high"""
+    return aggregate_partition(low, high, since, until, breakdowns)
+
+
+@shared_task
+def merge_order_report(partials, since=None, until=None, breakdowns=(), top=None):
+    """Chord callback merging the partitions into the report and logging it"""
+    report = merge_partials(partials, breakdowns, top)
+    report.update(since=since, until=until)
+
+    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    period = f" from {since or 'the start'} to {until or 'now'}"
+    with open('/tmp/crm_report_log.txt', 'a') as f:
+        f.write(
+            f"{timestamp} - Order report: {report['order_count']} orders, "
+            f"{report['revenue']} revenue, {report['customer_count']} customers, "
+            f"{report['units']} units{period}\n"
+        )
+    return report
+
+
+def order_report_chord(
+    since=None, until=None, breakdowns=(), top=None,
+    partition_size=REPORT_PARTITION_SIZE,
+):
+    """The order report pipeline as a chord.
+
+    One aggregate_order_partition subtask per range of customer ids runs
+    in parallel on the workers, and merge_order_report combines their
+    partials. since and until are ISO datetimes; breakdowns may hold
+    'customers' and 'products'.
+    """
+    unknown = set(breakdowns) - set(REPORT_BREAKDOWNS)
+    if unknown:
+        raise ValueError(f"Unknown report breakdowns: {', '.join(sorted(unknown))}")
+    breakdowns = list(breakdowns)
+    return chord(
+        [
+            aggregate_order_partition.s(low, high, since, until, breakdowns)
+            for low, high in customer_partitions(partition_size)
+        ],
+        merge_order_report.s(since, until, breakdowns, top),
+    )
+
+
+@shared_task
+def generate_order_report(
+    since=None, until=None, breakdowns=(), top=None,
+    partition_size=REPORT_PARTITION_SIZE,
+):
+    """Start the order report chord, returning the id of its result"""
+    result = order_report_chord(
+        since, until, breakdowns, top, partition_size
+    ).apply_async()
+    return result.id
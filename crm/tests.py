@@ -1,3 +1,1587 @@
-from django.test import TestCase
+import asyncio
+import json
+import re
+import threading
+from contextlib import ExitStack
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count, Max, Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from gql.transport.exceptions import TransportQueryError
+from graphql_relay import from_global_id
+
+from alx_backend_graphql_crm.schema import schema
+
+from .benchmarks import compare_results
+from .client import LocalClient
+from .celery import app as celery_app
+from .concurrency import run_in_thread
+from .cron import update_low_stock
+from .documents import DocumentCache, document_hash
+from .filters import CustomerFilter, ProductFilter, OrderFilter
+from .inventory import restock_low_stock
+from .loaders import get_loaders, load_orders_by_customer
+from .models import Customer, DailyOrderRollup, Product, Order
+from .retention import purge_inactive_batch
+from .rollups import (
+    deferred_rollups,
+    rebuild_daily_rollups,
+    rebuild_rollup_range,
+    rollup_totals,
+)
+from .seeding import clear_dataset, seed_dataset
+from .tasks import generate_crm_report, order_report_chord
+
+
+def full_table_scans(queryset):
+    """Return the plan lines of queryset that read a whole table or index"""
+    plan = queryset.explain()
+    if connection.vendor == 'postgresql':
+        return [line for line in plan.splitlines() if 'Seq Scan' in line]
+    # SQLite: "SEARCH ... (col=? / col>?)" seeks, any "SCAN" walks a whole
+    # table or index, unless it is a full-text table with a MATCH constraint
+    return [
+        line for line in plan.splitlines()
+        if re.search(r'\bSCAN\b', line)
+        and not re.search(r'VIRTUAL TABLE INDEX \d+:\S', line)
+    ]
+
+
+class QueryOptimizerTests(TestCase):
+    """Nested selections cost the same number of queries at any row count"""
+
+    orders_query = (
+        '{ allOrders { edges { node { totalAmount customer { email } '
+        'products { edges { node { name } } } } } } }'
+    )
+    customers_query = (
+        '{ allCustomers { edges { node { name '
+        'orders { edges { node { totalAmount } } } } } } }'
+    )
+
+    def add_orders(self, count):
+        start = Customer.objects.count()
+        for i in range(start, start + count):
+            customer = Customer.objects.create(
+                name=f"Customer {i}", email=f"customer{i}@example.com"
+            )
+            products = [
+                Product.objects.create(name=f"Product {i}-{j}", price=Decimal('5.00'))
+                for j in range(2)
+            ]
+            order = Order.objects.create(customer=customer, total_amount=Decimal('10.00'))
+            order.products.set(products)
+
+    def queries(self, query):
+        with CaptureQueriesContext(connection) as ctx:
+            result = schema.execute(query)
+        self.assertIsNone(result.errors)
+        return len(ctx), result.data
+
+    def test_constant_queries(self):
+        for query in (self.orders_query, self.customers_query):
+            self.add_orders(2)
+            few, _ = self.queries(query)
+            self.add_orders(20)
+            many, data = self.queries(query)
+            self.assertEqual(many, few, query)
+            self.assertEqual(len(next(iter(data.values()))['edges']), Order.objects.count())
+
+    def test_nested_first_limits_rows(self):
+        ada = Customer.objects.create(name='Ada', email='ada@example.com')
+        Order.objects.bulk_create([
+            Order(customer=ada, total_amount=Decimal(i)) for i in range(12)
+        ])
+        expected = [
+            str(pk) for pk in
+            ada.orders.order_by('-order_date', 'pk').values_list('pk', flat=True)
+        ]
+        query = (
+            'query ($after: String) { allCustomers { edges { node { '
+            'orders(first: 5, after: $after) { pageInfo { hasNextPage endCursor } '
+            'edges { node { id } } } } } } }'
+        )
+        pages, after = [], None
+        while True:
+            with CaptureQueriesContext(connection) as ctx:
+                result = schema.execute(query, variable_values={'after': after})
+            self.assertIsNone(result.errors)
+            self.assertIn('ROW_NUMBER', ctx.captured_queries[-1]['sql'])
+            orders = result.data['allCustomers']['edges'][0]['node']['orders']
+            pages.append([from_global_id(edge['node']['id'])[1] for edge in orders['edges']])
+            if not orders['pageInfo']['hasNextPage']:
+                break
+            after = orders['pageInfo']['endCursor']
+        self.assertEqual([len(page) for page in pages], [5, 5, 2])
+        self.assertEqual(sum(pages, []), expected)
+
+        # totalCount counts the prefetched rows, so they are all read
+        result = schema.execute(
+            '{ allCustomers { edges { node { orders(first: 5) { totalCount } } } } }'
+        )
+        self.assertEqual(
+            result.data['allCustomers']['edges'][0]['node']['orders']['totalCount'], 12
+        )
+
+        # The DataLoader reads the same leading rows and counts them all
+        limited, full = load_orders_by_customer([(ada.pk, 5), (ada.pk, None)])
+        self.assertEqual([order.pk for order in limited], [int(pk) for pk in expected[:5]])
+        self.assertEqual((len(limited), len(full)), (12, 12))
+
+    def test_selected_columns(self):
+        self.add_orders(1)
+        with CaptureQueriesContext(connection) as ctx:
+            schema.execute('{ allCustomers { edges { node { name } } } }')
+        sql = ctx.captured_queries[-1]['sql']
+        self.assertIn('"crm_customer"."name"', sql)
+        self.assertNotIn('"crm_customer"."phone"', sql)
+
+
+class CreateOrderTests(TestCase):
+    """CreateOrder resolves the whole cart with one query"""
+
+    mutation = (
+        'mutation($input: OrderInput!) { createOrder(input: $input) '
+        '{ order { totalAmount products { edges { node { name } } } } } }'
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ada = Customer.objects.create(name='Ada', email='ada@example.com')
+        cls.products = [
+            Product.objects.create(name=f'Product {i}', price=Decimal('10.00'))
+            for i in range(10)
+        ]
+
+    def create(self, customer_id, product_ids):
+        response = self.client.post('/graphql', json.dumps({
+            'query': self.mutation,
+            'variables': {'input': {
+                'customerId': customer_id, 'productIds': product_ids,
+            }},
+        }), content_type='application/json')
+        return response.json()
+
+    def test_duplicate_product_charged_once(self):
+        lamp, desk = self.products[:2]
+        result = self.create(self.ada.pk, [lamp.pk, desk.pk, lamp.pk])
+        self.assertNotIn('errors', result)
+        order = result['data']['createOrder']['order']
+        self.assertEqual(order['totalAmount'], '20.00')
+        self.assertEqual(len(order['products']['edges']), 2)
+
+    def test_missing_products(self):
+        result = self.create(self.ada.pk, [self.products[0].pk, 999])
+        self.assertEqual(
+            result['errors'][0]['message'], "Product with ID '999' does not exist"
+        )
+        result = self.create(self.ada.pk, ['x', 999])
+        self.assertEqual(
+            result['errors'][0]['message'], "Products with IDs 'x', '999' do not exist"
+        )
+        self.assertFalse(Order.objects.exists())
+
+    def test_queries_independent_of_cart_size(self):
+        mutation = self.mutation
+        self.mutation = (
+            'mutation($input: OrderInput!) { createOrder(input: $input) '
+            '{ order { id } } }'
+        )
+        try:
+            # The first order of the day also creates its rollup row
+            self.create(self.ada.pk, [self.products[0].pk])
+            with CaptureQueriesContext(connection) as small:
+                self.create(self.ada.pk, [self.products[0].pk])
+            with CaptureQueriesContext(connection) as large:
+                self.create(self.ada.pk, [p.pk for p in self.products])
+        finally:
+            self.mutation = mutation
+        self.assertEqual(len(large), len(small))
+        product_selects = [
+            query for query in large.captured_queries
+            if query['sql'].startswith('SELECT') and 'FROM "crm_product"' in query['sql']
+        ]
+        self.assertEqual(len(product_selects), 1)
+
+
+class RestockTests(TestCase):
+    """Low-stock products are restocked by set-based UPDATEs"""
+
+    mutation = (
+        'mutation($threshold: Int, $increment: Int) { updateLowStockProducts('
+        'threshold: $threshold, increment: $increment) '
+        '{ success updatedProducts message } }'
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        for name, stock in [('Lamp', 2), ('Desk', 9), ('Chair', 10), ('Sofa', 0)]:
+            Product.objects.create(name=name, price=Decimal('10.00'), stock=stock)
+
+    def stock(self):
+        return dict(Product.objects.values_list('name', 'stock'))
+
+    def test_restock(self):
+        restocked = restock_low_stock(chunk_size=2)
+        self.assertEqual(
+            sorted(restocked), [('Desk', 19), ('Lamp', 12), ('Sofa', 10)]
+        )
+        self.assertEqual(
+            self.stock(), {'Lamp': 12, 'Desk': 19, 'Chair': 10, 'Sofa': 10}
+        )
+        # Restocked products are no longer low on stock
+        self.assertEqual(restock_low_stock(), [])
+
+    def test_without_returning(self):
+        with mock.patch('crm.inventory.supports_update_returning', return_value=False):
+            restocked = restock_low_stock(chunk_size=2)
+        self.assertEqual(
+            sorted(restocked), [('Desk', 19), ('Lamp', 12), ('Sofa', 10)]
+        )
+        self.assertEqual(self.stock()['Chair'], 10)
+
+    def test_mutation_arguments(self):
+        result = schema.execute(
+            self.mutation, variable_values={'threshold': 3, 'increment': 5}
+        )
+        self.assertIsNone(result.errors)
+        data = result.data['updateLowStockProducts']
+        self.assertEqual(sorted(data['updatedProducts']), ['Lamp', 'Sofa'])
+        self.assertEqual(data['message'], 'Updated 2 products')
+        self.assertEqual(self.stock(), {'Lamp': 7, 'Desk': 9, 'Chair': 10, 'Sofa': 5})
+
+        result = schema.execute(self.mutation, variable_values={'increment': 0})
+        self.assertEqual(result.errors[0].message, 'Increment must be positive')
+
+    def test_cron_log(self):
+        with mock.patch('crm.cron.open', mock.mock_open()) as log:
+            update_low_stock()
+        lines = sorted(
+            call.args[0].split(' - ', 1)[1] for call in log().write.call_args_list
+        )
+        self.assertEqual(lines, [
+            'Restocked: Desk, New Stock: 19\n',
+            'Restocked: Lamp, New Stock: 12\n',
+            'Restocked: Sofa, New Stock: 10\n',
+            'Updated 3 products\n',
+        ])
+
+
+class DocumentCacheTests(TestCase):
+    """Documents are parsed once and evicted least recently used first"""
+
+    def test_hits_and_eviction(self):
+        documents = DocumentCache(max_size=2)
+        graphql_schema = schema.graphql_schema
+        first, second, third = (
+            '{ hello }', '{ allProducts { edges { node { name } } } }', '{ __typename }'
+        )
+        document, errors = documents.get_document(graphql_schema, first)
+        self.assertEqual(errors, [])
+        self.assertIs(documents.get_document(graphql_schema, first)[0], document)
+        documents.get_document(graphql_schema, second)
+        # first was used last, so second is evicted by third
+        documents.get_document(graphql_schema, first)
+        documents.get_document(graphql_schema, third)
+        self.assertEqual(documents.cache_info(), {
+            'hits': 2, 'misses': 3, 'max_size': 2, 'size': 2,
+        })
+        documents.get_document(graphql_schema, second)
+        self.assertEqual(documents.cache_info()['misses'], 4)
+        documents.get_document(graphql_schema, third)
+        self.assertEqual(documents.cache_info()['hits'], 3)
+
+    def test_invalid_documents(self):
+        documents = DocumentCache(max_size=2)
+        document, errors = documents.get_document(schema.graphql_schema, '{ nope }')
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(
+            documents.get_document(schema.graphql_schema, '{ nope }'), (document, errors)
+        )
+
+
+class PersistedQueryTests(TestCase):
+    """Clients register documents by hash, then send only the hash"""
+
+    query = '{ hello }'
+
+    def setUp(self):
+        cache.clear()
+
+    def post(self, query=None, sha256=None):
+        body = {'extensions': {'persistedQuery': {
+            'version': 1, 'sha256Hash': sha256 or document_hash(query or self.query),
+        }}}
+        if query:
+            body['query'] = query
+        return self.client.post(
+            '/graphql', json.dumps(body), content_type='application/json'
+        ).json()
+
+    def test_register_and_lookup(self):
+        response = self.post(sha256=document_hash(self.query))
+        self.assertEqual(
+            response['errors'][0]['extensions']['code'], 'PERSISTED_QUERY_NOT_FOUND'
+        )
+        with mock.patch('crm.documents.cache.set', wraps=cache.set) as cache_set:
+            self.assertEqual(self.post(self.query)['data'], {'hello': 'Hello, GraphQL!'})
+        self.assertEqual(cache_set.call_args.args[2], 86400)
+        response = self.post(sha256=document_hash(self.query))
+        self.assertEqual(response['data'], {'hello': 'Hello, GraphQL!'})
+
+    def test_hash_mismatch(self):
+        response = self.post(self.query, sha256=document_hash('{ other }'))
+        self.assertEqual(
+            response['errors'][0]['message'], 'Provided sha256Hash does not match query.'
+        )
+
+    def test_rejected_documents_not_registered(self):
+        expensive = '{ allOrders(first: 100) { edges { node { ' \
+            'products(first: 100) { edges { node { name } } } } } } }'
+        for query in ('{ nope }', '{ hello', expensive):
+            self.assertIn('errors', self.post(query))
+            response = self.post(sha256=document_hash(query))
+            self.assertEqual(
+                response['errors'][0]['extensions']['code'],
+                'PERSISTED_QUERY_NOT_FOUND',
+            )
+
+
+@override_settings(GRAPHENE={
+    **settings.GRAPHENE, 'RESULT_CACHE_FIELDS': ['allProducts', 'allCustomers'],
+})
+class ResultCacheTests(TestCase):
+    """Cached results are dropped once a model they read is written"""
+
+    products_query = '{ allProducts { edges { node { name stock } } } }'
+    customers_query = (
+        '{ allCustomers { edges { node { name '
+        'orders(first: 10) { edges { node { totalAmount } } } } } } }'
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.lamp = Product.objects.create(name='Lamp', price=Decimal('20.00'), stock=3)
+        cls.ada = Customer.objects.create(name='Ada', email='ada@example.com')
+
+    def setUp(self):
+        cache.clear()
+
+    def post(self, query, queries=None):
+        body = json.dumps({'query': query})
+        if queries is None:
+            response = self.client.post('/graphql', body, content_type='application/json')
+        else:
+            with self.assertNumQueries(queries):
+                response = self.client.post(
+                    '/graphql', body, content_type='application/json'
+                )
+        data = response.json()
+        self.assertNotIn('errors', data)
+        return data['data']
+
+    def product_names(self, queries=None):
+        data = self.post(self.products_query, queries)
+        return [
+            (edge['node']['name'], edge['node']['stock'])
+            for edge in data['allProducts']['edges']
+        ]
+
+    def test_cached(self):
+        self.assertEqual(self.product_names(), [('Lamp', 3)])
+        self.assertEqual(self.product_names(queries=0), [('Lamp', 3)])
+
+    def test_signals_invalidate(self):
+        self.product_names()
+        desk = Product.objects.create(name='Desk', price=Decimal('150.00'))
+        self.assertEqual(self.product_names(), [('Desk', 0), ('Lamp', 3)])
+        self.lamp.stock = 7
+        self.lamp.save()
+        self.assertEqual(self.product_names(), [('Desk', 0), ('Lamp', 7)])
+        desk.delete()
+        self.assertEqual(self.product_names(), [('Lamp', 7)])
+
+    def test_mutations_invalidate(self):
+        self.product_names()
+        self.post(
+            'mutation { bulkCreateProducts(input: [{name: "Desk", price: 150}]) '
+            '{ errors } }'
+        )
+        self.assertEqual(self.product_names(), [('Desk', 0), ('Lamp', 3)])
+        self.post('mutation { updateLowStockProducts { success } }')
+        self.assertEqual(self.product_names(), [('Desk', 10), ('Lamp', 13)])
+
+    def test_related_model_invalidates(self):
+        data = self.post(self.customers_query)
+        self.assertEqual(data['allCustomers']['edges'][0]['node']['orders']['edges'], [])
+        self.post(
+            'mutation { createOrder(input: {customerId: "%s", productIds: ["%s"]}) '
+            '{ order { id } } }' % (self.ada.pk, self.lamp.pk)
+        )
+        data = self.post(self.customers_query)
+        self.assertEqual(
+            data['allCustomers']['edges'][0]['node']['orders']['edges'],
+            [{'node': {'totalAmount': '20.00'}}],
+        )
+
+    @override_settings(GRAPHENE={
+        **settings.GRAPHENE, 'RESULT_CACHE_FIELDS': ['allOrders'],
+    })
+    def test_filter_arguments_invalidate(self):
+        order = Order.objects.create(customer=self.ada, total_amount=Decimal('20.00'))
+        order.products.add(self.lamp)
+        for argument, instance, new_name in [
+            ('customerName: "ada"', self.ada, 'Grace'),
+            ('productName: "lamp"', self.lamp, 'Desk'),
+        ]:
+            query = '{ allOrders(%s) { edges { node { totalAmount } } } }' % argument
+            self.assertEqual(len(self.post(query)['allOrders']['edges']), 1)
+            self.assertEqual(len(self.post(query, queries=0)['allOrders']['edges']), 1)
+            instance.name = new_name
+            instance.save()
+            self.assertEqual(self.post(query)['allOrders']['edges'], [])
+
+    def test_disabled_by_default(self):
+        with override_settings(GRAPHENE={
+            **settings.GRAPHENE, 'RESULT_CACHE_FIELDS': [],
+        }):
+            self.product_names()
+            with self.assertNumQueries(1):
+                self.product_names()
+
+
+class CustomerActivityTests(TestCase):
+    """The activity columns always equal a fresh aggregate of the orders"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.lamp = Product.objects.create(name='Lamp', price=Decimal('20.00'))
+        cls.desk = Product.objects.create(name='Desk', price=Decimal('150.00'))
+        cls.ada = Customer.objects.create(name='Ada', email='ada@example.com')
+        cls.grace = Customer.objects.create(name='Grace', email='grace@example.com')
+
+    def create_order(self, customer, *products):
+        result = schema.execute(
+            'mutation($input: OrderInput!) { createOrder(input: $input) '
+            '{ order { id } } }',
+            variable_values={'input': {
+                'customerId': customer.pk,
+                'productIds': [product.pk for product in products],
+            }},
+        )
+        self.assertIsNone(result.errors)
+        return Order.objects.latest('pk')
+
+    def assertActivityFresh(self):
+        expected = {
+            customer.pk: (
+                customer.orders.count(),
+                customer.orders.aggregate(total=Sum('total_amount'))['total']
+                or Decimal('0.00'),
+                customer.orders.aggregate(last=Max('order_date'))['last'],
+            )
+            for customer in Customer.objects.all()
+        }
+        actual = {
+            pk: (count, value, last)
+            for pk, count, value, last in Customer.objects.values_list(
+                'pk', 'order_count', 'lifetime_value', 'last_order_at'
+            )
+        }
+        self.assertEqual(actual, expected)
+
+    def test_create_and_delete(self):
+        first = self.create_order(self.ada, self.lamp)
+        self.create_order(self.ada, self.lamp, self.desk)
+        last = self.create_order(self.ada, self.desk)
+        self.create_order(self.grace, self.lamp)
+        self.assertActivityFresh()
+        self.ada.refresh_from_db()
+        self.assertEqual(self.ada.order_count, 3)
+        self.assertEqual(self.ada.lifetime_value, Decimal('340.00'))
+
+        # The latest order moves last_order_at back, an older one does not
+        last.delete()
+        self.assertActivityFresh()
+        first.delete()
+        self.assertActivityFresh()
+        Order.objects.filter(customer=self.ada).delete()
+        self.assertActivityFresh()
+
+    def test_rebuild_command(self):
+        for customer in (self.ada, self.ada, self.grace):
+            self.create_order(customer, self.lamp)
+        Customer.objects.update(
+            order_count=7, lifetime_value=Decimal('1.00'), last_order_at=None
+        )
+
+        out = StringIO()
+        call_command('rebuild_customer_activity', '--chunk-size', '1', stdout=out)
+        self.assertIn('Rebuilt activity for 2 customers', out.getvalue())
+        self.assertActivityFresh()
+
+    def test_activity_filters(self):
+        self.create_order(self.ada, self.desk)
+        self.create_order(self.grace, self.lamp)
+        order = self.create_order(self.grace, self.lamp)
+        Order.objects.filter(pk=order.pk).update(
+            order_date=timezone.now() - timedelta(days=30)
+        )
+        call_command('rebuild_customer_activity', stdout=StringIO())
+
+        def names(**data):
+            customers = CustomerFilter(data, queryset=Customer.objects.all()).qs
+            return sorted(customer.name for customer in customers)
+
+        self.assertEqual(names(lifetime_value__gte=100), ['Ada'])
+        self.assertEqual(names(lifetime_value__lte=40), ['Grace'])
+        self.assertEqual(names(order_count__gte=2), ['Grace'])
+        self.assertEqual(
+            names(last_order_at__gte=timezone.now() - timedelta(days=1)),
+            ['Ada', 'Grace'],
+        )
+        self.assertEqual(
+            names(last_order_at__lte=timezone.now() - timedelta(days=1)), []
+        )
+
+
+class FilterIndexTests(TestCase):
+    """Every indexed filter must be served without a full table scan"""
+    customers = 2000
+    products = 500
+    orders = 10000
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        # Spread the timestamps so the planner sees realistic selectivity
+        with ExitStack() as stack:
+            for model, name in [
+                (Customer, 'created_at'),
+                (Order, 'order_date'),
+                (Order, 'created_at'),
+            ]:
+                stack.enter_context(mock.patch.object(
+                    model._meta.get_field(name), 'auto_now_add', False
+                ))
+            customers = Customer.objects.bulk_create([
+                Customer(
+                    name=f"Customer {i}",
+                    email=f"customer{i}@example.com",
+                    phone=f"+1{i:010d}",
+                    created_at=now - timedelta(hours=i),
+                )
+                for i in range(cls.customers)
+            ])
+            products = Product.objects.bulk_create([
+                Product(
+                    name=f"Product {i}",
+                    price=Decimal(i % 1000) + Decimal('0.99'),
+                    stock=i % 200,
+                )
+                for i in range(cls.products)
+            ])
+            orders = Order.objects.bulk_create([
+                Order(
+                    customer=customers[i % cls.customers],
+                    total_amount=Decimal(i % 5000),
+                    order_date=now - timedelta(minutes=i),
+                    created_at=now - timedelta(minutes=i),
+                )
+                for i in range(cls.orders)
+            ])
+        OrderProduct = Order.products.through
+        OrderProduct.objects.bulk_create([
+            OrderProduct(order=order, product=products[i % cls.products])
+            for i, order in enumerate(orders)
+        ])
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # Any remaining Seq Scan means no usable index exists
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertNoFullScan(self, filterset_class, data):
+        queryset = filterset_class(
+            data, queryset=filterset_class._meta.model.objects.all()
+        ).qs
+        scans = full_table_scans(queryset)
+        self.assertEqual(scans, [], f"{filterset_class.__name__}({data})")
+
+    def test_order_filters(self):
+        now = timezone.now()
+        for data in [
+            {'order_date__gte': now - timedelta(hours=1)},
+            {'order_date__lte': now - timedelta(days=6)},
+            {'total_amount__gte': 4990},
+            {'total_amount__lte': 10},
+            {'product_id': Product.objects.first().pk},
+            {'customer_name': 'ustomer 12'},
+            {'product_name': 'roduct 4'},
+            {'search': 'customer 12'},
+        ]:
+            self.assertNoFullScan(OrderFilter, data)
+
+    def test_product_filters(self):
+        for data in [
+            {'stock': 5},
+            {'stock__gte': 198},
+            {'stock__lte': 1},
+            {'low_stock': 2},
+            {'price__gte': 995},
+            {'price__lte': 3},
+            {'search': 'product 4'},
+        ]:
+            self.assertNoFullScan(ProductFilter, data)
+
+    def test_customer_filters(self):
+        now = timezone.now()
+        for data in [
+            {'created_at__gte': now - timedelta(hours=10)},
+            {'created_at__lte': now - timedelta(days=80)},
+            {'phone_pattern': '+100000001'},
+            {'last_order_at__lte': now - timedelta(days=365)},
+            {'lifetime_value__gte': 1000},
+            {'lifetime_value__lte': 1},
+            {'last_order_at__gte': now - timedelta(hours=1)},
+            {'search': 'customer12'},
+        ]:
+            self.assertNoFullScan(CustomerFilter, data)
+
+
+class SearchTests(TestCase):
+    """The search filter matches every word as a prefix, best first"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ada = Customer.objects.create(
+            name="Ada Lovelace", email="ada@example.com"
+        )
+        cls.grace = Customer.objects.create(
+            name="Grace Hopper", email="grace@navy.example.com"
+        )
+        cls.widget = Product.objects.create(
+            name="Blue Widget", price=Decimal('9.99')
+        )
+        cls.order = Order.objects.create(
+            customer=cls.grace, total_amount=Decimal('9.99')
+        )
+        cls.order.products.add(cls.widget)
+
+    def search(self, filterset_class, value):
+        return list(filterset_class(
+            {'search': value},
+            queryset=filterset_class._meta.model.objects.all(),
+        ).qs)
+
+    def test_customer_search(self):
+        self.assertEqual(self.search(CustomerFilter, 'lovel ada'), [self.ada])
+        self.assertEqual(self.search(CustomerFilter, 'navy'), [self.grace])
+        self.assertEqual(self.search(CustomerFilter, 'ada grace'), [])
+        self.assertEqual(self.search(CustomerFilter, '%'), [])
+
+    def test_index_follows_updates(self):
+        self.ada.name = "Augusta King"
+        self.ada.save()
+        self.assertEqual(self.search(CustomerFilter, 'augusta'), [self.ada])
+        self.assertEqual(self.search(CustomerFilter, 'lovelace'), [])
+        self.grace.delete()
+        self.assertEqual(self.search(CustomerFilter, 'grace'), [])
+
+    def test_order_search(self):
+        self.assertEqual(self.search(OrderFilter, 'hopper'), [self.order])
+        self.assertEqual(self.search(OrderFilter, 'widg'), [self.order])
+        self.assertEqual(self.search(ProductFilter, 'widg'), [self.widget])
+
+    def test_name_filters_match_substrings(self):
+        def orders(**data):
+            return list(OrderFilter(data, queryset=Order.objects.all()).qs)
+
+        self.assertEqual(orders(customer_name='OPPE'), [self.order])
+        self.assertEqual(orders(customer_name='ace hop'), [self.order])
+        self.assertEqual(orders(customer_name='ra'), [self.order])
+        self.assertEqual(orders(customer_name='lovelace'), [])
+        self.assertEqual(orders(product_name='idge'), [self.order])
+        self.assertEqual(orders(product_name='"'), [])
+        self.grace.name = "Grace Brewster"
+        self.grace.save()
+        self.assertEqual(orders(customer_name='hop'), [])
+        self.assertEqual(orders(customer_name='rews'), [self.order])
+
+    def test_ranking(self):
+        Customer.objects.create(
+            name="Ada Ada", email="twice@example.com"
+        )
+        names = [c.name for c in self.search(CustomerFilter, 'ada')]
+        self.assertEqual(names, ["Ada Ada", "Ada Lovelace"])
+
+
+
+class KeysetPaginationTests(TestCase):
+    """Keyset cursors walk the same rows as the ordering, ties included"""
+
+    @classmethod
+    def setUpTestData(cls):
+        customer = Customer.objects.create(
+            name="Ada Lovelace", email="ada@example.com"
+        )
+        Order.objects.bulk_create([
+            Order(customer=customer, total_amount=Decimal(i % 3))
+            for i in range(25)
+        ])
+        # Give most orders the same date so the id tie-breaker matters
+        Order.objects.filter(pk__lte=20).update(order_date=timezone.now())
+
+    def page(self, arguments):
+        result = schema.execute(
+            'query ($first: Int, $last: Int, $after: String, '
+            '$before: String, $orderBy: String) { allOrders(first: $first, '
+            'last: $last, after: $after, before: $before, orderBy: $orderBy) '
+            '{ pageInfo { hasNextPage hasPreviousPage startCursor endCursor } '
+            'edges { node { id } } } }',
+            variable_values=arguments,
+        )
+        self.assertIsNone(result.errors)
+        page = result.data['allOrders']
+        pks = [int(from_global_id(edge['node']['id'])[1]) for edge in page['edges']]
+        return pks, page['pageInfo']
+
+    def walk(self, order_by=None):
+        pks, after = [], None
+        while True:
+            page, info = self.page(
+                {'first': 4, 'after': after, 'orderBy': order_by}
+            )
+            pks += page
+            if not info['hasNextPage']:
+                return pks
+            after = info['endCursor']
+
+    def test_forward(self):
+        expected = list(
+            Order.objects.order_by('-order_date', '-pk').values_list('pk', flat=True)
+        )
+        self.assertEqual(self.walk(), expected)
+
+    def test_order_by(self):
+        expected = list(
+            Order.objects.order_by('-total_amount', '-pk').values_list('pk', flat=True)
+        )
+        self.assertEqual(self.walk('-total_amount'), expected)
+
+    def test_backward(self):
+        pks, info = self.page({'first': 10})
+        before, _ = self.page({'last': 3, 'before': info['endCursor']})
+        self.assertEqual(before, pks[6:9])
+        last, info = self.page({'last': 2})
+        self.assertEqual(last, self.walk()[-2:])
+        self.assertTrue(info['hasPreviousPage'])
+
+    def test_first_and_last(self):
+        expected = self.walk()
+        pks, info = self.page({'first': 3, 'last': 5})
+        self.assertEqual(pks, expected[:3])
+        self.assertFalse(info['hasPreviousPage'])
+        pks, info = self.page({'first': 5, 'last': 2})
+        self.assertEqual(pks, expected[3:5])
+        self.assertTrue(info['hasPreviousPage'])
+        result = schema.execute(
+            '{ allCustomers(first: 3, last: 5) { edges { node { name } } } }'
+        )
+        self.assertEqual(len(result.data['allCustomers']['edges']), 1)
+
+    def test_count_only_when_selected(self):
+        query = '{ allOrders(first: 2) { %s edges { node { id } } } }'
+        with self.assertNumQueries(1):
+            schema.execute(query % '')
+        with self.assertNumQueries(2):
+            result = schema.execute(query % 'totalCount')
+        self.assertEqual(result.data['allOrders']['totalCount'], 25)
+        result = schema.execute(query % 'totalCount(approximate: true)')
+        self.assertEqual(result.data['allOrders']['totalCount'], 25)
+
+
+class ExportTests(TestCase):
+    """Exports stream every matching row to staff only"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(
+            'ops', 'ops@example.com', 'pw', is_staff=True
+        )
+        customers = Customer.objects.bulk_create([
+            Customer(name=f'Customer {i}', email=f'customer{i}@example.com')
+            for i in range(5)
+        ])
+        Order.objects.bulk_create([
+            Order(customer=customers[i % 5], total_amount=Decimal(i))
+            for i in range(30)
+        ])
+
+    def export(self, path, queries=None):
+        self.client.force_login(self.staff)
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        # The rows are read while the response is streamed
+        with self.assertNumQueries(queries):
+            return b''.join(response.streaming_content).decode()
+
+    def test_staff_only(self):
+        for path in ('/export/customers', '/graphql/cache'):
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 302, path)
+        # Scrapers are not redirected to a login page
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.client.force_login(
+            User.objects.create_user('ada', 'ada@example.com', 'pw')
+        )
+        self.assertEqual(self.client.get('/export/customers').status_code, 302)
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+
+    def test_ndjson(self):
+        content = self.export('/export/orders?total_amount__gte=20', queries=1)
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(
+            {row['customer_email'] for row in rows},
+            {f'customer{i}@example.com' for i in range(5)},
+        )
+        self.assertEqual(
+            sorted(Decimal(row['total_amount']) for row in rows),
+            [Decimal(i) for i in range(20, 30)],
+        )
+
+    def test_csv(self):
+        content = self.export('/export/customers?format=csv', queries=1)
+        lines = content.splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'name', 'email'])
+        self.assertEqual(len(lines), 6)
+
+    def test_bad_requests(self):
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get('/export/invoices').status_code, 404)
+        self.assertEqual(
+            self.client.get('/export/orders?format=xml').status_code, 400
+        )
+
+
+class DailyRollupTests(TestCase):
+    """Daily rollups follow order deletes, counting customers once per day"""
+
+    def snapshot(self):
+        return list(DailyOrderRollup.objects.order_by('date').values_list(
+            'date', 'order_count', 'revenue', 'customer_count'
+        ))
+
+    def test_delete_same_day_orders(self):
+        ada = Customer.objects.create(name='Ada', email='ada@example.com')
+        grace = Customer.objects.create(name='Grace', email='grace@example.com')
+        for customer, amount in [(ada, 10), (ada, 20), (ada, 30), (grace, 40)]:
+            Order.objects.create(customer=customer, total_amount=Decimal(amount))
+        today = timezone.localdate()
+        rebuild_rollup_range(today, today)
+
+        # Every order of Ada that day goes in one DELETE
+        Order.objects.filter(customer=ada).delete()
+        rollup = DailyOrderRollup.objects.get(date=today)
+        self.assertEqual(
+            (rollup.order_count, rollup.revenue, rollup.customer_count),
+            (1, Decimal('40.00'), 1),
+        )
+        maintained = self.snapshot()
+        rebuild_rollup_range(today, today)
+        self.assertEqual(maintained, self.snapshot())
+
+        Order.objects.all().delete()
+        self.assertFalse(DailyOrderRollup.objects.exists())
+
+    def test_deferred_rebuild(self):
+        ada = Customer.objects.create(name='Ada', email='ada@example.com')
+        Order.objects.bulk_create([
+            Order(customer=ada, total_amount=Decimal(amount))
+            for amount in range(1, 21)
+        ])
+        today = timezone.localdate()
+        rebuild_rollup_range(today, today)
+
+        with mock.patch(
+            'crm.rollups.rebuild_daily_rollups', wraps=rebuild_daily_rollups
+        ) as rebuild:
+            with deferred_rollups():
+                Order.objects.filter(total_amount__gt=5).delete()
+        rebuild.assert_called_once_with(today, today)
+        rollup = DailyOrderRollup.objects.get(date=today)
+        self.assertEqual(
+            (rollup.order_count, rollup.revenue, rollup.customer_count),
+            (5, Decimal('15.00'), 1),
+        )
+
+    def test_report_reads_rollups(self):
+        ada = Customer.objects.create(name='Ada', email='ada@example.com')
+        Customer.objects.create(name='Grace', email='grace@example.com')
+        for days_ago in (0, 0, 1):
+            order = Order.objects.create(customer=ada, total_amount=Decimal('10.00'))
+            Order.objects.filter(pk=order.pk).update(
+                order_date=timezone.now() - timedelta(days=days_ago)
+            )
+        rebuild_rollup_range(timezone.localdate() - timedelta(days=1), timezone.localdate())
+
+        with mock.patch('crm.tasks.open', mock.mock_open()) as log:
+            with self.assertNumQueries(1):
+                generate_crm_report()
+        line = log().write.call_args.args[0]
+        self.assertRegex(line, r'Report: 2 customer-days, 3 orders, 30(\.00)? revenue')
+
+
+class QueryLimitTests(TestCase):
+    """Deep or expensive operations are rejected before any query runs"""
+
+    def post(self, query, variables=None):
+        return self.client.post(
+            '/graphql', json.dumps({'query': query, 'variables': variables}),
+            content_type='application/json',
+        )
+
+    def test_cost_in_extensions(self):
+        with self.assertNumQueries(1):
+            response = self.post('{ allProducts(first: 5) { edges { node { name } } } }')
+        self.assertEqual(response.status_code, 200)
+        # 5 edges, each resolving one node
+        self.assertEqual(response.json()['extensions']['cost']['estimated'], 6)
+
+    def test_too_deep(self):
+        query = '{ allOrders { edges { node { customer { orders { edges { node { ' \
+            'customer { orders { edges { node { customer { orders { edges { ' \
+            'node { id } } } } } } } } } } } } } } } }'
+        with self.assertNumQueries(0):
+            response = self.post(query)
+        error = response.json()['errors'][0]
+        self.assertEqual(error['extensions']['code'], 'QUERY_TOO_DEEP')
+
+    def test_default_nested_query(self):
+        for query in [
+            '{ allOrders { edges { node { customer { email } '
+            'products { edges { node { name } } } } } } }',
+            '{ allCustomers { totalCount edges { node { name '
+            'orders { totalCount edges { node { id } } } } } } }',
+        ]:
+            response = self.post(query)
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertNotIn('errors', response.json())
+
+    def test_oversized_nested_query(self):
+        # Sizes given explicitly are priced as asked
+        query = '{ allOrders(first: 100) { edges { node { ' \
+            'products(first: 100) { edges { node { name ' \
+            'orders(first: 100) { edges { node { id } } } } } } } } } }'
+        with self.assertNumQueries(0):
+            response = self.post(query)
+        self.assertEqual(response.status_code, 400)
+        error = response.json()['errors'][0]
+        self.assertEqual(error['extensions']['code'], 'QUERY_TOO_COMPLEX')
+
+    def test_size_variables(self):
+        query = 'query ($n: Int) { allOrders(first: $n) { edges { node { id } } } }'
+        for value in ['5', 'abc', [1, 2], 3.5]:
+            with self.assertNumQueries(0):
+                response = self.post(query, {'n': value})
+            self.assertEqual(response.status_code, 400, value)
+            self.assertIn('$n', response.json()['errors'][0]['message'])
+        # The connection itself, then one node per row
+        response = self.post(query, {'n': -5})
+        self.assertEqual(response.json()['extensions']['cost']['estimated'], 1)
+        response = self.post(query, {'n': 4})
+        self.assertEqual(response.json()['extensions']['cost']['estimated'], 5)
+
+    @override_settings(GRAPHENE={'MAX_QUERY_COST': 1000})
+    def test_too_complex(self):
+        query = '{ allOrders(first: 50) { edges { node { ' \
+            'products(first: 50) { edges { node { name } } } } } } }'
+        with self.assertNumQueries(0):
+            response = self.post(query)
+        self.assertEqual(response.status_code, 400)
+        error = response.json()['errors'][0]
+        self.assertEqual(error['extensions']['code'], 'QUERY_TOO_COMPLEX')
+
+
+class MetricsTests(TestCase):
+    """Operations and resolvers are timed and exposed on /metrics"""
+
+    @classmethod
+    def setUpTestData(cls):
+        customer = Customer.objects.create(name='Ada', email='ada@example.com')
+        Order.objects.create(customer=customer, total_amount=Decimal('5.00'))
+
+    @override_settings(DEBUG=True)
+    def test_debug_timings(self):
+        query = 'query Recent { allOrders(first: 5) { edges { node { customer { name } } } } }'
+        response = self.client.post(
+            '/graphql', json.dumps({'query': query}),
+            content_type='application/json', HTTP_X_GRAPHQL_DEBUG='1',
+        )
+        timing = response.json()['extensions']['timing']
+        self.assertEqual(timing['operation'], 'Recent')
+        self.assertGreaterEqual(timing['sqlQueries'], 1)
+        paths = {resolver['path'] for resolver in timing['resolvers']}
+        self.assertEqual(paths, {'allOrders', 'allOrders.edges.node.customer'})
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 401)
+        self.client.force_login(
+            User.objects.create_user('ops', 'ops@example.com', 'pw', is_staff=True)
+        )
+        response = self.client.get('/metrics')
+        self.assertContains(response, 'crm_graphql_operation_seconds_count{operation="Recent"}')
+        self.assertContains(response, 'crm_graphql_resolver_sql_queries_bucket{path="allOrders",le="1"}')
+
+    @override_settings(GRAPHENE={**settings.GRAPHENE, 'METRICS_TOKEN': 's3cret'})
+    def test_scrape_with_token(self):
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        for header in ['Bearer wrong', 'Basic s3cret', '']:
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION=header)
+            self.assertEqual(response.status_code, 401, header)
+
+    def test_no_timings_without_header(self):
+        response = self.client.post(
+            '/graphql', json.dumps({'query': '{ allOrders(first: 1) { edges { node { id } } } }'}),
+            content_type='application/json',
+        )
+        self.assertNotIn('timing', response.json()['extensions'])
+
+
+class BenchmarkTests(TestCase):
+    """The benchmark datasets are reproducible and regressions are flagged"""
+
+    def test_seed_dataset(self):
+        seed_dataset(300, seed=7)
+        self.assertEqual(Order.objects.count(), 300)
+        self.assertEqual(
+            Order.products.through.objects.values('order').distinct().count(), 300
+        )
+        first = list(Order.objects.order_by('pk').values_list('total_amount', flat=True))
+        clear_dataset()
+        seed_dataset(300, seed=7)
+        again = list(Order.objects.order_by('pk').values_list('total_amount', flat=True))
+        self.assertEqual(first, again)
+
+    def test_compare_results(self):
+        before = {'1000': {'allOrders': {
+            'p50_ms': 10.0, 'p95_ms': 20.0, 'queries': 2, 'peak_kb': 400.0,
+        }}}
+        after = {'1000': {'allOrders': {
+            'p50_ms': 10.5, 'p95_ms': 30.0, 'queries': 3, 'peak_kb': 410.0,
+        }}}
+        regressions = compare_results(before, after, threshold=0.2)
+        self.assertEqual(
+            [(metric, old, new) for _, _, metric, old, new in regressions],
+            [('p95_ms', 20.0, 30.0), ('queries', 2, 3)],
+        )
+
+
+class LocalClientTests(TestCase):
+    """Documents run in process with the same result shape as over HTTP"""
+
+    def test_execute(self):
+        Product.objects.create(name='Lamp', price=Decimal('20.00'), stock=3)
+        client = LocalClient()
+        data = client.execute(
+            'query($n: Int) { allProducts(first: $n) { edges { node { name } } } }',
+            variable_values={'n': 5},
+        )
+        self.assertEqual(data, {'allProducts': {'edges': [{'node': {'name': 'Lamp'}}]}})
+        with self.assertRaises(TransportQueryError) as raised:
+            client.execute('{ missing }')
+        self.assertIn('missing', raised.exception.errors[0]['message'])
+
+
+class BulkMutationTests(TestCase):
+    """Bulk mutations validate every row and insert the valid ones in bulk"""
+
+    def execute(self, query, rows):
+        result = schema.execute(
+            query,
+            variable_values={'input': rows},
+            context_value=SimpleNamespace(),
+        )
+        self.assertIsNone(result.errors)
+        return result.data
+
+    customers_mutation = (
+        'mutation($input: [CustomerInput]!) { bulkCreateCustomers(input: $input) '
+        '{ customers { email } errors } }'
+    )
+
+    def test_bulk_create_customers(self):
+        Customer.objects.create(name='Ada', email='ada@example.com')
+        with self.assertNumQueries(4):
+            # One email lookup, then one INSERT inside a savepoint
+            data = self.execute(self.customers_mutation, [
+                {'name': 'Grace', 'email': 'grace@example.com', 'phone': '+12345678901'},
+                {'name': 'Ada', 'email': 'ada@example.com'},
+                {'name': 'Alan', 'email': 'alan@example.com', 'phone': '12345'},
+                {'name': 'Grace', 'email': 'grace@example.com'},
+                {'name': 'Edsger', 'email': 'not-an-email'},
+                {'name': 'Barbara', 'email': 'barbara@example.com'},
+            ])['bulkCreateCustomers']
+        self.assertEqual(
+            data['customers'],
+            [{'email': 'grace@example.com'}, {'email': 'barbara@example.com'}],
+        )
+        self.assertEqual(data['errors'][:3], [
+            "Row 2: Email 'ada@example.com' already exists",
+            "Row 3: Invalid phone format for '12345'",
+            "Row 4: Email 'grace@example.com' already exists",
+        ])
+        self.assertTrue(data['errors'][3].startswith('Row 5: '))
+        self.assertEqual(Customer.objects.count(), 3)
+
+    def test_bulk_create_customers_nothing_valid(self):
+        with mock.patch('crm.schema.bump_versions') as bump:
+            data = self.execute(self.customers_mutation, [
+                {'name': 'Edsger', 'email': 'not-an-email'},
+            ])['bulkCreateCustomers']
+        self.assertEqual(data['customers'], [])
+        bump.assert_not_called()
+
+    def test_bulk_create_customers_concurrent_insert(self):
+        # The email is taken after the lookup, so the batch INSERT fails
+        Customer.objects.create(name='Ada', email='ada@example.com')
+        with mock.patch(
+            'crm.schema.BulkCreateCustomers.existing_emails', return_value=set()
+        ):
+            data = self.execute(self.customers_mutation, [
+                {'name': 'Grace', 'email': 'grace@example.com'},
+                {'name': 'Ada', 'email': 'ada@example.com'},
+            ])['bulkCreateCustomers']
+        self.assertEqual(data['customers'], [{'email': 'grace@example.com'}])
+        self.assertEqual(
+            data['errors'], ["Row 2: Email 'ada@example.com' already exists"]
+        )
+        self.assertEqual(Customer.objects.count(), 2)
+
+    def test_bulk_create_products(self):
+        data = self.execute(
+            'mutation($input: [ProductInput]!) { bulkCreateProducts(input: $input) '
+            '{ products { name stock } errors } }',
+            [
+                {'name': 'Lamp', 'price': '20.00', 'stock': 3},
+                {'name': 'Free', 'price': '0'},
+                {'name': 'Desk', 'price': '150.00'},
+                {'name': 'Chair', 'price': '40.00', 'stock': -1},
+            ],
+        )['bulkCreateProducts']
+        self.assertEqual(
+            data['products'], [{'name': 'Lamp', 'stock': 3}, {'name': 'Desk', 'stock': 0}]
+        )
+        self.assertEqual(data['errors'], [
+            'Row 2: Price must be positive',
+            'Row 4: Stock cannot be negative',
+        ])
+
+    def test_bulk_create_orders(self):
+        ada = Customer.objects.create(name='Ada', email='ada@example.com')
+        lamp = Product.objects.create(name='Lamp', price=Decimal('20.00'), stock=3)
+        desk = Product.objects.create(name='Desk', price=Decimal('150.00'), stock=1)
+        ordered_at = timezone.now() - timedelta(days=40)
+
+        with CaptureQueriesContext(connection) as queries:
+            data = self.execute(
+                'mutation($input: [OrderInput]!) { bulkCreateOrders(input: $input) '
+                '{ orders { totalAmount orderDate } errors } }',
+                [
+                    {'customerId': ada.pk, 'productIds': [lamp.pk, desk.pk, lamp.pk],
+                     'orderDate': ordered_at.isoformat()},
+                    {'customerId': 999, 'productIds': [lamp.pk]},
+                    {'customerId': ada.pk, 'productIds': [desk.pk]},
+                    {'customerId': ada.pk, 'productIds': [lamp.pk, 'x', 999]},
+                    {'customerId': ada.pk, 'productIds': []},
+                ],
+            )['bulkCreateOrders']
+
+        # One in_bulk per table and one INSERT per table, whatever the rows
+        statements = [query['sql'].split(' WHERE ')[0] for query in queries]
+        for table in ('crm_customer', 'crm_product'):
+            self.assertEqual(
+                sum(sql.startswith('SELECT') and sql.endswith(f'FROM "{table}"')
+                    for sql in statements), 1
+            )
+        for table in ('crm_order', 'crm_order_products'):
+            self.assertEqual(
+                sum(sql.startswith(f'INSERT INTO "{table}"') for sql in statements), 1
+            )
+
+        self.assertEqual(
+            [order['totalAmount'] for order in data['orders']], ['170.00', '150.00']
+        )
+        self.assertEqual(data['errors'], [
+            "Row 2: Customer with ID '999' does not exist",
+            "Row 4: Products with IDs 'x', '999' do not exist",
+            'Row 5: At least one product must be selected',
+        ])
+        first = Order.objects.order_by('order_date').first()
+        self.assertEqual(first.order_date, ordered_at)
+        self.assertEqual(set(first.products.all()), {lamp, desk})
+
+        ada.refresh_from_db()
+        self.assertEqual(ada.order_count, 2)
+        self.assertEqual(ada.lifetime_value, Decimal('320.00'))
+        totals = rollup_totals()
+        self.assertEqual(totals['order_count'], 2)
+        self.assertEqual(totals['revenue'], Decimal('320.00'))
+
+
+class BatchRequestTests(TestCase):
+    """A JSON array of operations is answered by an array of results"""
+
+    def post(self, body):
+        return self.client.post(
+            '/graphql', json.dumps(body), content_type='application/json'
+        )
+
+    def test_batch(self):
+        response = self.post([
+            {'id': 'create', 'query': 'mutation { createProduct(input: '
+             '{name: "Lamp", price: "20.00", stock: 3}) { product { name } } }'},
+            {'id': 'low', 'query': '{ allProducts(lowStock: 10) '
+             '{ edges { node { name } } } }'},
+            {'id': 'hello', 'query': '{ hello }'},
+            {'id': 'bad', 'query': '{ missing }'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        results = response.json()
+        self.assertEqual([r['id'] for r in results], ['create', 'low', 'hello', 'bad'])
+        self.assertEqual([r['status'] for r in results], [200, 200, 200, 400])
+        self.assertEqual(
+            results[1]['data']['allProducts']['edges'], [{'node': {'name': 'Lamp'}}]
+        )
+        self.assertEqual(results[2]['data'], {'hello': 'Hello, GraphQL!'})
+
+    def test_shared_loaders(self):
+        customer = Customer.objects.create(name='Ada', email='ada@example.com')
+        Order.objects.create(customer=customer, total_amount=Decimal('5.00'))
+        query = '{ allOrders(first: 1) { edges { node { customer { name } } } } }'
+        with mock.patch('crm.schema.Order.customer.is_cached', return_value=False):
+            # One page of orders per operation, the customer loaded once
+            with self.assertNumQueries(3):
+                response = self.post([{'query': query}, {'query': query}])
+        names = [
+            r['data']['allOrders']['edges'][0]['node']['customer']['name']
+            for r in response.json()
+        ]
+        self.assertEqual(names, ['Ada', 'Ada'])
+
+    @override_settings(GRAPHENE={**settings.GRAPHENE, 'MAX_BATCH_SIZE': 2})
+    def test_max_batch_size(self):
+        response = self.post([{'query': '{ hello }'}] * 3)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('at most 2 operations', response.json()['errors'][0]['message'])
+        self.assertEqual(self.post([]).status_code, 400)
+
+
+class AsyncGraphQLViewTests(TransactionTestCase):
+    """/graphql/async answers like /graphql, loading root fields concurrently"""
+
+    query = '''{
+        allOrders(first: 5) { totalCount edges { node {
+            totalAmount customer { name } products { edges { node { name } } }
+        } } }
+        allProducts(first: 5) { edges { node { name orders { totalCount } } } }
+    }'''
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name='Ada', email='ada@example.com')
+        lamp = Product.objects.create(name='Lamp', price=Decimal('20.00'), stock=3)
+        self.order = Order.objects.create(
+            customer=self.customer, total_amount=Decimal('20.00')
+        )
+        self.order.products.add(lamp)
+
+    async def post(self, path, query):
+        response = await self.async_client.post(
+            path, json.dumps({'query': query}), content_type='application/json'
+        )
+        return response.status_code, response.json()
+
+    async def test_query_matches_sync_view(self):
+        expected = await self.post('/graphql', self.query)
+        status, body = await self.post('/graphql/async', self.query)
+        self.assertEqual(status, 200)
+        self.assertNotIn('errors', body)
+        self.assertEqual(body['data'], expected[1]['data'])
+        self.assertEqual(body['data']['allOrders']['totalCount'], 1)
+
+    async def test_mutation(self):
+        status, body = await self.post(
+            '/graphql/async',
+            'mutation { createCustomer(input: {name: "Bo", email: "bo@example.com"}) '
+            '{ customer { name } } }',
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(body['data']['createCustomer']['customer']['name'], 'Bo')
+        self.assertTrue(await Customer.objects.filter(email='bo@example.com').aexists())
+
+    async def test_calls_run_concurrently(self):
+        # Each call waits for the other, which only returns on two threads
+        barrier = threading.Barrier(2, timeout=5)
+        indexes = await asyncio.gather(
+            run_in_thread(None, barrier.wait), run_in_thread(None, barrier.wait)
+        )
+        self.assertEqual(sorted(indexes), [0, 1])
+
+    async def test_loaders(self):
+        info = SimpleNamespace(context=SimpleNamespace(async_execution=True))
+        loaders = get_loaders(info)
+        customer, products = await asyncio.gather(
+            loaders.customer.load(self.customer.pk),
+            loaders.order_products.load((self.order.pk, None)),
+        )
+        self.assertEqual(customer.name, 'Ada')
+        self.assertEqual([product.name for product in products], ['Lamp'])
+
+
+class PurgeInactiveCustomersTests(TestCase):
+    """Inactive customers go in batches, active and new ones stay"""
+
+    def test_purge(self):
+        long_ago = timezone.now() - timedelta(days=800)
+        product = Product.objects.create(name='Lamp', price=Decimal('20.00'), stock=3)
+        customers = {}
+        for name in ('lapsed', 'active', 'never', 'new'):
+            customers[name] = Customer.objects.create(name=name, email=f'{name}@example.com')
+        Customer.objects.exclude(name='new').update(created_at=long_ago)
+        for name, when in (('lapsed', long_ago), ('lapsed', long_ago), ('active', timezone.now())):
+            order = Order.objects.create(customer=customers[name], total_amount=Decimal('20.00'))
+            Order.objects.filter(pk=order.pk).update(order_date=when)
+            order.products.add(product)
+        rebuild_rollup_range(long_ago.date(), timezone.now().date())
+
+        out = StringIO()
+        call_command('purge_inactive_customers', '--batch-size', '1', stdout=out)
+        self.assertIn('Deleted 2 inactive customers and 2 orders', out.getvalue())
+        self.assertEqual(
+            set(Customer.objects.values_list('name', flat=True)), {'active', 'new'}
+        )
+        self.assertEqual(rollup_totals()['order_count'], Order.objects.count())
+
+    @override_settings(GRAPHENE={
+        **settings.GRAPHENE, 'RESULT_CACHE_FIELDS': ['allCustomers'],
+    })
+    def test_purge_invalidates_caches_and_rollups(self):
+        cache.clear()
+        long_ago = timezone.now() - timedelta(days=800)
+        lapsed = Customer.objects.create(name='lapsed', email='lapsed@example.com')
+        active = Customer.objects.create(name='active', email='active@example.com')
+        Customer.objects.update(created_at=long_ago)
+        for customer, when in ((lapsed, long_ago), (lapsed, long_ago), (active, long_ago)):
+            order = Order.objects.create(customer=customer, total_amount=Decimal('5.00'))
+            Order.objects.filter(pk=order.pk).update(order_date=when)
+        Order.objects.create(customer=active, total_amount=Decimal('7.00'))
+        rebuild_rollup_range(long_ago.date(), timezone.now().date())
+
+        body = json.dumps({'query': '{ allCustomers { edges { node { name } } } }'})
+
+        def customer_names():
+            response = self.client.post('/graphql', body, content_type='application/json')
+            return [
+                edge['node']['name']
+                for edge in response.json()['data']['allCustomers']['edges']
+            ]
+
+        self.assertEqual(sorted(customer_names()), ['active', 'lapsed'])
+        pks, deleted = purge_inactive_batch(timezone.now() - timedelta(days=365))
+        self.assertEqual((pks, deleted), ([lapsed.pk], 2))
+        self.assertEqual(customer_names(), ['active'])
+        rollup = DailyOrderRollup.objects.get(date=timezone.localdate(long_ago))
+        self.assertEqual(
+            (rollup.order_count, rollup.revenue, rollup.customer_count),
+            (1, Decimal('5.00'), 1),
+        )
+        self.assertEqual(rollup_totals()['order_count'], Order.objects.count())
+
+    def test_batch_queries_bounded(self):
+        long_ago = timezone.now() - timedelta(days=800)
+        product = Product.objects.create(name='Lamp', price=Decimal('20.00'))
+
+        def purge(orders_each):
+            customers = Customer.objects.bulk_create([
+                Customer(name=f'c{i}', email=f'c{orders_each}-{i}@example.com')
+                for i in range(5)
+            ])
+            Customer.objects.update(created_at=long_ago)
+            orders = Order.objects.bulk_create([
+                Order(customer=customer, total_amount=Decimal('20.00'), order_date=long_ago)
+                for customer in customers for _ in range(orders_each)
+            ])
+            Order.products.through.objects.bulk_create([
+                Order.products.through(order=order, product=product) for order in orders
+            ])
+            rebuild_rollup_range(long_ago.date(), long_ago.date())
+            with CaptureQueriesContext(connection) as queries:
+                _, deleted = purge_inactive_batch(timezone.now() - timedelta(days=365))
+            self.assertEqual(deleted, 5 * orders_each)
+            return len(queries)
+
+        # The same statements for 5 or 50 orders, one rebuild for their day
+        queries = purge(1)
+        self.assertEqual(purge(10), queries)
+        self.assertLess(queries, 15)
+        self.assertFalse(DailyOrderRollup.objects.exists())
+
+
+class OrderReportTests(TestCase):
+    """The partitioned report chord adds up to the whole order table"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Subtasks run in process, no Redis needed
+        cls.celery_conf = {
+            key: celery_app.conf[key]
+            for key in ('task_always_eager', 'broker_url', 'result_backend')
+        }
+        celery_app.conf.update(
+            task_always_eager=True,
+            broker_url='memory://',
+            result_backend='cache+memory://',
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        celery_app.conf.update(cls.celery_conf)
+        super().tearDownClass()
+
+    def setUp(self):
+        seed_dataset(400, customers=60, products=15, seed=3)
+
+    def run_report(self, **kwargs):
+        with mock.patch('crm.tasks.open', mock.mock_open()):
+            return order_report_chord(**kwargs).apply_async().get()
+
+    def test_totals(self):
+        report = self.run_report(partition_size=7)
+        totals = Order.objects.aggregate(
+            revenue=Sum('total_amount'), customers=Count('customer', distinct=True)
+        )
+        self.assertEqual(report['order_count'], 400)
+        self.assertEqual(
+            Decimal(report['revenue']), totals['revenue'].quantize(Decimal('0.01'))
+        )
+        self.assertEqual(report['customer_count'], totals['customers'])
+        self.assertEqual(report['units'], Order.products.through.objects.count())
+
+    def test_breakdowns(self):
+        since = (timezone.now() - timedelta(days=90)).isoformat()
+        report = self.run_report(
+            since=since, breakdowns=['customers', 'products'], top=5, partition_size=7
+        )
+        recent = Order.objects.filter(order_date__gte=since)
+        self.assertEqual(report['order_count'], recent.count())
+
+        top_customer = (
+            recent.values('customer').annotate(revenue=Sum('total_amount'))
+            .order_by('-revenue').first()
+        )
+        self.assertEqual(len(report['customers']), 5)
+        self.assertEqual(report['customers'][0]['id'], top_customer['customer'])
+
+        units = Order.products.through.objects.filter(
+            order__order_date__gte=since, product=report['products'][0]['id']
+        ).count()
+        self.assertEqual(report['products'][0]['units'], units)
+        self.assertEqual(
+            report['products'][0]['name'],
+            Product.objects.get(pk=report['products'][0]['id']).name,
+        )
+
+    def test_unknown_breakdown(self):
+        with self.assertRaises(ValueError):
+            order_report_chord(breakdowns=['regions'])
+
+
+class AdminTests(TestCase):
+    """Admin pages cost the same number of queries at any row count"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        cls.ada = Customer.objects.create(
+            name="Ada Lovelace", email="ada@example.com", phone="+15551230000"
+        )
+        cls.grace = Customer.objects.create(
+            name="Grace Hopper", email="grace@example.com", phone="+44200000000"
+        )
+        cls.lamp = Product.objects.create(name="Brass Lamp", price=Decimal('20.00'))
+        cls.desk = Product.objects.create(name="Oak Desk", price=Decimal('300.00'))
+        cls.order = Order.objects.create(customer=cls.ada, total_amount=Decimal('20.00'))
+        cls.order.products.add(cls.lamp)
+        Order.objects.create(customer=cls.grace, total_amount=Decimal('300.00')).products.add(cls.desk)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def changelist(self, model, **params):
+        response = self.client.get(f'/admin/crm/{model}/', params)
+        self.assertEqual(response.status_code, 200)
+        return [obj.pk for obj in response.context['cl'].result_list]
+
+    def test_changelist_queries(self):
+        self.changelist('order')
+        with CaptureQueriesContext(connection) as few:
+            self.changelist('order')
+        Order.objects.bulk_create([
+            Order(customer=customer, total_amount=Decimal('5.00'))
+            for customer in [self.ada, self.grace] * 20
+        ])
+        with CaptureQueriesContext(connection) as many:
+            self.assertEqual(len(self.changelist('order')), 42)
+        self.assertEqual(len(many), len(few))
+
+    def test_estimated_count(self):
+        graphene = {**settings.GRAPHENE, 'APPROXIMATE_COUNT_CAP': 1}
+        with override_settings(GRAPHENE=graphene):
+            response = self.client.get('/admin/crm/order/')
+        self.assertEqual(response.context['cl'].result_count, 1)
+        self.assertFalse(response.context['cl'].show_full_result_count)
+
+    def test_search(self):
+        self.assertEqual(self.changelist('customer', q='lovel'), [self.ada.pk])
+        self.assertEqual(self.changelist('customer', q='+44'), [self.grace.pk])
+        self.assertEqual(self.changelist('product', q='oak'), [self.desk.pk])
+        self.assertEqual(self.changelist('order', q='brass'), [self.order.pk])
+        self.assertEqual(self.changelist('order', q='grace'), [self.order.pk + 1])
+
+    def test_total_filter(self):
+        self.assertEqual(self.changelist('order', total='200-1000'), [self.order.pk + 1])
+        self.assertEqual(self.changelist('order', total='under-50'), [self.order.pk])
+
+    def test_change_form_autocomplete(self):
+        response = self.client.get(f'/admin/crm/order/{self.order.pk}/change/')
+        self.assertContains(response, 'admin-autocomplete')
+        # Only the selected product is rendered, not the product table
+        self.assertContains(response, 'Brass Lamp')
+        self.assertNotContains(response, 'Oak Desk')
+        response = self.client.get('/admin/autocomplete/', {
+            'app_label': 'crm', 'model_name': 'order',
+            'field_name': 'products', 'term': 'oak',
+        })
+        self.assertEqual(
+            [result['id'] for result in response.json()['results']],
+            [str(self.desk.pk)],
+        )
@@ -1,3 +1,472 @@
-from django.shortcuts import render
+import hmac
+import json
+from collections import namedtuple
+from inspect import isawaitable
 
-# Create your views here.
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connection, transaction
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseNotAllowed,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.http.response import HttpResponseBadRequest
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import ensure_csrf_cookie
+from django.views.decorators.http import require_GET
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.utils.utils import set_rollback
+from graphene_django.views import GraphQLView, HttpError
+from graphql import (
+    ExecutionResult,
+    GraphQLError,
+    OperationType,
+    execute,
+    get_operation_ast,
+    validate_schema,
+)
+
+from .cache import get_result, get_result_key, get_setting, set_result
+from .complexity import check_cost, validation_rules
+from .concurrency import run_in_thread
+from .documents import (
+    document_cache,
+    document_hash,
+    get_persisted_query,
+    persist_query,
+)
+from .exports import CONTENT_TYPES, EXPORTS, export_stream
+from .loaders import DeferredExecutionContext, forget_loaders
+from .metrics import (
+    PROMETHEUS_CONTENT_TYPE,
+    measure_operation,
+    render_metrics,
+    set_operation_name,
+)
+
+
+# Operations accepted in one batched request
+MAX_BATCH_SIZE = 10
+
+# Arguments of execute_document, the result cache key and the
+# extensions a prepared operation's result is returned with
+PreparedOperation = namedtuple(
+    'PreparedOperation', ['arguments', 'result_key', 'extensions']
+)
+
+
+class CRMGraphQLView(GraphQLView):
+    """GraphQL endpoint with cached documents, results and persisted queries.
+
+    Documents are parsed and validated once per process and reused from
+    document_cache; clients may send only the sha256 hash of a document
+    they registered before. Operations nested deeper than
+    GRAPHENE['MAX_QUERY_DEPTH'] or estimated to cost more than
+    GRAPHENE['MAX_QUERY_COST'] are rejected before execution. Queries over
+    the root fields listed in GRAPHENE['RESULT_CACHE_FIELDS'] are answered
+    from crm.cache.
+
+    A JSON array of up to GRAPHENE['MAX_BATCH_SIZE'] operations is
+    executed in order as one batch, answered by an array of results.
+    The operations share the request as context, and so its DataLoaders.
+    """
+    execution_context_class = DeferredExecutionContext
+    validation_rules = validation_rules
+
+    def parse_body(self, request):
+        if self.get_content_type(request) != "application/json":
+            return super().parse_body(request)
+
+        try:
+            data = json.loads(request.body.decode("utf-8"))
+        except (TypeError, ValueError):
+            raise HttpError(HttpResponseBadRequest("POST body sent invalid JSON."))
+        if isinstance(data, dict):
+            return data
+        if not isinstance(data, list) or not all(
+            isinstance(entry, dict) for entry in data
+        ):
+            raise HttpError(
+                HttpResponseBadRequest("The received data is not a valid JSON query.")
+            )
+
+        max_batch_size = get_setting('MAX_BATCH_SIZE', MAX_BATCH_SIZE)
+        if not data:
+            raise HttpError(
+                HttpResponseBadRequest("Received an empty list in the batch request.")
+            )
+        if len(data) > max_batch_size:
+            raise HttpError(
+                HttpResponseBadRequest(
+                    f"Batches may hold at most {max_batch_size} operations, "
+                    f"received {len(data)}."
+                )
+            )
+        # Views are instantiated per request, dispatch answers this one
+        # with an array
+        self.batch = True
+        return data
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        result, operation = self.prepare_operation(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+        if operation is None:
+            return result
+        return self.finish_operation(
+            operation, self.execute_document(request, *operation.arguments)
+        )
+
+    def prepare_operation(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        """Validate and price the operation before it is executed.
+
+        Returns (result, None) when the request is answered without
+        executing anything, and (None, PreparedOperation) otherwise.
+        """
+        try:
+            query, register = get_persisted_query(request, data, query)
+        except GraphQLError as e:
+            return ExecutionResult(errors=[e]), None
+
+        if not query:
+            if show_graphiql:
+                return None, None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        schema = self.schema.graphql_schema
+
+        schema_validation_errors = validate_schema(schema)
+        if schema_validation_errors:
+            return ExecutionResult(data=None, errors=schema_validation_errors), None
+
+        document, errors = document_cache.get_document(
+            schema,
+            query,
+            self.validation_rules,
+            graphene_settings.MAX_VALIDATION_ERRORS,
+        )
+        if errors:
+            return ExecutionResult(data=None, errors=errors), None
+
+        operation_ast = get_operation_ast(document, operation_name)
+        set_operation_name(request, operation_ast)
+
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            if show_graphiql:
+                return None, None
+
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    "Can only perform a {} operation from a POST request.".format(
+                        operation_ast.operation.value
+                    ),
+                )
+            )
+
+        if operation_ast is not None:
+            cost, errors = check_cost(schema, document, operation_ast, variables)
+            extensions = {'cost': cost} if cost else None
+            if errors:
+                return ExecutionResult(errors=errors, extensions=extensions), None
+            if register:
+                # Only documents that passed every check are kept
+                persist_query(query)
+        else:
+            extensions = None
+
+        result_key = get_result_key(
+            schema, document, operation_ast, document_hash(query), variables
+        )
+        if result_key:
+            data = get_result(result_key)
+            if data is not None:
+                return ExecutionResult(data=data, extensions=extensions), None
+
+        return None, PreparedOperation(
+            (schema, document, operation_ast, variables, operation_name),
+            result_key,
+            extensions,
+        )
+
+    def finish_operation(self, operation, result):
+        """Cache the result of a prepared operation and add its extensions"""
+        if operation.result_key and not result.errors:
+            set_result(operation.result_key, result.data)
+        if operation.extensions:
+            result.extensions = {**operation.extensions, **(result.extensions or {})}
+        return result
+
+    def get_response(self, request, data, show_graphiql=False):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        with measure_operation(request) as metrics:
+            execution_result = self.execute_graphql_request(
+                request, data, query, variables, operation_name, show_graphiql
+            )
+        return self.build_response(
+            request, execution_result, metrics, id, show_graphiql
+        )
+
+    def build_response(
+        self, request, execution_result, metrics, id, show_graphiql=False
+    ):
+        """Serialize an execution result, returning (body, status code)"""
+        if execution_result and metrics is not None and metrics.debug:
+            execution_result.extensions = {
+                **(execution_result.extensions or {}),
+                'timing': metrics.summary(),
+            }
+
+        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+            set_rollback()
+
+        status_code = 200
+        if execution_result:
+            response = {}
+
+            if execution_result.errors:
+                set_rollback()
+                response["errors"] = [
+                    self.format_error(e) for e in execution_result.errors
+                ]
+
+            if execution_result.errors and any(
+                not getattr(e, "path", None) for e in execution_result.errors
+            ):
+                status_code = 400
+            else:
+                response["data"] = execution_result.data
+
+            if execution_result.extensions:
+                response["extensions"] = execution_result.extensions
+
+            if self.batch:
+                response["id"] = id
+                response["status"] = status_code
+
+            result = self.json_encode(request, response, pretty=show_graphiql)
+        else:
+            result = None
+
+        return result, status_code
+
+    def execute_document(
+        self, request, schema, document, operation_ast, variables, operation_name
+    ):
+        try:
+            execute_options = {
+                "root_value": self.get_root_value(request),
+                "context_value": self.get_context(request),
+                "variable_values": variables,
+                "operation_name": operation_name,
+                "middleware": self.get_middleware(request),
+                "execution_context_class": self.execution_context_class,
+            }
+
+            if (
+                operation_ast is None
+                or operation_ast.operation != OperationType.MUTATION
+            ):
+                return execute(schema, document, **execute_options)
+
+            # Operations before and after it in a batch must not share
+            # rows the mutation may change
+            forget_loaders(execute_options["context_value"])
+            try:
+                if (
+                    graphene_settings.ATOMIC_MUTATIONS is True
+                    or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+                ):
+                    with transaction.atomic():
+                        result = execute(schema, document, **execute_options)
+                        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                            transaction.set_rollback(True)
+                    return result
+
+                return execute(schema, document, **execute_options)
+            finally:
+                forget_loaders(execute_options["context_value"])
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+
+class AsyncCRMGraphQLView(CRMGraphQLView):
+    """CRMGraphQLView executing queries on the event loop of an ASGI server.
+
+    The ORM work of resolvers runs in the bounded thread pool of
+    crm.concurrency: root fields of a query are fetched concurrently, and
+    so are the DataLoader batches below them, e.g. the customers and the
+    products of a page of orders. Resolvers may also be coroutines.
+    Mutations run as in CRMGraphQLView, on one pool thread, keeping
+    their order and their transaction.
+    """
+    view_is_async = True
+
+    @method_decorator(ensure_csrf_cookie)
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            if request.method.lower() not in ("get", "post"):
+                raise HttpError(
+                    HttpResponseNotAllowed(
+                        ["GET", "POST"], "GraphQL only supports GET and POST requests."
+                    )
+                )
+
+            data = self.parse_body(request)
+            if self.graphiql and self.can_display_graphiql(request, data):
+                # Rendering GraphiQL executes nothing
+                return super().dispatch(request, *args, **kwargs)
+
+            if self.batch:
+                responses = [
+                    await self.get_response_async(request, entry) for entry in data
+                ]
+                result = "[{}]".format(
+                    ",".join([response[0] for response in responses])
+                )
+                status_code = (
+                    responses
+                    and max(responses, key=lambda response: response[1])[1]
+                    or 200
+                )
+            else:
+                result, status_code = await self.get_response_async(request, data)
+
+            return HttpResponse(
+                status=status_code, content=result, content_type="application/json"
+            )
+
+        except HttpError as e:
+            response = e.response
+            response["Content-Type"] = "application/json"
+            response.content = self.json_encode(
+                request, {"errors": [self.format_error(e)]}
+            )
+            return response
+
+    async def get_response_async(self, request, data, show_graphiql=False):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        with measure_operation(request) as metrics:
+            result, operation = self.prepare_operation(
+                request, data, query, variables, operation_name, show_graphiql
+            )
+            if operation is not None:
+                result = self.finish_operation(
+                    operation,
+                    await self.execute_document_async(request, *operation.arguments),
+                )
+        return self.build_response(request, result, metrics, id, show_graphiql)
+
+    async def execute_document_async(
+        self, request, schema, document, operation_ast, variables, operation_name
+    ):
+        context = self.get_context(request)
+        if operation_ast is None or operation_ast.operation != OperationType.QUERY:
+            context.async_execution = False
+            return await run_in_thread(
+                context,
+                self.execute_document,
+                request,
+                schema,
+                document,
+                operation_ast,
+                variables,
+                operation_name,
+            )
+
+        # Makes in_thread() and get_loaders() hand out awaitables
+        context.async_execution = True
+        try:
+            result = execute(
+                schema,
+                document,
+                root_value=self.get_root_value(request),
+                context_value=context,
+                variable_values=variables,
+                operation_name=operation_name,
+                middleware=self.get_middleware(request),
+            )
+            if isawaitable(result):
+                result = await result
+            return result
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+
+@staff_member_required
+def document_cache_info(request):
+    """Expose document cache hit/miss counters for sizing the cache"""
+    return JsonResponse(document_cache.cache_info())
+
+
+def is_metrics_scraper(request):
+    """True for requests bearing GRAPHENE['METRICS_TOKEN'], when it is set"""
+    token = get_setting('METRICS_TOKEN', None)
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    return bool(token) and scheme.lower() == 'bearer' and hmac.compare_digest(
+        credentials.strip().encode(), token.encode()
+    )
+
+
+@require_GET
+def prometheus_metrics(request):
+    """Expose the GraphQL operation and resolver histograms to Prometheus.
+
+    Scrapers authenticate with GRAPHENE['METRICS_TOKEN'] as a bearer
+    token; staff sessions may read the endpoint too.
+    """
+    user = request.user
+    if not (is_metrics_scraper(request) or (user.is_active and user.is_staff)):
+        response = HttpResponse('Unauthorized', status=401, content_type='text/plain')
+        response['WWW-Authenticate'] = 'Bearer'
+        return response
+    return HttpResponse(render_metrics(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@staff_member_required
+@require_GET
+def export(request, resource):
+    """Stream every customer, product or order matching the filters.
+
+    Takes the same filter parameters as the GraphQL connections, e.g.
+    /export/orders?order_date__gte=2025-01-01&format=csv. Rows are read
+    in chunks and written as they arrive, as NDJSON (default) or CSV.
+    """
+    if resource not in EXPORTS:
+        raise Http404(f"Unknown export '{resource}'.")
+    filterset_class, columns = EXPORTS[resource]
+
+    data = request.GET.copy()
+    format = data.pop('format', ['ndjson'])[-1]
+    if format not in CONTENT_TYPES:
+        return JsonResponse(
+            {'errors': [f"Unsupported format '{format}'."]}, status=400
+        )
+
+    filterset = filterset_class(
+        data, queryset=filterset_class._meta.model.objects.all()
+    )
+    if not filterset.is_valid():
+        return JsonResponse({'errors': filterset.errors}, status=400)
+
+    response = StreamingHttpResponse(
+        export_stream(filterset.qs, columns, format),
+        content_type=CONTENT_TYPES[format],
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{resource}.{format}"'
+    )
+    return response
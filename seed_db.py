@@ -2,8 +2,14 @@
 Script to seed the database with sample data for testing GraphQL mutations and queries.
 Run this script after migrations: python manage.py shell < seed_db.py
 Or use: python manage.py runscript seed_db (if django-extensions is installed)
+
+For load and index testing, generate a large reproducible dataset instead:
+    python seed_db.py --orders 1000000 --seed 42
 """
+import argparse
 import os
+import time
+
 import django
 
 # Setup Django environment
@@ -11,6 +17,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql_crm.setting
 django.setup()
 
 from crm.models import Customer, Product, Order
+from crm.seeding import clear_dataset, seed_dataset
 from decimal import Decimal
 
 
@@ -101,6 +108,46 @@ def seed_database():
     print(f"Created {Order.objects.count()} orders")
 
 
+def seed_large_database(orders, customers=None, products=None, seed=0):
+    """Replace the data with a generated dataset of the given size"""
+    print("Starting database seeding...")
+    start = time.perf_counter()
+
+    clear_dataset()
+    print("Cleared existing data")
+
+    customers, products, orders = seed_dataset(
+        orders, customers=customers, products=products, seed=seed
+    )
+
+    print(f"\nDatabase seeding completed in {time.perf_counter() - start:.1f}s!")
+    print(f"Created {customers} customers")
+    print(f"Created {products} products")
+    print(f"Created {orders} orders")
+
+
 if __name__ == "__main__":
-    seed_database()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        '--orders', type=int,
+        help='Generate this many orders instead of the sample data',
+    )
+    parser.add_argument(
+        '--customers', type=int,
+        help='Customers to generate (default: one per 10 orders)',
+    )
+    parser.add_argument(
+        '--products', type=int,
+        help='Products to generate (default: one per 200 orders)',
+    )
+    parser.add_argument(
+        '--seed', type=int, default=0,
+        help='Random seed, the same seed gives the same dataset',
+    )
+    args = parser.parse_args()
+
+    if args.orders is None:
+        seed_database()
+    else:
+        seed_large_database(args.orders, args.customers, args.products, args.seed)
 